@@ -0,0 +1,38 @@
+from functools import wraps
+from hashlib import sha1
+
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def revision_etag(method):
+    """
+    Make a view method conditional on the revision of the requesting
+    user, answering with 304 Not Modified if the client provides the
+    ETag of the current revision in If-None-Match.
+
+    The ETag covers the full path and the accepted media types, so it
+    is only valid for views whose responses do not change without a
+    change of the revision.
+    """
+    @wraps(method)
+    def conditional_method(self, request, *args, **kwargs):
+        etag = '"{}"'.format(sha1('{}:{}:{}:{}'.format(
+            request.user.pk,
+            request.user.revision,
+            request.get_full_path(),
+            request.META.get('HTTP_ACCEPT', ''),
+        ).encode()).hexdigest())
+
+        if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = method(self, request, *args, **kwargs)
+
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+        return response
+
+    return conditional_method
@@ -0,0 +1,341 @@
+"""
+Counters and histograms exposed in the Prometheus text format.
+
+Every process keeps its values in memory. If METRICS_DIR is set, each
+process writes them to a file of its own in that directory (at most
+every METRICS_FLUSH_INTERVAL seconds and on exit), and the values of
+all files are summed for the exposition. This way, the metrics of all
+workers of a multi-process WSGI server are exposed by each of them
+without any locking between the processes.
+
+The files of processes which have exited (e.g. of recycled workers or
+of management commands) are merged into a single archive file by the
+exposition, so their counts are kept without accumulating files. As
+processes are identified by their pid, METRICS_DIR must not be shared
+between hosts or containers.
+"""
+import atexit
+import fcntl
+import json
+import os
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from glob import glob
+from tempfile import NamedTemporaryFile
+from time import monotonic, perf_counter
+from typing import Dict, Iterator, List, Optional, Sequence
+
+from django.conf import settings
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# the file with the summed values of all processes which have exited
+ARCHIVE_NAME = 'metrics-archive.json'
+
+_lock = threading.RLock()
+_metrics = {}  # type: Dict[str, Metric]
+_pid = os.getpid()
+_last_flush = monotonic()
+
+
+class Metric:
+    type = None  # type: str
+
+    def __init__(self, name: str, documentation: str):
+        assert name not in _metrics, 'metric {} is defined twice'.format(name)
+        self.name = name
+        self.documentation = documentation
+        _metrics[name] = self
+        self.reset()
+
+    def reset(self):
+        raise NotImplementedError
+
+    def state(self) -> dict:
+        """
+        Get the values of this process, which can be summed with the
+        values of other processes.
+        """
+        raise NotImplementedError
+
+    def merge(self, states: List[dict]) -> dict:
+        """
+        Sum the states of several processes.
+        """
+        raise NotImplementedError
+
+    def expose(self, states: List[dict]) -> Iterator[str]:
+        """
+        Generate the lines of the exposition of the summed states.
+        """
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """
+    A value which only increases.
+    """
+    type = 'counter'
+
+    def reset(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        assert amount >= 0
+        with _lock:
+            _check_fork()
+            self.value += amount
+        _flush_if_due()
+
+    def state(self) -> dict:
+        return {
+            'value': self.value,
+        }
+
+    def merge(self, states: List[dict]) -> dict:
+        return {
+            'value': sum(state['value'] for state in states),
+        }
+
+    def expose(self, states: List[dict]) -> Iterator[str]:
+        yield '{}_total {}'.format(self.name, _format(self.merge(states)['value']))
+
+
+class Histogram(Metric):
+    """
+    The distribution of observed values in buckets of upper bounds.
+    """
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = DURATION_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation)
+
+    def reset(self):
+        # the last count is the one of the implicit +Inf bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        with _lock:
+            _check_fork()
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.sum += value
+        _flush_if_due()
+
+    @contextmanager
+    def time(self):
+        """
+        Observe the duration of a block in seconds.
+        """
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start)
+
+    def state(self) -> dict:
+        return {
+            'counts': list(self.counts),
+            'sum': self.sum,
+        }
+
+    def merge(self, states: List[dict]) -> dict:
+        # ignore the states of other bucket definitions
+        states = [state for state in states if len(state['counts']) == len(self.counts)]
+        return {
+            'counts': [sum(counts) for counts in zip(*(state['counts'] for state in states))]
+            if states else [0] * len(self.counts),
+            'sum': sum(state['sum'] for state in states),
+        }
+
+    def expose(self, states: List[dict]) -> Iterator[str]:
+        merged = self.merge(states)
+        cumulative = 0
+        for index, bound in enumerate(self.buckets + (float('inf'),)):
+            cumulative += merged['counts'][index]
+            yield '{}_bucket{{le="{}"}} {}'.format(
+                self.name, '+Inf' if index == len(self.buckets) else _format(bound), cumulative)
+        yield '{}_sum {}'.format(self.name, _format(merged['sum']))
+        yield '{}_count {}'.format(self.name, cumulative)
+
+
+def exposition() -> str:
+    """
+    Get the metrics of all processes in the Prometheus text format.
+    """
+    states = {
+        name: []
+        for name in _metrics
+    }  # type: Dict[str, List[dict]]
+    with _lock:
+        _check_fork()
+        for name, metric in _metrics.items():
+            states[name].append(metric.state())
+
+    metrics_dir = getattr(settings, 'METRICS_DIR', None)
+    if metrics_dir:
+        flush()
+        own_path = _path(metrics_dir)
+        with _directory_lock(metrics_dir):
+            _archive_exited(metrics_dir)
+            for path in glob(os.path.join(metrics_dir, 'metrics-*.json')):
+                if path == own_path:
+                    continue
+                process_states = _load(path)
+                if process_states is None:
+                    continue
+                for name, state in process_states.items():
+                    if name in states:
+                        states[name].append(state)
+
+    lines = []
+    for name, metric in sorted(_metrics.items()):
+        lines.append('# HELP {} {}'.format(name, metric.documentation))
+        lines.append('# TYPE {} {}'.format(name, metric.type))
+        lines.extend(metric.expose(states[name]))
+    return '\n'.join(lines) + '\n'
+
+
+def flush():
+    """
+    Write the values of this process to its file in METRICS_DIR.
+    The file is replaced atomically, so readers never see partial
+    writes.
+    """
+    global _last_flush
+
+    metrics_dir = getattr(settings, 'METRICS_DIR', None) if settings.configured else None
+    if not metrics_dir:
+        return
+
+    with _lock:
+        _check_fork()
+        states = {
+            name: metric.state()
+            for name, metric in _metrics.items()
+        }
+        _last_flush = monotonic()
+        _write(_path(metrics_dir), states)
+
+
+def reset():
+    """
+    Reset the values of this process.
+    """
+    with _lock:
+        for metric in _metrics.values():
+            metric.reset()
+
+
+def _flush_if_due():
+    if monotonic() - _last_flush >= getattr(settings, 'METRICS_FLUSH_INTERVAL', 1):
+        flush()
+
+
+def _check_fork():
+    """
+    Reset the values inherited from the parent process in forked
+    workers, which are still counted in the file of the parent.
+    """
+    global _pid
+
+    if os.getpid() != _pid:
+        _pid = os.getpid()
+        reset()
+
+
+@contextmanager
+def _directory_lock(metrics_dir: str):
+    """
+    Serialize the expositions of all processes, so no file of an
+    exited process is merged twice or read along with the archive it
+    has been merged into.
+    """
+    with open(os.path.join(metrics_dir, 'metrics.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def _archive_exited(metrics_dir: str):
+    """
+    Merge the files of processes which have exited into the archive
+    file and remove them.
+    """
+    exited = [
+        path
+        for path in glob(os.path.join(metrics_dir, 'metrics-*.json'))
+        if not _is_running(_pid_of(path))
+    ]
+    if not exited:
+        return
+
+    archive_path = os.path.join(metrics_dir, ARCHIVE_NAME)
+    archived = _load(archive_path) or {}
+    states = {
+        name: [archived[name]] if name in archived else []
+        for name in _metrics
+    }  # type: Dict[str, List[dict]]
+    for path in exited:
+        for name, state in (_load(path) or {}).items():
+            if name in states:
+                states[name].append(state)
+    _write(archive_path, {
+        name: _metrics[name].merge(name_states)
+        for name, name_states in states.items()
+    })
+    for path in exited:
+        os.remove(path)
+
+
+def _pid_of(path: str) -> Optional[int]:
+    """
+    Get the pid of the process of a file, or None for the archive.
+    """
+    name = os.path.basename(path)[len('metrics-'):-len('.json')]
+    return int(name) if name.isdigit() else None
+
+
+def _is_running(pid: Optional[int]) -> bool:
+    if pid is None:
+        # the archive
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # a process of another user
+        return True
+    return True
+
+
+def _load(path: str) -> Optional[dict]:
+    try:
+        with open(path) as metrics_file:
+            return json.load(metrics_file)
+    except (OSError, ValueError):
+        # the file of a process which is being written for the first time
+        return None
+
+
+def _write(path: str, states: dict):
+    """
+    Replace a file atomically, so readers never see partial writes.
+    """
+    with NamedTemporaryFile('w', dir=os.path.dirname(path), suffix='.tmp', delete=False) as metrics_file:
+        json.dump(states, metrics_file)
+    os.replace(metrics_file.name, path)
+
+
+def _path(metrics_dir: str) -> str:
+    return os.path.join(metrics_dir, 'metrics-{}.json'.format(os.getpid()))
+
+
+def _format(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+atexit.register(flush)
@@ -0,0 +1,170 @@
+import logging
+from contextlib import ExitStack, contextmanager
+from time import perf_counter
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger('todoscheduler.timing')
+
+
+class RequestTimingMiddleware:
+    """
+    Measure the database queries and the time spent in the view and in
+    the rendering of the response of every request.
+
+    The measurements are added to the response as Server-Timing header
+    and logged to the todoscheduler.timing logger with the view name
+    and action (e.g. TaskChunkViewSet.split) as key. DRF views
+    serialize their data within the view, so the time of serializers
+    is part of the view time. Views with the SerializationTimingMixin
+    (see base.views) report it as serialize time of its own, including
+    the queries of querysets which are evaluated by the serializers.
+
+    The middleware is only used if REQUEST_TIMING is enabled.
+    """
+
+    def __init__(self, get_response: Callable):
+        if not getattr(settings, 'REQUEST_TIMING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timing = RequestTiming()
+        request.timing = timing
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timing.execute))
+            response = self.get_response(request)
+        timing.finish()
+
+        response['Server-Timing'] = timing.server_timing()
+        logger.info(
+            'view=%s method=%s status=%d queries=%d db_ms=%.1f view_ms=%.1f serialize_ms=%.1f '
+            'render_ms=%.1f total_ms=%.1f',
+            timing.view_name, request.method, response.status_code, timing.queries,
+            timing.db_time * 1000, timing.view_time * 1000, timing.serialize_time * 1000,
+            timing.render_time * 1000, timing.total_time * 1000,
+            extra={
+                'timing': dict(
+                    timing.as_dict(),
+                    method=request.method,
+                    path=request.path,
+                    status=response.status_code),
+            })
+        return response
+
+    def process_view(self, request, view_func: Callable, view_args, view_kwargs):
+        request.timing.start_view(view_name(request, view_func))
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after this, so the view is done
+        request.timing.finish_view()
+        return response
+
+
+class RequestTiming:
+    """
+    The measurements of a single request.
+    """
+
+    def __init__(self):
+        self.start = perf_counter()
+        self.view_name = None  # type: Optional[str]
+        self.view_start = None  # type: Optional[float]
+        self.view_end = None  # type: Optional[float]
+        self.end = None  # type: Optional[float]
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+
+    def execute(self, execute: Callable, sql, params, many, context):
+        """
+        Execute a query, measuring its time (see execute_wrapper).
+        """
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += perf_counter() - start
+            self.queries += 1
+
+    @contextmanager
+    def serialization(self):
+        """
+        Measure a block which serializes data as serialize time.
+        """
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.serialize_time += perf_counter() - start
+
+    def start_view(self, name: str):
+        self.view_name = name
+        self.view_start = perf_counter()
+
+    def finish_view(self):
+        self.view_end = perf_counter()
+
+    def finish(self):
+        self.end = perf_counter()
+        if self.view_start is not None and self.view_end is None:
+            # responses which are not rendered afterwards
+            self.view_end = self.end
+
+    @property
+    def view_time(self) -> float:
+        if self.view_start is None:
+            return 0.0
+        return self.view_end - self.view_start
+
+    @property
+    def render_time(self) -> float:
+        if self.view_end is None:
+            return 0.0
+        return self.end - self.view_end
+
+    @property
+    def total_time(self) -> float:
+        return self.end - self.start
+
+    def as_dict(self) -> dict:
+        return {
+            'view': self.view_name,
+            'queries': self.queries,
+            'db_ms': round(self.db_time * 1000, 1),
+            'view_ms': round(self.view_time * 1000, 1),
+            'serialize_ms': round(self.serialize_time * 1000, 1),
+            'render_ms': round(self.render_time * 1000, 1),
+            'total_ms': round(self.total_time * 1000, 1),
+        }
+
+    def server_timing(self) -> str:
+        return ', '.join((
+            'db;dur={:.1f};desc="{} queries"'.format(self.db_time * 1000, self.queries),
+            'view;dur={:.1f}'.format(self.view_time * 1000),
+            'serialize;dur={:.1f}'.format(self.serialize_time * 1000),
+            'render;dur={:.1f}'.format(self.render_time * 1000),
+            'total;dur={:.1f}'.format(self.total_time * 1000),
+        ))
+
+
+def view_name(request, view_func: Callable) -> str:
+    """
+    Get the name of a view, including the action of DRF viewsets and
+    the method of other DRF views.
+    """
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return getattr(view_func, '__name__', type(view_func).__name__)
+
+    actions = getattr(view_func, 'actions', None)
+    if actions:
+        action = actions.get(request.method.lower(), request.method.lower())
+    else:
+        action = request.method.lower()
+    return '{}.{}'.format(cls.__name__, action)
@@ -0,0 +1,18 @@
+# Generated by Django 2.1.12 on 2026-10-17 02:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0006_auto_20180904_1821'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='revision',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
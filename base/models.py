@@ -1,9 +1,18 @@
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
 from datetime import date
 from decimal import Decimal
+from typing import DefaultDict, Dict, Iterable, List, Tuple
 
 from django.contrib.auth.models import AbstractUser
+from django.conf import settings
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q
+
+# the changes collected by Change.collect in the current thread
+_collected = threading.local()
 
 
 class User(AbstractUser):
@@ -29,6 +38,10 @@ class User(AbstractUser):
             MinValueValidator(0),
             MaxValueValidator(24)))
 
+    # increased with every change of the tasks, chunks, series and
+    # labels of the user
+    revision = models.BigIntegerField(default=0)
+
     def capacity_of_day(self, day: date) -> Decimal:
         if day.weekday() < 5:
             return self.workhours_weekday
@@ -37,3 +50,143 @@ class User(AbstractUser):
 
     def __str__(self) -> str:
         return self.username
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and 'update_fields' not in kwargs:
+            # the revision is only changed by bump_revision, prevent
+            # from resetting it to the value this instance was fetched with
+            kwargs['update_fields'] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'revision'
+            ]
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def bump_revision(user_id: int) -> int:
+        """
+        Increase the revision of a user after a change of their objects.
+        Returns the new revision.
+        """
+        User.objects.filter(pk=user_id).update(revision=F('revision') + 1)
+        return User.objects.filter(pk=user_id).values_list('revision', flat=True).get()
+
+    @staticmethod
+    def lock(user_id: int):
+        """
+        Lock the row of a user until the end of the transaction, which
+        serializes concurrent writes of aggregates of the user.
+        """
+        list(User.objects.select_for_update().filter(pk=user_id).values_list('pk', flat=True))
+
+
+class Change(models.Model):
+    """
+    The latest change of an object of a user, which allows clients to
+    fetch only the objects changed since the revision they know.
+    """
+    KINDS = (
+        'label',
+        'task',
+        'series',
+        'chunk',
+    )
+
+    class Meta:
+        indexes = (
+            models.Index(fields=('user', 'revision')),
+            models.Index(fields=('user', 'kind', 'object_id')),
+        )
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+        related_name='changes')
+    revision = models.BigIntegerField()
+    kind = models.CharField(
+        max_length=6, choices=tuple((kind, kind) for kind in KINDS))
+    object_id = models.IntegerField()
+    deleted = models.BooleanField(default=False)
+
+    def __str__(self) -> str:
+        return '{}: {} {}'.format(self.user, self.kind, self.object_id)
+
+    @staticmethod
+    @transaction.atomic(savepoint=False)
+    def record(user_id: int, deleted: bool = False, **object_ids: Iterable[int]):
+        """
+        Record that objects of a user have been changed (or deleted)
+        with a new revision of the user. The ids of the objects are
+        passed by their kind, e.g. record(user_id, task=(1,), chunk=(2, 3)).
+
+        Only the latest change of each object is kept. The revision and
+        its changes are written in a single transaction, which should
+        include the write of the objects as well, so no reader sees a
+        revision before all of its changes.
+
+        Within Change.collect, the changes are only written at the end
+        of the outermost block.
+        """
+        changes = {
+            (kind, object_id): deleted
+            for kind, ids in object_ids.items()
+            for object_id in ids
+            if object_id is not None
+        }
+        if not changes:
+            return
+        assert set(object_ids) <= set(Change.KINDS)
+
+        collected = getattr(_collected, 'changes', None)
+        if collected is not None:
+            collected[user_id].update(changes)
+        else:
+            Change._write(user_id, changes)
+
+    @staticmethod
+    @contextmanager
+    def collect():
+        """
+        Collect the changes recorded within an atomic block and write
+        them with a single revision of each user at the end of the
+        outermost block, so an operation which changes several objects
+        records them at once.
+        """
+        if getattr(_collected, 'changes', None) is not None:
+            # part of the outer block, which is rolled back as a whole
+            with transaction.atomic(savepoint=False):
+                yield
+            return
+
+        _collected.changes = defaultdict(dict)  # type: DefaultDict[int, Dict[Tuple[str, int], bool]]
+        try:
+            with transaction.atomic():
+                yield
+                collected = _collected.changes
+                _collected.changes = None
+                for user_id, changes in collected.items():
+                    Change._write(user_id, changes)
+        finally:
+            _collected.changes = None
+
+    @staticmethod
+    def _write(user_id: int, changes: Dict[Tuple[str, int], bool]):
+        """
+        Write the changes of a user, mapping each kind and object id to
+        whether the object was deleted, with a new revision.
+        """
+        revision = User.bump_revision(user_id)
+        object_ids = defaultdict(list)  # type: DefaultDict[str, List[int]]
+        for kind, object_id in changes:
+            object_ids[kind].append(object_id)
+        previous = Q()
+        for kind, ids in object_ids.items():
+            previous |= Q(kind=kind, object_id__in=ids)
+        Change.objects.filter(previous, user_id=user_id).delete()
+        Change.objects.bulk_create(
+            Change(
+                user_id=user_id,
+                revision=revision,
+                kind=kind,
+                object_id=object_id,
+                deleted=deleted)
+            for (kind, object_id), deleted in changes.items())
@@ -1,18 +1,32 @@
+import json
+import os
+import subprocess
 from base64 import urlsafe_b64encode
 from datetime import date
 from decimal import Decimal
+from tempfile import mkdtemp
 
 from django.contrib.auth import get_user_model, authenticate
-from django.test import TestCase
+from django.core.cache import caches
+from django.http import HttpRequest
+from django.test import TestCase, override_settings
 from rest_authtoken.models import AuthToken
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from .models import User
+from . import metrics
+from .middleware import RequestTiming
+from .models import Change, User
+from .serializers import UserSerializer
+from .views import UserView
 
 
 class AuthenticatedApiTest(TestCase):
     def setUp(self):
+        # cached responses are keyed by ids which are reused across tests
+        for cache in caches.all():
+            cache.clear()
+
         self.user = get_user_model().objects.create(
             username='johndoe',
             workhours_weekday=Decimal(10),
@@ -69,6 +83,91 @@ class UserTest(TestCase):
             user.capacity_of_day(sunday),
             Decimal(4))
 
+    def test_revision(self):
+        user = User.objects.create(
+            username='johndoe')
+        stale_user = User.objects.get(pk=user.pk)
+
+        User.bump_revision(user.pk)
+        User.bump_revision(user.pk)
+        user.refresh_from_db()
+        self.assertEqual(
+            user.revision,
+            2)
+
+        # saving an instance with an older revision keeps the revision
+        stale_user.workhours_weekday = Decimal(6)
+        stale_user.save()
+        user.refresh_from_db()
+        self.assertEqual(
+            user.revision,
+            2)
+        self.assertEqual(
+            user.workhours_weekday,
+            Decimal(6))
+
+
+class ChangeTest(TestCase):
+    def test_record(self):
+        user = User.objects.create(
+            username='johndoe')
+
+        Change.record(user.pk, task=(1, 2), chunk=(3,))
+        Change.record(user.pk, deleted=True, chunk=(3, 4))
+        # nothing to record
+        Change.record(user.pk, task=(), chunk=(None,))
+
+        user.refresh_from_db()
+        self.assertEqual(
+            user.revision,
+            2)
+        self.assertEqual(
+            set(user.changes.values_list('revision', 'kind', 'object_id', 'deleted')),
+            {
+                (1, 'task', 1, False),
+                (1, 'task', 2, False),
+                (2, 'chunk', 3, True),
+                (2, 'chunk', 4, True),
+            })
+
+    def test_collect(self):
+        user = User.objects.create(
+            username='johndoe')
+
+        with Change.collect():
+            Change.record(user.pk, task=(1, 2), chunk=(3,))
+            with Change.collect():
+                Change.record(user.pk, deleted=True, chunk=(3, 4))
+            user.refresh_from_db()
+            self.assertEqual(
+                user.revision,
+                0)
+
+        user.refresh_from_db()
+        self.assertEqual(
+            user.revision,
+            1)
+        self.assertEqual(
+            set(user.changes.values_list('revision', 'kind', 'object_id', 'deleted')),
+            {
+                (1, 'task', 1, False),
+                (1, 'task', 2, False),
+                (1, 'chunk', 3, True),
+                (1, 'chunk', 4, True),
+            })
+
+        # nothing is recorded if the block fails
+        with self.assertRaises(ValueError):
+            with Change.collect():
+                Change.record(user.pk, task=(5,))
+                raise ValueError
+        user.refresh_from_db()
+        self.assertEqual(
+            user.revision,
+            1)
+        self.assertFalse(
+            user.changes.filter(object_id=5).exists())
+
 
 class UserViewTest(AuthenticatedApiTest):
     def test_retrieve_user(self):
@@ -221,3 +320,180 @@ class UserViewTest(AuthenticatedApiTest):
         self.assertEqual(
             authenticate(username=self.user.username, password='changedpassword'),
             self.user)
+
+
+class RequestTimingMiddlewareTest(AuthenticatedApiTest):
+    @override_settings(REQUEST_TIMING=True)
+    def test_timing(self):
+        with self.assertLogs('todoscheduler.timing', 'INFO') as logs:
+            resp = self.client.get('/base/user/')
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_200_OK)
+
+        self.assertRegex(
+            resp['Server-Timing'],
+            r'^db;dur=[0-9.]+;desc="2 queries", view;dur=[0-9.]+, '
+            r'serialize;dur=[0-9.]+, render;dur=[0-9.]+, total;dur=[0-9.]+$')
+        self.assertEqual(
+            len(logs.records),
+            1)
+        timing = logs.records[0].timing
+        self.assertEqual(
+            (timing['view'], timing['method'], timing['status'], timing['queries']),
+            ('UserView.get', 'GET', 200, 2))
+        self.assertGreaterEqual(
+            timing['total_ms'],
+            timing['view_ms'])
+        self.assertGreaterEqual(
+            timing['view_ms'],
+            timing['serialize_ms'])
+
+    def test_serialization(self):
+        request = HttpRequest()
+        request.timing = RequestTiming()
+        view = UserView()
+        view.request = request
+
+        data = view.timed(UserSerializer(self.user)).data
+        self.assertEqual(
+            data['username'],
+            self.user.username)
+        self.assertGreater(
+            request.timing.serialize_time,
+            0)
+
+    @override_settings(REQUEST_TIMING=True)
+    def test_viewset_action(self):
+        with self.assertLogs('todoscheduler.timing', 'INFO') as logs:
+            self.client.patch('/label/label/0/', {})
+            self.client.get('/label/label/')
+        self.assertEqual(
+            [record.timing['view'] for record in logs.records],
+            ['LabelViewSet.partial_update', 'LabelViewSet.list'])
+
+    def test_disabled(self):
+        resp = self.client.get('/base/user/')
+        self.assertNotIn(
+            'Server-Timing',
+            resp)
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        metrics.reset()
+
+    def test_histogram(self):
+        histogram = metrics._metrics['todoscheduler_series_scheduled_chunks']
+        for value in (0, 3, 3, 2000):
+            histogram.observe(value)
+
+        lines = metrics.exposition().splitlines()
+        self.assertIn(
+            '# TYPE todoscheduler_series_scheduled_chunks histogram',
+            lines)
+        for line in (
+                'todoscheduler_series_scheduled_chunks_bucket{le="0"} 1',
+                'todoscheduler_series_scheduled_chunks_bucket{le="2"} 1',
+                'todoscheduler_series_scheduled_chunks_bucket{le="5"} 3',
+                'todoscheduler_series_scheduled_chunks_bucket{le="1000"} 3',
+                'todoscheduler_series_scheduled_chunks_bucket{le="+Inf"} 4',
+                'todoscheduler_series_scheduled_chunks_sum 2006',
+                'todoscheduler_series_scheduled_chunks_count 4',
+                'todoscheduler_schedule_series_processed_total 0'):
+            self.assertIn(line, lines)
+
+    def test_processes(self):
+        """
+        Test that the metrics of all processes in METRICS_DIR are summed.
+        """
+        metrics_dir = mkdtemp()
+        with open(os.path.join(metrics_dir, 'metrics-1.json'), 'w') as metrics_file:
+            json.dump({
+                'todoscheduler_schedule_series_processed': {
+                    'value': 5,
+                },
+            }, metrics_file)
+
+        with self.settings(METRICS_DIR=metrics_dir):
+            metrics._metrics['todoscheduler_schedule_series_processed'].inc(2)
+            self.assertIn(
+                'todoscheduler_schedule_series_processed_total 7',
+                metrics.exposition().splitlines())
+            # the values of this process are stored for the other processes
+            with open(os.path.join(metrics_dir, 'metrics-{}.json'.format(os.getpid()))) as metrics_file:
+                self.assertEqual(
+                    json.load(metrics_file)['todoscheduler_schedule_series_processed'],
+                    {'value': 2})
+
+    def test_exited_processes(self):
+        """
+        Test that the files of exited processes are merged into the
+        archive, keeping their values.
+        """
+        metrics_dir = mkdtemp()
+        process = subprocess.Popen(('true',))
+        process.wait()
+        for name in ('metrics-archive.json', 'metrics-{}.json'.format(process.pid)):
+            with open(os.path.join(metrics_dir, name), 'w') as metrics_file:
+                json.dump({
+                    'todoscheduler_schedule_series_processed': {
+                        'value': 3,
+                    },
+                    'todoscheduler_series_scheduled_chunks': {
+                        'counts': [0, 1] + [0] * 10,
+                        'sum': 1,
+                    },
+                }, metrics_file)
+
+        with self.settings(METRICS_DIR=metrics_dir):
+            for _ in range(2):
+                lines = metrics.exposition().splitlines()
+                self.assertIn('todoscheduler_schedule_series_processed_total 6', lines)
+                self.assertIn('todoscheduler_series_scheduled_chunks_bucket{le="1"} 2', lines)
+                self.assertIn('todoscheduler_series_scheduled_chunks_sum 2', lines)
+        self.assertSetEqual(
+            {name for name in os.listdir(metrics_dir) if name.endswith('.json')},
+            {'metrics-archive.json', 'metrics-{}.json'.format(os.getpid())})
+
+    def test_view(self):
+        client = APIClient()
+        resp = client.get('/base/metrics/')
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_403_FORBIDDEN)
+
+        with self.settings(METRICS_TOKEN='secret'):
+            resp = client.get('/base/metrics/', HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(
+                resp.status_code,
+                status.HTTP_200_OK)
+            self.assertEqual(
+                resp['Content-Type'],
+                'text/plain; version=0.0.4; charset=utf-8')
+            self.assertIn(
+                b'# TYPE todoscheduler_series_schedule_seconds histogram',
+                resp.content)
+
+            resp = client.get('/base/metrics/', HTTP_AUTHORIZATION='Bearer wrong')
+            self.assertEqual(
+                resp.status_code,
+                status.HTTP_403_FORBIDDEN)
+
+        with self.settings(METRICS_ALLOWED_IPS=('127.0.0.1',)):
+            resp = client.get('/base/metrics/')
+            self.assertEqual(
+                resp.status_code,
+                status.HTTP_200_OK)
+
+            resp = client.get('/base/metrics/', REMOTE_ADDR='192.0.2.1')
+            self.assertEqual(
+                resp.status_code,
+                status.HTTP_403_FORBIDDEN)
+
+        user = User.objects.create(username='admin', is_staff=True)
+        client.force_login(user)
+        resp = client.get('/base/metrics/')
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_200_OK)
@@ -7,4 +7,5 @@ app_name = 'base'
 
 urlpatterns = [
     path('user/', views.UserView.as_view()),
+    path('metrics/', views.MetricsView.as_view()),
 ]
@@ -1,12 +1,75 @@
+import hmac
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.views import View
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.generics import RetrieveUpdateAPIView
+from rest_framework.serializers import BaseSerializer
 
+from . import metrics
 from .serializers import UserSerializer
 
 
-class UserView(RetrieveUpdateAPIView):
+class SerializationTimingMixin:
+    """
+    Measure the serialization of the response data of a view as the
+    serialize time of its request (see base.middleware).
+
+    The serializers of get_serializer are measured implicitly, other
+    serializers have to be passed to timed before getting their data.
+    """
+
+    def get_serializer(self, *args, **kwargs):
+        return self.timed(super().get_serializer(*args, **kwargs))
+
+    def timed(self, serializer: BaseSerializer) -> BaseSerializer:
+        """
+        Measure the time of getting the data of a serializer.
+        """
+        timing = getattr(self.request, 'timing', None)
+        if timing is None:
+            return serializer
+
+        to_representation = serializer.to_representation
+
+        def timed_to_representation(instance):
+            with timing.serialization():
+                return to_representation(instance)
+        serializer.to_representation = timed_to_representation
+        return serializer
+
+
+class UserView(SerializationTimingMixin, RetrieveUpdateAPIView):
     permission_classes = IsAuthenticated,
     serializer_class = UserSerializer
 
     def get_object(self):
         return self.request.user
+
+
+class MetricsView(View):
+    """
+    Expose the metrics of all processes in the Prometheus text format
+    to requests with the METRICS_TOKEN as bearer token, to staff users
+    and to the addresses in METRICS_ALLOWED_IPS.
+    """
+
+    def get(self, request):
+        if not self._allowed(request):
+            raise PermissionDenied
+        return HttpResponse(
+            metrics.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+    @staticmethod
+    def _allowed(request) -> bool:
+        token = settings.METRICS_TOKEN
+        if token and hmac.compare_digest(
+                request.META.get('HTTP_AUTHORIZATION', ''),
+                'Bearer {}'.format(token)):
+            return True
+        if request.user.is_staff:
+            return True
+        # behind a reverse proxy, this is the address of the proxy
+        return request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
@@ -0,0 +1,3 @@
+"""
+Benchmarks of the API and of the scheduling algorithms.
+"""
@@ -0,0 +1,298 @@
+"""
+Benchmarks of all API endpoints on a synthetic schedule.
+
+Every request is measured against the same data, rolling back its
+writes afterwards. The number of queries, the wall time and the peak
+of the memory allocated by each request are compared against
+thresholds.json, so a change which adds queries (or slows down an
+endpoint considerably) fails the run:
+
+    ./manage.py test benchmarks.api
+
+If BENCHMARK_RESULTS is set, the measurements are written to that
+path as JSON as well.
+"""
+import json
+import os
+import tracemalloc
+from base64 import urlsafe_b64encode
+from datetime import date, timedelta
+from time import perf_counter
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_authtoken.models import AuthToken
+from rest_framework.test import APIClient
+
+import base.urls
+import label.urls
+import task.urls
+from task.models import TaskChunkSeries
+from task.transfer import export_lines
+from .data import generate
+
+THRESHOLDS_PATH = os.path.join(os.path.dirname(__file__), 'thresholds.json')
+
+# the minimum time of this many runs of each request is used
+TIME_REPEAT = 3
+
+SAVEPOINT_QUERIES = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+URL_MODULES = (
+    ('/base/', base.urls),
+    ('/label/', label.urls),
+    ('/task/', task.urls),
+)
+
+
+# the route is the name of the url pattern, or its path if it has no name
+class Benchmark(NamedTuple('Benchmark', [
+        ('method', str),
+        ('route', str),
+        ('url', str),
+        ('data', Optional[Callable[[], dict]]),
+        ('format', str)])):
+    __slots__ = ()
+
+    def __new__(cls, method: str, route: str, url: str,
+                data: Optional[Callable[[], dict]] = None, format: str = 'json'):
+        return super().__new__(cls, method, route, url, data, format)
+
+    @property
+    def name(self) -> str:
+        return '{} {}'.format(self.method, self.route)
+
+
+def routes() -> Set[Tuple[str, str]]:
+    """
+    Get the methods and routes of all API endpoints.
+    """
+    result = set()
+    for prefix, module in URL_MODULES:
+        for pattern in module.urlpatterns:
+            route = pattern.name or prefix + str(pattern.pattern)
+            actions = getattr(pattern.callback, 'actions', None)
+            if actions:
+                methods = actions.keys()
+            else:
+                view_class = pattern.callback.view_class
+                methods = (
+                    method
+                    for method in view_class.http_method_names
+                    if method not in ('head', 'options', 'trace') and hasattr(view_class, method)
+                )
+            result.update((method.upper(), route) for method in methods)
+    return result
+
+
+# the requests of the test client come from localhost
+@override_settings(METRICS_ALLOWED_IPS=('127.0.0.1',))
+class ApiBenchmark(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = generate()[0]
+        tasks = list(cls.user.tasks.order_by('pk'))
+        cls.task = tasks[0]
+        cls.other_task = tasks[1]
+        cls.label = cls.user.labels.order_by('pk').first()
+        cls.series = TaskChunkSeries.objects.filter(
+            task__user=cls.user, rule='interval').first()
+        cls.chunk = cls.user.chunks.filter(
+            finished=False, day__gte=date.today()).order_by('day', 'day_order').first()
+        cls.export = ''.join(export_lines(cls.user))
+        cls.results = {}  # type: Dict[str, Dict[str, float]]
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+
+        for name, result in sorted(cls.results.items()):
+            print('{:<40} {:>4} queries {:>8.1f} ms {:>8.1f} KiB'.format(
+                name, result['queries'], result['time_ms'], result['memory_kib']))
+
+        results_path = os.environ.get('BENCHMARK_RESULTS')
+        if results_path:
+            with open(results_path, 'w') as results_file:
+                json.dump(cls.results, results_file, indent=2, sort_keys=True)
+
+    def setUp(self):
+        token = urlsafe_b64encode(AuthToken.create_token_for_user(self.user)).decode()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token {}'.format(token))
+
+        with open(THRESHOLDS_PATH) as thresholds_file:
+            self.thresholds = json.load(thresholds_file)
+
+    def benchmarks(self) -> List[Benchmark]:
+        today = date.today()
+        task_data = {
+            'name': 'Benchmark task',
+            'duration': '20',
+            'priority': 7,
+            'deadline': str(today + timedelta(days=180)),
+            'labels': [self.label.pk],
+        }
+        series_data = {
+            'task_id': self.task.pk,
+            'duration': '1',
+            'start': str(today),
+            'rule': 'interval',
+            'interval_days': 2,
+        }
+        chunk_data = {
+            'task_id': self.task.pk,
+            'day': str(today + timedelta(days=1)),
+            'duration': '1',
+        }
+        label_data = {
+            'title': 'Benchmark',
+            'color': '00ff00',
+        }
+        user_data = {
+            'workhours_weekday': '9',
+            'workhours_weekend': '3',
+            'default_schedule_duration': '1',
+            'default_schedule_full_duration_max': '3',
+            'password': 'benchmark',
+        }
+        task_url = '/task/task/{}/'.format(self.task.pk)
+        series_url = '/task/chunk/series/{}/'.format(self.series.pk)
+        chunk_url = '/task/chunk/{}/'.format(self.chunk.pk)
+        label_url = '/label/label/{}/'.format(self.label.pk)
+        return [
+            Benchmark('GET', '/base/user/', '/base/user/'),
+            Benchmark('PUT', '/base/user/', '/base/user/', lambda: user_data),
+            Benchmark('PATCH', '/base/user/', '/base/user/', lambda: {'workhours_weekday': '7'}),
+            Benchmark('GET', '/base/metrics/', '/base/metrics/'),
+
+            Benchmark('GET', 'label-list', '/label/label/'),
+            Benchmark('POST', 'label-list', '/label/label/', lambda: label_data),
+            Benchmark('GET', 'label-detail', label_url),
+            Benchmark('PUT', 'label-detail', label_url, lambda: label_data),
+            Benchmark('PATCH', 'label-detail', label_url, lambda: {'color': '0000ff'}),
+            Benchmark('DELETE', 'label-detail', label_url),
+
+            Benchmark('GET', 'task-list', '/task/task/'),
+            Benchmark('POST', 'task-list', '/task/task/', lambda: task_data),
+            Benchmark('GET', 'task-detail', task_url),
+            Benchmark('PUT', 'task-detail', task_url, lambda: task_data),
+            Benchmark('PATCH', 'task-detail', task_url, lambda: {'priority': 2}),
+            Benchmark('DELETE', 'task-detail', task_url),
+            Benchmark('POST', 'task-plan', '/task/task/plan/', lambda: {'strategy': 'deadline'}),
+            Benchmark('POST', 'task-merge', '{}merge/{}/'.format(task_url, self.other_task.pk)),
+
+            Benchmark('GET', 'taskchunkseries-list', '/task/chunk/series/'),
+            Benchmark('POST', 'taskchunkseries-list', '/task/chunk/series/', lambda: series_data),
+            Benchmark('POST', 'taskchunkseries-preview', '/task/chunk/series/preview/', lambda: series_data),
+            Benchmark('GET', 'taskchunkseries-detail', series_url),
+            Benchmark('PUT', 'taskchunkseries-detail', series_url, lambda: dict(
+                series_data, task_id=self.series.task_id, start=str(self.series.start),
+                interval_days=5)),
+
+            Benchmark('GET', 'taskchunk-list', '/task/chunk/?min_date={}'.format(today)),
+            Benchmark('POST', 'taskchunk-list', '/task/chunk/', lambda: chunk_data),
+            Benchmark('POST', 'taskchunk-batch', '/task/chunk/batch/', lambda: {
+                'operations': [
+                    dict(chunk_data, op='create'),
+                    {'op': 'move', 'id': self.chunk.pk, 'day': str(today + timedelta(days=2))},
+                ],
+            }),
+            Benchmark('GET', 'taskchunk-detail', chunk_url),
+            Benchmark('PUT', 'taskchunk-detail', chunk_url, lambda: dict(chunk_data, day_order=1)),
+            Benchmark('PATCH', 'taskchunk-detail', chunk_url, lambda: {'day': str(today + timedelta(days=3))}),
+            Benchmark('DELETE', 'taskchunk-detail', chunk_url + '?postpone=false'),
+            Benchmark('POST', 'taskchunk-split', chunk_url + 'split/?duration=0.5'),
+
+            Benchmark('GET', 'dayload-list', '/task/day/?min_date={}'.format(today)),
+            Benchmark('GET', '/task/export/', '/task/export/'),
+            Benchmark('POST', '/task/import/', '/task/import/', lambda: {
+                'file': SimpleUploadedFile('schedule.ndjson', self.export.encode()),
+            }, 'multipart'),
+            Benchmark('GET', '/task/changes/', '/task/changes/?since=0'),
+        ]
+
+    def request(self, benchmark: Benchmark):
+        data = benchmark.data() if benchmark.data else None
+        response = getattr(self.client, benchmark.method.lower())(
+            benchmark.url, data, format=benchmark.format)
+        # consume streaming responses
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def measure(self, benchmark: Benchmark) -> Dict[str, float]:
+        queries = None
+        times = []
+        memory = None
+        for run in range(TIME_REPEAT + 1):
+            # measure the uncached request and roll back its writes
+            for cache in caches.all():
+                cache.clear()
+            with transaction.atomic():
+                if run < TIME_REPEAT:
+                    with CaptureQueriesContext(connection) as captured:
+                        start = perf_counter()
+                        response = self.request(benchmark)
+                        times.append(perf_counter() - start)
+                    # within this transaction, the outermost atomic block of
+                    # the request uses a savepoint instead of a transaction,
+                    # so savepoints are not counted at all
+                    queries = sum(
+                        1 for query in captured
+                        if not query['sql'].startswith(SAVEPOINT_QUERIES))
+                else:
+                    # tracing the allocations slows down the request
+                    tracemalloc.start()
+                    response = self.request(benchmark)
+                    memory = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                transaction.set_rollback(True)
+
+            self.assertLess(
+                response.status_code, 300,
+                '{} failed: {}'.format(benchmark.name, getattr(response, 'data', None)))
+
+        return {
+            'queries': queries,
+            'time_ms': round(min(times) * 1000, 1),
+            'memory_kib': round(memory / 1024, 1),
+        }
+
+    def test_routes(self):
+        """
+        Test that every API endpoint is benchmarked and has thresholds.
+        """
+        benchmarked = {
+            (benchmark.method, benchmark.route)
+            for benchmark in self.benchmarks()
+        }
+        self.assertSetEqual(
+            routes() - benchmarked,
+            set())
+        self.assertSetEqual(
+            {benchmark.name for benchmark in self.benchmarks()} - set(self.thresholds),
+            set())
+
+    def test_endpoints(self):
+        for benchmark in self.benchmarks():
+            with self.subTest(benchmark.name):
+                result = self.measure(benchmark)
+                self.results[benchmark.name] = result
+
+                threshold = self.thresholds[benchmark.name]
+                self.assertLessEqual(
+                    result['queries'],
+                    threshold['queries'],
+                    'queries of {}'.format(benchmark.name))
+                self.assertLessEqual(
+                    result['time_ms'],
+                    threshold['time_ms'],
+                    'time of {}'.format(benchmark.name))
+                self.assertLessEqual(
+                    result['memory_kib'],
+                    threshold['memory_kib'],
+                    'memory of {}'.format(benchmark.name))
@@ -0,0 +1,130 @@
+"""
+Generation of synthetic schedules for benchmarks.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+from random import Random
+from typing import List
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from label.models import Label
+from task.models import DayLoad, Task, TaskChunk, TaskChunkSeries
+
+# the chunks are scheduled within this many days around today
+DAY_RANGE = 60
+
+SERIES_RULES = (
+    'interval',
+    'monthly',
+    'monthlyweekday',
+)
+
+
+@transaction.atomic
+def generate(
+        users: int = 2, tasks_per_user: int = 30, chunks_per_task: int = 5,
+        labels_per_user: int = 5, series_per_rule: int = 1,
+        seed: int = 0) -> List[get_user_model()]:
+    """
+    Generate users with labels, tasks, chunks and series of every rule.
+
+    The chunks of each user are spread over the DAY_RANGE days around
+    today, a third of them finished. The series are scheduled like
+    series created by the users. Returns the users.
+    """
+    random = Random(seed)
+    today = date.today()
+
+    generated_users = []
+    for user_number in range(users):
+        user = get_user_model()(
+            username='benchmark{}'.format(user_number),
+            workhours_weekday=Decimal(8),
+            workhours_weekend=Decimal(4),
+            default_schedule_duration=Decimal(1),
+            default_schedule_full_duration_max=Decimal(3))
+        user.set_password('benchmark')
+        user.save()
+        generated_users.append(user)
+
+        labels = []
+        for label_number in range(labels_per_user):
+            label = Label(
+                user=user,
+                title='Label {}'.format(label_number),
+                color='{:06x}'.format(random.randrange(0x1000000)))
+            label.save()
+            labels.append(label)
+
+        tasks = []
+        for task_number in range(tasks_per_user):
+            start = None
+            if random.random() < 0.5:
+                start = today + timedelta(days=random.randrange(-DAY_RANGE, DAY_RANGE))
+            deadline = None
+            if random.random() < 0.5:
+                deadline = (start or today) + timedelta(days=random.randrange(1, DAY_RANGE))
+            task = Task(
+                user=user,
+                name='Task {}'.format(task_number),
+                duration=Decimal(chunks_per_task + random.randrange(4)),
+                priority=random.randrange(11),
+                start=start,
+                deadline=deadline)
+            task.save()
+            task.labels.set(random.sample(labels, min(len(labels), random.randrange(3))))
+            tasks.append(task)
+
+        # the next day order of every day of the user
+        day_orders = {}
+        chunks = []
+        for task in tasks:
+            for _ in range(chunks_per_task):
+                day = today + timedelta(days=random.randrange(-DAY_RANGE // 2, DAY_RANGE // 2))
+                day_orders[day] = day_orders.get(day, 0) + 1
+                chunks.append(TaskChunk(
+                    task=task,
+                    day=day,
+                    day_order=day_orders[day] * TaskChunk.DAY_ORDER_SPACING,
+                    duration=Decimal(1),
+                    finished=day < today and random.random() < 0.66))
+        TaskChunk.objects.bulk_create(chunks)
+        DayLoad.refresh(user.pk, day_orders)
+
+        for rule in SERIES_RULES:
+            for _ in range(series_per_rule):
+                start = today + timedelta(days=random.randrange(DAY_RANGE // 2))
+                series = TaskChunkSeries(
+                    task=random.choice(tasks),
+                    start=start,
+                    duration=Decimal(1),
+                    **_rule_fields(rule, start))
+                series.save()
+                series.schedule()
+
+    return generated_users
+
+
+def _rule_fields(rule: str, start: date) -> dict:
+    """
+    Get the fields of a rule which are valid for the start of a series.
+    """
+    if rule == 'interval':
+        return {
+            'rule': rule,
+            'interval_days': 3,
+        }
+    if rule == 'monthly':
+        return {
+            'rule': rule,
+            'monthly_day': start.day,
+            'monthly_months': 1,
+        }
+    return {
+        'rule': rule,
+        'monthlyweekday_weekday': start.weekday(),
+        'monthlyweekday_nth': (start.day - 1) // 7 + 1,
+        'monthly_months': 1,
+    }
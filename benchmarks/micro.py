@@ -0,0 +1,357 @@
+"""
+Micro-benchmarks of the recurrence, capacity and duration algorithms.
+
+Every benchmark is timed in loops long enough to be measured reliably,
+repeated several times. The results are stored as JSON, so they can be
+compared across commits:
+
+    python -m benchmarks.micro run -o before.json
+    (change the code)
+    python -m benchmarks.micro run -o after.json
+    python -m benchmarks.micro compare before.json after.json
+
+The benchmarks which need a database run on a test database created
+for the run.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from itertools import islice
+from timeit import Timer
+from typing import Callable, Dict, List, Optional, Tuple
+
+# the relative change of the mean which is reported as slower or faster
+DEFAULT_TOLERANCE = 0.1
+
+BENCHMARKS = []  # type: List[Tuple[str, Callable[[], Callable[[], object]]]]
+
+
+def benchmark(name: str):
+    """
+    Register a benchmark. The decorated function prepares the benchmark
+    and returns the function to time.
+    """
+    def register(setup: Callable[[], Callable[[], object]]):
+        BENCHMARKS.append((name, setup))
+        return setup
+    return register
+
+
+def _series(rule: str, **fields):
+    from task.models import TaskChunkSeries
+
+    return TaskChunkSeries(
+        rule=rule,
+        start=date(2010, 1, 31),
+        **fields)
+
+
+def _apply_rule(series, horizon: int) -> Callable[[], object]:
+    """
+    Apply the rule to the 100 days at the end of the horizon in days
+    after the start of the series.
+    """
+    end = series.start + timedelta(days=horizon)
+    last_days = [end - timedelta(days=offset) for offset in range(100)]
+
+    def run():
+        for last in last_days:
+            series.apply_rule(last)
+    return run
+
+
+def _register_apply_rule():
+    for rule, fields in (
+            ('interval', {'interval_days': 3}),
+            ('monthly', {'monthly_day': 31, 'monthly_months': 1}),
+            ('monthlyweekday', {
+                'monthlyweekday_weekday': 4, 'monthlyweekday_nth': 5, 'monthly_months': 1})):
+        for years in (1, 10, 100):
+            benchmark('apply_rule {} {}y'.format(rule, years))(
+                lambda rule=rule, fields=fields, years=years: _apply_rule(
+                    _series(rule, **fields), 365 * years))
+
+
+_register_apply_rule()
+
+
+@benchmark('occurrences monthly 500')
+def occurrences_monthly():
+    series = _series('monthly', monthly_day=31, monthly_months=1)
+    return lambda: list(islice(series.recurrence.occurrences(), 500))
+
+
+@benchmark('add_months edge cases')
+def add_months_edge_cases():
+    from task.recurrence import add_months
+
+    days = (
+        date(2016, 1, 31), date(2016, 2, 29), date(2015, 2, 28), date(2015, 12, 31),
+        date(2016, 8, 31), date(2000, 2, 29), date(1900, 2, 28), date(2016, 3, 30))
+    return lambda: [
+        add_months(day, months)
+        for day in days
+        for months in (1, 12, 13, 48, 1200)
+    ]
+
+
+@benchmark('replace_day edge cases')
+def replace_day_edge_cases():
+    from task.recurrence import replace_day
+
+    days = (
+        date(2016, 2, 1), date(2015, 2, 1), date(2016, 4, 15), date(2016, 12, 31))
+    return lambda: [
+        replace_day(day, replace)
+        for day in days
+        for replace in (1, 28, 29, 30, 31)
+    ]
+
+
+def _capacity_user(booked_every: int):
+    """
+    Create a user whose upcoming year is booked completely every
+    booked_every days.
+    """
+    from django.contrib.auth import get_user_model
+    from task.models import DayLoad
+
+    user = get_user_model().objects.create(
+        username='capacity{}'.format(booked_every),
+        workhours_weekday=Decimal(8),
+        workhours_weekend=Decimal(4))
+    today = date.today()
+    DayLoad.objects.bulk_create(
+        DayLoad(
+            user=user,
+            day=today + timedelta(days=offset),
+            scheduled_duration=Decimal(8),
+            chunk_count=1,
+            max_day_order=1)
+        for offset in range(0, 365, booked_every))
+    return user
+
+
+@benchmark('next_day_with_capacity dense')
+def next_day_with_capacity_dense():
+    from task.models import TaskChunk
+
+    user = _capacity_user(1)
+    return lambda: TaskChunk.next_day_with_capacity(user, Decimal(2))
+
+
+@benchmark('next_day_with_capacity sparse')
+def next_day_with_capacity_sparse():
+    from task.models import TaskChunk
+
+    user = _capacity_user(7)
+    return lambda: TaskChunk.next_day_with_capacity(user, Decimal(2))
+
+
+def _duration_tasks():
+    """
+    Create 20 tasks with 20 chunks each.
+    """
+    from django.contrib.auth import get_user_model
+    from task.models import Task, TaskChunk
+
+    user = get_user_model().objects.create(
+        username='durations')
+    tasks = [
+        Task.objects.create(
+            user=user,
+            name='Task {}'.format(number),
+            duration=Decimal(20))
+        for number in range(20)
+    ]
+    TaskChunk.objects.bulk_create(
+        TaskChunk(
+            task=task,
+            day=date(2010, 1, 1) + timedelta(days=number),
+            day_order=1,
+            duration=Decimal(1))
+        for task in tasks
+        for number in range(20))
+    return user.tasks.all()
+
+
+@benchmark('scheduled_duration prefetched')
+def scheduled_duration_prefetched():
+    tasks = _duration_tasks()
+    return lambda: [task.scheduled_duration for task in tasks.prefetch_related('chunks')]
+
+
+@benchmark('scheduled_duration annotated')
+def scheduled_duration_annotated():
+    tasks = _duration_tasks()
+    return lambda: [task.scheduled_duration for task in tasks.annotate_scheduled_duration()]
+
+
+@benchmark('scheduled_duration aggregated')
+def scheduled_duration_aggregated():
+    tasks = _duration_tasks()
+    return lambda: [task.scheduled_duration for task in tasks]
+
+
+def autorange(timer: Timer) -> int:
+    """
+    Get the number of loops (1, 2, 5, 10, 20, 50, ...) which take at
+    least 0.2 seconds, like Timer.autorange, which is only available
+    since Python 3.6.
+    """
+    multiplier = 1
+    while True:
+        for base in (1, 2, 5):
+            loops = base * multiplier
+            if timer.timeit(loops) >= 0.2:
+                return loops
+        multiplier *= 10
+
+
+def measure(func: Callable[[], object], repeat: int) -> Dict:
+    """
+    Time a function in loops of at least 0.2 seconds.
+    Returns the seconds of a single call of each repetition.
+    """
+    timer = Timer(func)
+    loops = autorange(timer)
+    values = [
+        duration / loops
+        for duration in timer.repeat(repeat, loops)
+    ]
+    return {
+        'loops': loops,
+        'values': values,
+        'mean': statistics.mean(values),
+        'stdev': statistics.stdev(values) if len(values) > 1 else 0,
+        'min': min(values),
+    }
+
+
+def run(repeat: int, name_filter: Optional[str] = None) -> Dict:
+    """
+    Run all benchmarks (whose names contain name_filter) on a new test
+    database.
+    """
+    from django.db import connection, transaction
+
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        results = {}
+        for name, setup in BENCHMARKS:
+            if name_filter and name_filter not in name:
+                continue
+            # discard the data of each benchmark afterwards
+            with transaction.atomic():
+                results[name] = measure(setup(), repeat)
+                transaction.set_rollback(True)
+            print('{:<40} {:>12} +- {}'.format(
+                name, _format_time(results[name]['mean']),
+                _format_time(results[name]['stdev'])))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    return {
+        'metadata': {
+            'date': datetime.now().isoformat(),
+            'commit': _commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'database': connection.vendor,
+        },
+        'benchmarks': results,
+    }
+
+
+def compare(old: Dict, new: Dict, tolerance: float) -> bool:
+    """
+    Print the changes of the benchmarks of two runs.
+
+    A change is significant if the mean changes by more than the
+    tolerance and by more than twice the larger standard deviation.
+    Returns whether any benchmark got significantly slower.
+    """
+    slower = False
+    for name, new_result in new['benchmarks'].items():
+        old_result = old['benchmarks'].get(name)
+        if old_result is None:
+            continue
+
+        ratio = new_result['mean'] / old_result['mean']
+        significant = abs(new_result['mean'] - old_result['mean']) > \
+            2 * max(old_result['stdev'], new_result['stdev'])
+        change = 'not significant'
+        if significant and ratio > 1 + tolerance:
+            change = '{:.2f}x slower'.format(ratio)
+            slower = True
+        elif significant and ratio < 1 - tolerance:
+            change = '{:.2f}x faster'.format(1 / ratio)
+        print('{:<40} {:>12} -> {:>12}: {}'.format(
+            name, _format_time(old_result['mean']),
+            _format_time(new_result['mean']), change))
+    return slower
+
+
+def _format_time(seconds: float) -> str:
+    for unit, factor in (('s', 1), ('ms', 1e3), ('us', 1e6)):
+        if seconds * factor >= 1:
+            return '{:.2f} {}'.format(seconds * factor, unit)
+    return '{:.0f} ns'.format(seconds * 1e9)
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ('git', 'rev-parse', 'HEAD'), stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    subparsers = parser.add_subparsers(dest='command')
+    run_parser = subparsers.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument(
+        '-o', '--output', help='path to store the results as JSON')
+    run_parser.add_argument(
+        '--repeat', type=int, default=5, help='number of timed repetitions')
+    run_parser.add_argument(
+        '--filter', help='only run the benchmarks whose names contain this')
+    compare_parser = subparsers.add_parser(
+        'compare', help='compare the results of two runs')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument(
+        '--tolerance', type=float, default=DEFAULT_TOLERANCE,
+        help='relative change of the mean which is considered significant')
+    arguments = parser.parse_args(argv)
+
+    if arguments.command == 'compare':
+        with open(arguments.old) as old_file, open(arguments.new) as new_file:
+            slower = compare(json.load(old_file), json.load(new_file), arguments.tolerance)
+        return 1 if slower else 0
+    if arguments.command != 'run':
+        parser.print_help()
+        return 2
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'todoscheduler.settings')
+    import django
+    django.setup()
+
+    results = run(arguments.repeat, arguments.filter)
+    if arguments.output:
+        with open(arguments.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
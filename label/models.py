@@ -1,6 +1,8 @@
 from django.conf import settings
 from django.db import models
 
+from base.models import Change
+
 
 class Label(models.Model):
     class Meta:
@@ -21,3 +23,18 @@ class Label(models.Model):
         return '{}: {}'.format(
             str(self.user),
             self.title)
+
+    @Change.collect()
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        Change.record(self.user_id, label=(self.pk,))
+
+    @Change.collect()
+    def delete(self, *args, **kwargs):
+        pk = self.pk
+        task_ids = list(self.tasks.values_list('pk', flat=True))
+        result = super().delete(*args, **kwargs)
+        Change.record(self.user_id, deleted=True, label=(pk,))
+        # the label is removed from its tasks
+        Change.record(self.user_id, task=task_ids)
+        return result
@@ -1,10 +1,11 @@
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.viewsets import ModelViewSet
 
+from base.views import SerializationTimingMixin
 from .serializers import LabelSerializer
 
 
-class LabelViewSet(ModelViewSet):
+class LabelViewSet(SerializationTimingMixin, ModelViewSet):
     permission_classes = IsAuthenticated,
     serializer_class = LabelSerializer
 
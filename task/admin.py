@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Task, TaskChunk, TaskChunkSeries
+from .models import DayLoad, Task, TaskChunk, TaskChunkSeries
 
 
 @admin.register(Task)
@@ -27,3 +27,13 @@ class TaskChunkSeriesAdmin(admin.ModelAdmin):
         'task',
         'duration',
     )
+
+
+@admin.register(DayLoad)
+class DayLoadAdmin(admin.ModelAdmin):
+    list_display = (
+        'day',
+        'user',
+        'scheduled_duration',
+        'chunk_count',
+    )
@@ -0,0 +1,270 @@
+"""
+Application of a batch of operations on the task chunks of a user.
+
+All operations are applied to the chunks in memory first. Afterwards,
+the days whose order changed are renumbered, and the chunks, day
+orders, task durations and day loads are written with a constant
+number of queries.
+"""
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+from typing import DefaultDict, Dict, List, Optional, Set, Tuple, Union
+
+from django.db import connection
+from django.db.models import BooleanField, Case, DateField, DecimalField, F, IntegerField, \
+    TextField, Value, When
+from rest_framework.exceptions import ValidationError
+
+from base.models import Change
+from .models import DayLoad, Task, TaskChunk
+
+
+@Change.collect()
+def apply_chunk_operations(user, operations: List[dict]) -> Tuple[List[TaskChunk], List[int]]:
+    """
+    Apply validated chunk operations of the user in a single transaction.
+
+    Returns the created and changed chunks, including the chunks which
+    were renumbered to place others between them, and the ids of the
+    deleted chunks.
+    """
+    chunks = TaskChunk.objects.filter(
+        user=user,
+        pk__in={operation['id'] for operation in operations if 'id' in operation},
+    ).select_for_update().in_bulk()
+    tasks = user.tasks.filter(pk__in={
+        operation['task_id'] for operation in operations if 'task_id' in operation
+    } | {chunk.task_id for chunk in chunks.values()}).annotate_scheduled_duration().in_bulk()
+    for chunk in chunks.values():
+        chunk.task = tasks[chunk.task_id]
+
+    stored = {
+        pk: (chunk.day, chunk.day_order, chunk.duration, chunk.finished, chunk.notes)
+        for pk, chunk in chunks.items()
+    }
+    created = []  # type: List[TaskChunk]
+    deleted = set()  # type: Set[int]
+    # the chunks whose position changed with their requested day order
+    # (if any), by the identity of the chunks as created chunks have no id
+    placed = {}  # type: Dict[int, Tuple[TaskChunk, Optional[int]]]
+    duration_deltas = defaultdict(Decimal)  # type: DefaultDict[int, Decimal]
+    changed_tasks = set()  # type: Set[int]
+    days = set()
+
+    for index, operation in enumerate(operations):
+        op = operation['op']
+        if op == 'create':
+            task = tasks.get(operation['task_id'])
+            if task is None:
+                _raise(index, 'task_id', 'task does not exist')
+            chunk = TaskChunk(
+                task=task,
+                day=operation['day'],
+                day_order=1,
+                duration=operation['duration'],
+                finished=operation.get('finished', False),
+                notes=operation.get('notes'))
+            # increase the duration of the task if the chunk exceeds its
+            # unscheduled duration
+            unscheduled_duration = task.duration + duration_deltas[task.pk] - task.scheduled_duration
+            duration_deltas[task.pk] += max(Decimal(0), chunk.duration - unscheduled_duration)
+            task.scheduled_duration_agg += chunk.duration
+            created.append(chunk)
+            placed[id(chunk)] = chunk, operation.get('day_order')
+            days.add(chunk.day)
+            continue
+
+        chunk = chunks.get(operation['id'])
+        if chunk is None or chunk.pk in deleted:
+            _raise(index, 'id', 'task chunk does not exist')
+        days.add(chunk.day)
+
+        if op == 'delete':
+            deleted.add(chunk.pk)
+            changed_tasks.add(chunk.task_id)
+            placed.pop(id(chunk), None)
+            chunk.task.scheduled_duration_agg -= chunk.duration
+            if not operation['postpone']:
+                duration_deltas[chunk.task_id] -= chunk.duration
+            continue
+
+        if op == 'finish':
+            chunk.finished = operation.get('finished', True)
+        if 'duration' in operation and op == 'update':
+            duration_delta = operation['duration'] - chunk.duration
+            duration_deltas[chunk.task_id] += duration_delta
+            chunk.task.scheduled_duration_agg += duration_delta
+            chunk.duration = operation['duration']
+        if op == 'update':
+            if 'finished' in operation:
+                chunk.finished = operation['finished']
+            if 'notes' in operation:
+                chunk.notes = operation['notes']
+        if op in ('update', 'move'):
+            day = operation.get('day', chunk.day)
+            if day != chunk.day or 'day_order' in operation:
+                chunk.day = day
+                placed[id(chunk)] = chunk, operation.get('day_order')
+        days.add(chunk.day)
+
+    renumbered = _place_chunks(user, list(placed.values()), chunks, deleted)
+
+    TaskChunk.objects.filter(pk__in=deleted).delete()
+    _create(created)
+    changed = [
+        chunk
+        for pk, chunk in chunks.items()
+        if pk not in deleted and stored[pk] != (
+            chunk.day, chunk.day_order, chunk.duration, chunk.finished, chunk.notes)
+    ]
+    _update(changed)
+    if renumbered:
+        TaskChunk.objects.filter(pk__in=renumbered).update(day_order=Case(
+            *(When(pk=pk, then=Value(day_order)) for pk, day_order in renumbered.items()),
+            output_field=IntegerField()))
+
+    DayLoad.refresh(user.pk, days)
+    Change.record(user.pk, deleted=True, chunk=deleted)
+    deleted_tasks, deleted_task_chunks = _update_task_durations(duration_deltas)
+    deleted |= deleted_task_chunks
+
+    touched = [chunk for chunk in created + changed if chunk.pk not in deleted]
+    # the durations of the tasks change with their chunks
+    changed_tasks |= {chunk.task_id for chunk in touched} | set(duration_deltas)
+    # the chunks outside of the batch whose day orders changed as well
+    touched += TaskChunk.objects.filter(pk__in=set(renumbered) - deleted).order_by('day', 'day_order')
+    Change.record(
+        user.pk,
+        chunk=[chunk.pk for chunk in touched],
+        task=changed_tasks - deleted_tasks)
+    return touched, sorted(deleted)
+
+
+def _raise(index: int, field: str, message: str):
+    raise ValidationError({
+        'operations': {
+            index: {
+                field: message,
+            },
+        },
+    })
+
+
+def _place_chunks(
+        user, placed: List[Tuple[TaskChunk, Optional[int]]],
+        chunks: Dict[int, TaskChunk], deleted: Set[int]) -> Dict[int, int]:
+    """
+    Set the day orders of the placed chunks and renumber all chunks of
+    their days at once.
+
+    A placed chunk with a requested day order is inserted before the
+    chunk which has that day order, the others are appended to their
+    days.
+
+    Returns the new day orders of the renumbered chunks which are not
+    part of the batch.
+    """
+    if not placed:
+        return {}
+
+    placed_ids = {chunk.pk for chunk, _ in placed if chunk.pk}
+    # the positions of each day as (day order, placed chunk or id)
+    days = defaultdict(list)  # type: DefaultDict[date, List[Tuple[int, Union[TaskChunk, int]]]]
+    for pk, day, day_order in TaskChunk.objects.filter(
+            user=user,
+            day__in={chunk.day for chunk, _ in placed},
+    ).order_by('day_order', 'pk').values_list('pk', 'day', 'day_order'):
+        if pk not in deleted and pk not in placed_ids:
+            days[day].append((day_order, pk))
+
+    for chunk, day_order in placed:
+        day_positions = days[chunk.day]
+        position = len(day_positions)
+        if day_order is not None:
+            position = next((
+                index
+                for index, (other_day_order, _) in enumerate(day_positions)
+                if other_day_order >= day_order
+            ), position)
+        if day_order is None:
+            # keep chunks which are placed later in front of this one
+            day_order = TaskChunk.MAX_DAY_ORDER + 1
+        day_positions.insert(position, (day_order, chunk))
+
+    renumbered = {}
+    for day_positions in days.values():
+        spacing = min(
+            TaskChunk.DAY_ORDER_SPACING,
+            TaskChunk.MAX_DAY_ORDER // (len(day_positions) + 1))
+        for position, (day_order, chunk) in enumerate(day_positions, start=1):
+            if not isinstance(chunk, TaskChunk) and chunk in chunks:
+                chunk = chunks[chunk]
+            if isinstance(chunk, TaskChunk):
+                chunk.day_order = spacing * position
+            elif day_order != spacing * position:
+                renumbered[chunk] = spacing * position
+    return renumbered
+
+
+def _create(chunks: List[TaskChunk]):
+    """
+    Insert the created chunks, which requires single inserts if the
+    database cannot return the ids of bulk inserts.
+    """
+    if connection.features.can_return_ids_from_bulk_insert:
+        TaskChunk.objects.bulk_create(chunks)
+    else:
+        for chunk in chunks:
+            chunk.save()
+
+
+def _update(chunks: List[TaskChunk]):
+    """
+    Write the fields of all changed chunks with a single query.
+    """
+    if not chunks:
+        return
+
+    def field_case(field: str, output_field):
+        return Case(
+            *(When(pk=chunk.pk, then=Value(getattr(chunk, field))) for chunk in chunks),
+            default=F(field), output_field=output_field)
+
+    TaskChunk.objects.filter(pk__in=[chunk.pk for chunk in chunks]).update(
+        day=field_case('day', DateField()),
+        day_order=field_case('day_order', IntegerField()),
+        duration=field_case('duration', DecimalField()),
+        finished=field_case('finished', BooleanField()),
+        notes=field_case('notes', TextField()))
+
+
+def _update_task_durations(duration_deltas: Dict[int, Decimal]) -> Tuple[Set[int], Set[int]]:
+    """
+    Change the durations of all tasks with a single query and delete
+    the tasks without any remaining duration, whose chunks are deleted
+    as well.
+
+    Returns the ids of the deleted tasks and of the chunks deleted with
+    them.
+    """
+    duration_deltas = {
+        pk: delta
+        for pk, delta in duration_deltas.items()
+        if delta
+    }
+    if not duration_deltas:
+        return set(), set()
+
+    tasks = Task.objects.filter(pk__in=duration_deltas)
+    tasks.update(duration=F('duration') + Case(
+        *(When(pk=pk, then=Value(delta)) for pk, delta in duration_deltas.items()),
+        output_field=DecimalField()))
+
+    deleted_tasks = set()
+    deleted_chunks = set()
+    for task in tasks.filter(duration__lte=0):
+        deleted_tasks.add(task.pk)
+        deleted_chunks.update(task.chunks.values_list('pk', flat=True))
+        task.delete()
+    return deleted_tasks, deleted_chunks
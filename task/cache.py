@@ -0,0 +1,61 @@
+"""
+Caching of serialized task data of a user.
+
+The cache keys contain the revision of the user. Every write of a
+label, task, series or chunk records a change with a new revision (see
+base.models.Change), so a write makes all cached data of its user
+unreachable at once without deleting any key. Unreachable entries are
+evicted by the size-bounded cache backend: the local-memory backend of
+Django discards the least recently used entries beyond MAX_ENTRIES,
+and shared backends (e.g. Redis) can be configured for the cache
+alias TASK_CACHE in the same way.
+"""
+from functools import wraps
+from hashlib import sha1
+from typing import Dict
+
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import metrics
+
+TASK_CACHE = 'tasks'
+
+
+def cache_stats() -> Dict[str, int]:
+    """
+    Get the number of cache hits and misses of this process, which
+    are exposed as metrics as well.
+    """
+    return {
+        'hits': int(metrics.task_cache_hits.value),
+        'misses': int(metrics.task_cache_misses.value),
+    }
+
+
+def revision_cached(method):
+    """
+    Cache the serialized data of successful responses of a view method
+    by the requesting user, its revision and the full path.
+    """
+    @wraps(method)
+    def cached_method(self, request, *args, **kwargs):
+        cache = caches[TASK_CACHE]
+        key = 'task:{}:{}:{}'.format(
+            request.user.pk,
+            request.user.revision,
+            sha1(request.get_full_path().encode()).hexdigest())
+
+        data = cache.get(key)
+        if data is not None:
+            metrics.task_cache_hits.inc()
+            return Response(data)
+
+        metrics.task_cache_misses.inc()
+        response = method(self, request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data)
+        return response
+
+    return cached_method
@@ -0,0 +1,43 @@
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from task.transfer import IMPORT_BATCH_SIZE, import_records, read_csv, read_ndjson
+
+
+class Command(BaseCommand):
+    help = 'Import labels, tasks, series and chunks of a user from an NDJSON or CSV file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('path')
+        parser.add_argument(
+            '--format', choices=('ndjson', 'csv'),
+            help='Format of the file, by default determined by its extension.')
+        parser.add_argument(
+            '--batch-size', type=int, default=IMPORT_BATCH_SIZE,
+            help='Number of records which are validated and inserted at once.')
+
+    def handle(self, username: str, path: str, batch_size: int, **arguments):
+        try:
+            user = get_user_model().objects.get(username=username)
+        except get_user_model().DoesNotExist:
+            raise CommandError('user {} does not exist'.format(username))
+
+        file_format = arguments['format']
+        if not file_format:
+            file_format = 'csv' if path.endswith('.csv') else 'ndjson'
+
+        with open(path, encoding='utf-8', newline='') as file:
+            if file_format == 'csv':
+                records = read_csv(file)
+            else:
+                records = read_ndjson(file)
+            try:
+                counts = import_records(user, records, batch_size)
+            except ValidationError as error:
+                raise CommandError('invalid import: {}'.format(error.detail))
+
+        self.stdout.write(
+            'imported {label} labels, {task} tasks, {series} series and {chunk} chunks\n'.format(
+                **counts))
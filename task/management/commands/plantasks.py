@@ -0,0 +1,44 @@
+from time import monotonic
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand, CommandError
+
+from task.planning import DEFAULT_HORIZON, plan_by_deadline, save_plan
+
+
+class Command(BaseCommand):
+    help = 'Plan the incompletely scheduled tasks of a user by their deadlines.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument(
+            '--horizon', type=int, default=DEFAULT_HORIZON,
+            help='Number of days to plan ahead.')
+        parser.add_argument(
+            '--commit', action='store_true',
+            help='Create the planned chunks instead of only printing them.')
+
+    def handle(self, username: str, horizon: int, commit: bool, **arguments):
+        try:
+            user = get_user_model().objects.get(username=username)
+        except get_user_model().DoesNotExist:
+            raise CommandError('user {} does not exist'.format(username))
+
+        start = monotonic()
+        chunks, late_tasks = plan_by_deadline(
+            user, user.tasks.incompletely_scheduled(), horizon)
+        duration = monotonic() - start
+
+        if arguments['verbosity'] > 1:
+            for chunk in chunks:
+                self.stdout.write('{}: {} ({}h)\n'.format(
+                    chunk.day, chunk.task.name, chunk.duration))
+        for task in late_tasks:
+            self.stdout.write('late: {}\n'.format(task.name))
+
+        if commit:
+            save_plan(user, chunks)
+
+        self.stdout.write(
+            '{} {} chunks with {} late tasks in {:.3f}s\n'.format(
+                'created' if commit else 'planned', len(chunks), len(late_tasks), duration))
@@ -1,15 +1,122 @@
-from django.core.management import BaseCommand
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from time import monotonic
+from typing import List, Optional, Tuple
 
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q, QuerySet
+
+from task import metrics
 from task.models import TaskChunkSeries
 
 
 class Command(BaseCommand):
-    def handle(self, **arguments):
-        incomplete_series = TaskChunkSeries.objects.filter(
-            completely_scheduled=False)
+    help = (
+        'Schedule further task chunks for all incompletely scheduled series. '
+        'Its metrics are only exposed by the server if METRICS_DIR is set.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Number of batches to process concurrently, each using its '
+                 'own database connection.')
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Number of users whose series are processed in a single batch.')
+
+    def handle(self, workers: int, batch_size: int, **arguments):
+        if workers < 1:
+            raise CommandError('--workers must be at least 1')
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        start = monotonic()
+
+        # partition by user to prevent concurrent batches from allocating
+        # day orders on the same days
+        user_ids = list(self._due_series().values_list(
+            'task__user_id', flat=True).order_by('task__user_id').distinct())
+        batches = [
+            user_ids[offset:offset + batch_size]
+            for offset in range(0, len(user_ids), batch_size)
+        ]
+
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(self._schedule_batch_concurrently, batches))
+        else:
+            results = [self._schedule_batch(batch) for batch in batches]
+
+        series_count = 0
         chunk_count = 0
-        for series in incomplete_series:
-            chunk_count += len(series.schedule())
+        failed_batches = 0
+        for number, (batch_series_count, batch_chunk_count, duration, error) in enumerate(results, start=1):
+            series_count += batch_series_count
+            chunk_count += batch_chunk_count
+            if error:
+                failed_batches += 1
+                self.stderr.write(
+                    'batch {}: failed after scheduling {} chunks for {} series:\n{}'.format(
+                        number, batch_chunk_count, batch_series_count, error))
+            elif arguments['verbosity'] > 1:
+                self.stdout.write(
+                    'batch {}: scheduled {} chunks for {} series in {:.3f}s\n'.format(
+                        number, batch_chunk_count, batch_series_count, duration))
+
+        duration = monotonic() - start
+        metrics.schedule_series_run_seconds.observe(duration)
+        metrics.schedule_series_processed.inc(series_count)
         self.stdout.write(
-            'scheduled {} chunks for {} series\n'.format(
-                chunk_count, len(incomplete_series)))
+            'scheduled {} chunks for {} series in {:.3f}s ({:.1f} series/s)\n'.format(
+                chunk_count, series_count, duration,
+                series_count / duration if duration else 0))
+
+        if failed_batches:
+            raise CommandError('{} of {} batches failed'.format(failed_batches, len(batches)))
+
+    @staticmethod
+    def _due_series() -> QuerySet:
+        """
+        Get all series for which the next occurrence can be scheduled.
+        """
+        horizon = date.today() + TaskChunkSeries.DEFAULT_MAX_ADVANCE
+        return TaskChunkSeries.objects.filter(
+            Q(next_due_day__isnull=True) | Q(next_due_day__lte=horizon),
+            completely_scheduled=False)
+
+    def _schedule_batch(self, user_ids: List[int]) -> Tuple[int, int, float, Optional[str]]:
+        """
+        Schedule the incomplete series of the users of a batch.
+        Returns the number of series, the number of scheduled chunks,
+        the duration of the batch and the traceback of the error which
+        stopped the batch, if any. The series scheduled before an error
+        are kept, as every series is scheduled in a transaction of its
+        own.
+        """
+        start = monotonic()
+        series_count = 0
+        chunk_count = 0
+        error = None
+        try:
+            incomplete_series = self._due_series().filter(
+                task__user_id__in=user_ids,
+            ).select_related('task')
+            for series in incomplete_series:
+                chunk_count += len(series.schedule())
+                series_count += 1
+        except Exception:
+            # report the error after all other batches
+            error = traceback.format_exc()
+        return series_count, chunk_count, monotonic() - start, error
+
+    def _schedule_batch_concurrently(self, user_ids: List[int]) -> Tuple[int, int, float, Optional[str]]:
+        """
+        Schedule a batch in a worker thread, which uses a database
+        connection of its own.
+        """
+        try:
+            return self._schedule_batch(user_ids)
+        finally:
+            connection.close()
@@ -0,0 +1,78 @@
+from datetime import date
+from itertools import groupby
+from typing import Dict, List, Tuple
+
+from django.core.management import BaseCommand
+from django.db.models import Case, IntegerField, Value, When
+
+from base.models import Change
+from task.models import DayLoad, TaskChunk
+
+
+class Command(BaseCommand):
+    help = 'Spread the day orders of all days to leave gaps between their chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Spread the day orders of past days as well.')
+
+    def handle(self, **arguments):
+        chunks = TaskChunk.objects.order_by(
+            'user_id', 'day', 'day_order', 'pk')
+        if not arguments['all']:
+            chunks = chunks.filter(day__gte=date.today())
+
+        day_count = 0
+        chunk_count = 0
+        rows = chunks.values_list('user_id', 'day', 'pk', 'day_order').iterator()
+        for (user_id, day), day_rows in groupby(rows, lambda row: row[:2]):
+            if not self._spread([row[2:] for row in day_rows]):
+                continue
+            updated = self._spread_day(user_id, day)
+            if updated:
+                day_count += 1
+                chunk_count += len(updated)
+
+        self.stdout.write(
+            'spread the day orders of {} chunks on {} days\n'.format(
+                chunk_count, day_count))
+
+    @staticmethod
+    @Change.collect()
+    def _spread_day(user_id: int, day: date) -> List[int]:
+        """
+        Spread the day orders of the chunks of a single day in a
+        transaction, locking the chunks so that concurrent changes of
+        them are neither overwritten nor collide with the new day orders.
+        Returns the ids of the chunks whose day order was changed.
+        """
+        changed = Command._spread(list(TaskChunk.objects.filter(
+            user_id=user_id,
+            day=day,
+        ).order_by('day_order', 'pk').select_for_update().values_list('pk', 'day_order')))
+        if not changed:
+            return []
+
+        TaskChunk.objects.filter(pk__in=changed).update(day_order=Case(
+            *(When(pk=pk, then=Value(day_order)) for pk, day_order in changed.items()),
+            output_field=IntegerField()))
+        DayLoad.refresh(user_id, (day,))
+        Change.record(user_id, chunk=changed)
+        return list(changed)
+
+    @staticmethod
+    def _spread(day_orders: List[Tuple[int, int]]) -> Dict[int, int]:
+        """
+        Determine the spread day orders of the chunks of a single day,
+        provided as (pk, day_order) tuples in their order.
+        Returns the new day orders of the chunks whose day order changes.
+        """
+        spacing = min(
+            TaskChunk.DAY_ORDER_SPACING,
+            TaskChunk.MAX_DAY_ORDER // (len(day_orders) + 1))
+        return {
+            pk: spacing * position
+            for position, (pk, day_order) in enumerate(day_orders, start=1)
+            if day_order != spacing * position
+        }
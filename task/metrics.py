@@ -0,0 +1,37 @@
+"""
+Metrics of the scheduling of task chunks and of the task cache
+(see base.metrics).
+"""
+from base.metrics import SIZE_BUCKETS, Counter, Histogram
+
+series_schedule_seconds = Histogram(
+    'todoscheduler_series_schedule_seconds',
+    'Duration of scheduling the chunks of a series.')
+series_scheduled_chunks = Histogram(
+    'todoscheduler_series_scheduled_chunks',
+    'Number of chunks created by scheduling a series.',
+    SIZE_BUCKETS)
+capacity_days_scanned = Histogram(
+    'todoscheduler_capacity_days_scanned',
+    'Number of days checked to find the next day with enough capacity.',
+    SIZE_BUCKETS)
+split_shifted_chunks = Histogram(
+    'todoscheduler_split_shifted_chunks',
+    'Number of chunks whose day order is shifted by splitting a chunk.',
+    SIZE_BUCKETS)
+update_shifted_chunks = Histogram(
+    'todoscheduler_update_shifted_chunks',
+    'Number of chunks whose day order is shifted by placing an updated chunk.',
+    SIZE_BUCKETS)
+schedule_series_run_seconds = Histogram(
+    'todoscheduler_schedule_series_run_seconds',
+    'Duration of runs of the scheduletaskchunkseries command.')
+schedule_series_processed = Counter(
+    'todoscheduler_schedule_series_processed',
+    'Number of series processed by the scheduletaskchunkseries command.')
+task_cache_hits = Counter(
+    'todoscheduler_task_cache_hits',
+    'Number of requests answered with serialized task data from the cache.')
+task_cache_misses = Counter(
+    'todoscheduler_task_cache_misses',
+    'Number of cacheable requests whose serialized task data was not cached.')
@@ -0,0 +1,23 @@
+# Generated by Django 2.1.12 on 2026-10-17 02:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('task', '0014_auto_20180911_1443'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskchunkseries',
+            name='next_due_day',
+            field=models.DateField(null=True),
+        ),
+        # a partial index, which is not supported by models.Index yet
+        migrations.RunSQL(
+            ['CREATE INDEX task_taskchunkseries_incomplete_idx '
+             'ON task_taskchunkseries (next_due_day) WHERE NOT completely_scheduled'],
+            ['DROP INDEX task_taskchunkseries_incomplete_idx']),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 2.1.12 on 2026-10-17 02:25
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def create_day_loads(apps, schema_editor):
+    DayLoad = apps.get_model('task', 'DayLoad')
+    TaskChunk = apps.get_model('task', 'TaskChunk')
+
+    loads = TaskChunk.objects.values('task__user_id', 'day').annotate(
+        scheduled_duration=Sum('duration'),
+        finished_duration=Coalesce(
+            Sum('duration', filter=Q(finished=True)),
+            0),
+        chunk_count=Count('pk'),
+        max_day_order=Max('day_order')).order_by()
+    DayLoad.objects.bulk_create((
+        DayLoad(
+            user_id=load.pop('task__user_id'),
+            **load)
+        for load in loads.iterator()
+    ), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('task', '0015_auto_20261017_0419'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DayLoad',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('scheduled_duration', models.DecimalField(decimal_places=2, default=0, max_digits=6)),
+                ('finished_duration', models.DecimalField(decimal_places=2, default=0, max_digits=6)),
+                ('chunk_count', models.IntegerField(default=0)),
+                ('max_day_order', models.SmallIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='day_loads', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='dayload',
+            unique_together={('user', 'day')},
+        ),
+        migrations.RunPython(create_day_loads, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 2.1.12 on 2026-10-17 02:48
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+BACKFILL_BATCH_SIZE = 10000
+
+
+def backfill_user(apps, schema_editor):
+    """
+    Copy the users of the tasks to their chunks in batches, each of
+    which is committed on its own as the migration is not atomic.
+    """
+    Task = apps.get_model('task', 'Task')
+    TaskChunk = apps.get_model('task', 'TaskChunk')
+
+    task_user = Task.objects.filter(pk=OuterRef('task_id')).values('user_id')
+    last_pk = 0
+    while True:
+        pks = list(TaskChunk.objects.filter(
+            pk__gt=last_pk,
+        ).order_by('pk').values_list('pk', flat=True)[:BACKFILL_BATCH_SIZE])
+        if not pks:
+            return
+        TaskChunk.objects.filter(
+            pk__gte=pks[0], pk__lte=pks[-1],
+        ).update(user_id=Subquery(task_user))
+        last_pk = pks[-1]
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('task', '0016_dayload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskchunk',
+            name='user',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_user, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='taskchunk',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='taskchunk',
+            index=models.Index(fields=['user', 'day', 'day_order'], name='task_taskch_user_id_aa6827_idx'),
+        ),
+        # a partial index, which is not supported by models.Index yet
+        migrations.RunSQL(
+            ['CREATE INDEX task_taskchunk_unfinished_idx '
+             'ON task_taskchunk (user_id, day) WHERE NOT finished'],
+            ['DROP INDEX task_taskchunk_unfinished_idx']),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 2.1.12 on 2026-10-17 03:40
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('task', '0017_taskchunk_user'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='taskchunk',
+            name='day_order',
+            field=models.SmallIntegerField(validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+    ]
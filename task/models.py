@@ -1,28 +1,44 @@
-from typing import List, Optional, Union
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 
 from datetime import date, timedelta
 from decimal import Decimal
+from time import perf_counter
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models, transaction
-from django.db.models import Sum, F, Max, Q, QuerySet
+from django.db.models import Count, Sum, F, Max, Min, OuterRef, Q, QuerySet, Subquery
 from django.db.models.functions import Coalesce
 
+from base.models import Change
+from . import metrics
+from .recurrence import Recurrence
+
 
 class TaskQuerySet(models.QuerySet):
     def annotate_finished_duration(self):
         return self.annotate(
-            finished_duration_agg=Coalesce(
-                Sum('chunks__duration', filter=Q(chunks__finished=True)),
-                0))
+            finished_duration_agg=self._chunk_duration(finished=True))
 
     def annotate_scheduled_duration(self):
         return self.annotate(
-            scheduled_duration_agg=Coalesce(
-                Sum('chunks__duration'),
-                0))
+            scheduled_duration_agg=self._chunk_duration())
+
+    @staticmethod
+    def _chunk_duration(**filters):
+        """
+        Get the summed duration of the chunks of each task as a
+        subquery, which does not join the chunks into the query.
+        """
+        durations = TaskChunk.objects.filter(
+            task=OuterRef('pk'), **filters
+        ).order_by().values('task').annotate(
+            duration_sum=Sum('duration')
+        ).values('duration_sum')
+        return Coalesce(
+            Subquery(durations, output_field=models.DecimalField()),
+            0)
 
     def incompletely_scheduled(self):
         """
@@ -127,6 +143,17 @@ class Task(models.Model):
     def unfinished_duration(self) -> Decimal:
         return self.duration - self.finished_duration
 
+    def clear_durations(self):
+        """
+        Discard the annotated durations and prefetched chunks, so that
+        the durations are calculated again after the chunks changed.
+        """
+        for attribute in ('scheduled_duration_agg', 'finished_duration_agg'):
+            if hasattr(self, attribute):
+                delattr(self, attribute)
+        if hasattr(self, '_prefetched_objects_cache'):
+            self._prefetched_objects_cache.pop('chunks', None)
+
     def get_day_for_scheduling(
             self, special_date: str, duration: Decimal) -> Union[None, date]:
         """
@@ -143,7 +170,24 @@ class Task(models.Model):
             return TaskChunk.next_day_with_capacity(
                 self.user, duration)
 
-    @transaction.atomic
+    @Change.collect()
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        Change.record(self.user_id, task=(self.pk,))
+
+    @Change.collect()
+    def delete(self, *args, **kwargs):
+        pk = self.pk
+        chunks = list(self.chunks.values_list('pk', 'day'))
+        series_ids = list(self.chunk_series.values_list('pk', flat=True))
+        result = super().delete(*args, **kwargs)
+        DayLoad.refresh(self.user_id, {day for _, day in chunks})
+        Change.record(
+            self.user_id, deleted=True,
+            task=(pk,), series=series_ids, chunk=[chunk_id for chunk_id, _ in chunks])
+        return result
+
+    @Change.collect()
     def merge(self, task: 'Task') -> List['TaskChunk']:
         """
         Merge task into this task.
@@ -156,7 +200,9 @@ class Task(models.Model):
 
         self.duration = a.duration + b.duration
         self.save(update_fields=('duration',))
-        task.chunks.update(task_id=self.pk)
+        moved_ids = list(task.chunks.values_list('pk', flat=True))
+        task.chunks.update(task_id=self.pk, user_id=self.user_id)
+        Change.record(self.user_id, chunk=moved_ids)
         task.delete()
         return TaskChunk.objects.filter(task_id__in=(self.pk, task.pk))
 
@@ -170,6 +216,11 @@ class TaskChunkSeries(models.Model):
     """
     class Meta:
         verbose_name_plural = 'task chunk series'
+        # the incompletely scheduled series are indexed by a partial
+        # index (see migration 0015), as Django does not support them yet
+
+    DEFAULT_MAX_COUNT = 50
+    DEFAULT_MAX_ADVANCE = timedelta(days=365)
 
     RULE_CHOICES = (
         ('interval', 'schedule in an interval of a fixed number of days'),
@@ -192,6 +243,9 @@ class TaskChunkSeries(models.Model):
 
     last_scheduled_day = models.DateField(null=True)
     completely_scheduled = models.BooleanField(default=False)
+    # the day of the next occurrence that is not scheduled yet; null if
+    # it is not known
+    next_due_day = models.DateField(null=True)
 
     rule = models.CharField(max_length=15, choices=RULE_CHOICES)
 
@@ -221,7 +275,12 @@ class TaskChunkSeries(models.Model):
     def __str__(self) -> str:
         return '{}: {}'.format(self.task, self.rule)
 
-    @transaction.atomic
+    @Change.collect()
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        Change.record(self.task.user_id, series=(self.pk,))
+
+    @Change.collect()
     def clean_scheduled(self) -> List[int]:
         """
         Clean all scheduled chunks which are no longer valid.
@@ -231,11 +290,16 @@ class TaskChunkSeries(models.Model):
         if self.end:
             chunks |= self.chunks.filter(day__gt=self.end)
         ids = [chunk.id for chunk in chunks]
+        days = {chunk.day for chunk in chunks}
         cleaned_duration = sum(chunk.duration for chunk in chunks)
         chunks.delete()
+        DayLoad.refresh(self.task.user_id, days)
+        Change.record(self.task.user_id, deleted=True, chunk=ids)
 
         self.last_scheduled_day = self.chunks.aggregate(Max('day'))['day__max']
-        self.save(update_fields=('last_scheduled_day',))
+        # the next occurrence is determined again by the next scheduling
+        self.next_due_day = None
+        self.save(update_fields=('last_scheduled_day', 'next_due_day'))
 
         self.task.duration = F('duration') - cleaned_duration
         self.task.save(update_fields=('duration',))
@@ -244,50 +308,41 @@ class TaskChunkSeries(models.Model):
 
         return ids
 
-    @transaction.atomic
+    @Change.collect()
     def schedule(
             self,
-            max_count: int = 50,
-            max_advance: timedelta = timedelta(days=365)) -> List['TaskChunk']:
+            max_count: int = DEFAULT_MAX_COUNT,
+            max_advance: timedelta = DEFAULT_MAX_ADVANCE) -> List['TaskChunk']:
         """
         Schedule (more) task chunks for this series.
         Creates at most max_count new instances and at most max_advance days
         into the future.
         """
-        new_instances = []
-        day = self.last_scheduled_day
-        advance_base = date.today()
-        for i in range(max_count):
-            day = self.apply_rule(day)
-
-            if day is None:
-                # no further instance to schedule, complete now
-                self.completely_scheduled = True
-                self.save(update_fields=('completely_scheduled',))
-                break
-
-            if advance_base:
-                advance = day - advance_base
-                if advance > max_advance:
-                    # reached limit for this schedule
-                    break
-
-            # TODO: find a way to determine the day order by a subquery
-            # to prevent using a single query for each day
-            # (or, at least, bundle the days and aggregate all day orders
-            # at once)
-            new_instances.append(
-                TaskChunk(
-                    task=self.task,
-                    series=self,
-                    day=day,
-                    day_order=TaskChunk.get_next_day_order(self.task.user, day),
-                    duration=self.duration,
-                ))
+        start = perf_counter()
+        days, self.next_due_day = self.upcoming_days(max_count, max_advance)
+        if self.next_due_day is None:
+            # no further instance to schedule, complete now
+            self.completely_scheduled = True
+        self.save(update_fields=('completely_scheduled', 'next_due_day'))
+
+        # determine the day orders of all days at once
+        day_orders = TaskChunk.get_next_day_orders(self.task.user_id, days)
+        new_instances = [
+            TaskChunk(
+                task=self.task,
+                series=self,
+                day=day,
+                day_order=day_orders[day],
+                duration=self.duration,
+            )
+            for day in days
+        ]
 
         if new_instances:
             # create the new instances
             TaskChunk.objects.bulk_create(new_instances)
+            DayLoad.refresh(self.task.user_id, days)
+            Change.record(self.task.user_id, chunk=[chunk.pk for chunk in new_instances])
             self.last_scheduled_day = new_instances[-1].day
             self.save(update_fields=('last_scheduled_day',))
 
@@ -297,8 +352,32 @@ class TaskChunkSeries(models.Model):
             # refresh the task from the db to get the actual duration value
             self.task.refresh_from_db()
 
+        metrics.series_schedule_seconds.observe(perf_counter() - start)
+        metrics.series_scheduled_chunks.observe(len(new_instances))
         return new_instances
 
+    def upcoming_days(
+            self, max_count: int,
+            max_advance: timedelta) -> Tuple[List[date], Optional[date]]:
+        """
+        Determine the days of the occurrences following the last scheduled
+        day, at most max_count of them and at most max_advance days into
+        the future.
+        Returns these days and the day of the next occurrence after them,
+        which is None if the series ends before.
+        """
+        days = []
+        horizon = date.today() + max_advance
+        for day in self.recurrence.occurrences(self.last_scheduled_day):
+            if day > horizon or len(days) >= max_count:
+                return days, day
+            days.append(day)
+        return days, None
+
+    @property
+    def recurrence(self) -> Recurrence:
+        return Recurrence.from_series(self)
+
     def apply_rule(self, last: Optional[date] = None) -> Optional[date]:
         """
         Apply the rule of this task chunk series.
@@ -308,118 +387,40 @@ class TaskChunkSeries(models.Model):
 
         If no further occurrence is to be scheduled, None is returned.
         """
-        if last and last < self.start:
-            # if the start date is modified after chunks are scheduled
-            # already, prevent from scheduling any more chunks before the
-            # start date
-            last = None
-
-        apply = getattr(self, '_apply_{}'.format(self.rule), None)
-        assert apply, 'invalid rule %s' % self.rule
-        next = apply(last)
-
-        if self.end and next > self.end:
-            return None
-
-        return next
-
-    def _apply_interval(self, last: Optional[date]) -> Optional[date]:
-        assert self.interval_days
-
-        if not last:
-            return self.start
-        return last + timedelta(days=self.interval_days)
-
-    def _apply_monthly(self, last: Optional[date], day: Optional[int] = None) -> Optional[date]:
-        assert self.monthly_day or day
-        assert self.monthly_months
-
-        if not day:
-            day = self.monthly_day
-
-        if not last:
-            next = self._replace_day(self.start, day)
-            if next < self.start:
-                next = self._add_months(next, 1)
-            return next
-
-        next = self._add_months(last, self.monthly_months)
-        return self._replace_day(next, day)
-
-    def _apply_monthlyweekday(self, last: Optional[date]) -> Optional[date]:
-        assert self.monthly_months
-        assert self.monthlyweekday_weekday
-        assert self.monthlyweekday_nth
-
-        next = self._apply_monthly(last, 1)
-
-        next = self._advance_to_weekday(next, self.monthlyweekday_weekday)
-        desired_month = next.month
-        for shift in range(self.monthlyweekday_nth - 1):
-            shifted = next + timedelta(days=7)
-            if shifted.month != desired_month:
-                # use last weekday of this month
-                break
-            next = shifted
-
-        return next
-
-    @staticmethod
-    def _add_months(day: date, months: int) -> date:
-        """
-        Add months to a date without changing the day.
-        """
-        day_of_month = day.day
-        new_month = day.month + months - 1
-        while True:
-            # if the target month has fewer days than the initial day, the day needs to be
-            # reduced
-            try:
-                return day.replace(
-                    day=day_of_month,
-                    month=(new_month % 12) + 1,
-                    year=day.year + new_month // 12)
-            except ValueError as e:
-                # if it fails with the 28th (for every month a valid day), something else
-                # causes the problem
-                assert day_of_month > 28, e
-                day_of_month -= 1
-
-    @staticmethod
-    def _advance_to_weekday(day: date, weekday: int) -> date:
-        """
-        Advance a date object until it reaches weekday, leaving it
-        untouched if it is already the right weekday.
-        """
-        while day.weekday() != weekday:
-            day += timedelta(days=1)
-        return day
-
-    @staticmethod
-    def _replace_day(day: date, replace: int) -> date:
-        """
-        Replace the day of the date, using the last day
-        of the month if it is out of range.
-        """
-        try:
-            return day.replace(day=replace)
-        except ValueError:
-            # get the last day of this month
-            day = TaskChunkSeries._add_months(day, 1).replace(day=1)
-            return day - timedelta(days=1)
+        return self.recurrence.first_after(last)
 
 
 class TaskChunk(models.Model):
     """
     A chunk of a task that is scheduled for a specific day.
     """
+    class Meta:
+        # the unfinished chunks are indexed by a partial index as well
+        # (see migration 0017)
+        indexes = (
+            models.Index(fields=('user', 'day', 'day_order')),
+        )
+
+    # the distance between the day orders of appended chunks and of the
+    # chunks of a day after spreading them
+    DAY_ORDER_SPACING = 64
+    MAX_DAY_ORDER = 32767
 
     task = models.ForeignKey(
         Task, on_delete=models.CASCADE, related_name='chunks')
+    # the user of the task, which allows to filter the chunks of a user
+    # without joining their tasks. The composite index starts with the
+    # user, so the user does not need an index of its own.
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+        related_name='chunks', db_index=False)
     series = models.ForeignKey(
         TaskChunkSeries, on_delete=models.SET_NULL, related_name='chunks',
         null=True)
     day = models.DateField()
+    # the position of the chunk within its day. The day orders of a day
+    # may have gaps, which allow to move a chunk between two others by
+    # changing only its own day order (see spreaddayorders).
     day_order = models.SmallIntegerField(validators=(
         MinValueValidator(1),
     ))
@@ -435,14 +436,31 @@ class TaskChunk(models.Model):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
+        if self.user_id is None and not self.pk and TaskChunk.task.is_cached(self):
+            self.user_id = self.task.user_id
+
         if self.day_order is None and not self.pk and self.day and self.task:
             self.day_order = TaskChunk.get_next_day_order(
                 self.task.user, self.day)
 
+        # the day this chunk is stored for, whose load needs to be
+        # updated as well when the chunk is moved to another day
+        self._stored_day = self.day if self.pk else None
+
     def __str__(self) -> str:
         return '{}: {}'.format(self.task, self.day)
 
-    @transaction.atomic
+    @Change.collect()
+    def save(self, *args, **kwargs):
+        if self.user_id is None:
+            self.user_id = self.task.user_id
+        super().save(*args, **kwargs)
+        DayLoad.refresh(self.task.user_id, {self.day, self._stored_day})
+        # the durations of the task change with its chunks
+        Change.record(self.task.user_id, chunk=(self.pk,), task=(self.task_id,))
+        self._stored_day = self.day
+
+    @Change.collect()
     def delete(self, postpone: bool = True):
         """
         Delete this task chunk.
@@ -450,6 +468,8 @@ class TaskChunk(models.Model):
         When not postponed, the duration of the task is reduced by the
         duration of this task chunk.
         """
+        pk = self.pk
+        task_deleted = False
         if not postpone:
             # reduce the tasks duration
 
@@ -459,11 +479,16 @@ class TaskChunk(models.Model):
             task.duration -= self.duration
             if task.duration <= 0:
                 task.delete()
+                task_deleted = True
             else:
                 task.save(update_fields=('duration',))
         super().delete()
+        DayLoad.refresh(self.task.user_id, {self.day})
+        Change.record(self.task.user_id, deleted=True, chunk=(pk,))
+        if not task_deleted:
+            Change.record(self.task.user_id, task=(self.task_id,))
 
-    @transaction.atomic
+    @Change.collect()
     def split(self, duration: Decimal = 1) -> List['TaskChunk']:
         """
         Split this chunk into two, keeping duration for the first
@@ -474,88 +499,237 @@ class TaskChunk(models.Model):
         assert self.duration > duration
         assert not self.finished
 
-        relevant_chunks = TaskChunk.objects.filter(
-            task__user_id=self.task.user_id,
-            day=self.day, day_order__gte=self.day_order).order_by(
-            'day_order').select_for_update()
-
-        # force evaluation of queryset
-        relevant_chunks = list(relevant_chunks)
+        # place the new chunk directly before the chunk following this one
+        following_day_order = TaskChunk.objects.filter(
+            user_id=self.user_id,
+            day=self.day,
+            day_order__gt=self.day_order,
+        ).aggregate(Min('day_order'))['day_order__min']
+        later_chunks = []
+        moved = 0
+        if following_day_order is None:
+            day_order = TaskChunk.following_day_order(self.day_order)
+        else:
+            day_order, moved = TaskChunk.insert_day_order(
+                self.task.user_id, self.day, following_day_order)
+            if moved:
+                later_chunks = list(TaskChunk.objects.filter(
+                    user_id=self.user_id,
+                    day=self.day,
+                    day_order__gt=day_order,
+                ).select_related('task').order_by('day_order'))
+        metrics.split_shifted_chunks.observe(moved)
 
         new_chunk = TaskChunk.objects.create(
             task=self.task,
             day=self.day,
-            day_order=self.day_order + 1,
+            day_order=day_order,
             duration=self.duration - duration)
         self.duration = duration
         self.save(update_fields=('duration',))
 
-        # update duration in relevant_chunks
-        for chunk in relevant_chunks:
-            if chunk.id == self.id:
-                chunk.duration = self.duration
+        return [new_chunk, self] + later_chunks
+
+    @staticmethod
+    def insert_day_order(user, day: date, day_order: int) -> Tuple[int, int]:
+        """
+        Get a day order that places a chunk directly before the chunk
+        which currently has day_order on that day. If there is no such
+        chunk, day_order itself is used.
+
+        If there is a gap between the day order of the preceding chunk
+        and day_order, a day order in the middle of it is used and no
+        other chunk is touched. Otherwise, all chunks from day_order on
+        are moved down.
 
-        # increase all future day orders
-        for chunk in relevant_chunks:
-            if chunk.pk == self.pk:
-                continue
-            chunk.day_order += 1
-            chunk.save(update_fields=('day_order',))
+        Returns the day order and the number of moved chunks.
+        """
+        day_chunks = TaskChunk.objects.filter(
+            user=user,
+            day=day)
+        existing = day_chunks.aggregate(
+            taken=Count('pk', filter=Q(day_order=day_order)),
+            previous=Max('day_order', filter=Q(day_order__lt=day_order)))
+        if not existing['taken']:
+            return day_order, 0
+
+        previous = existing['previous'] or 0
+        if day_order - previous > 1:
+            return previous + (day_order - previous) // 2, 0
+
+        moved = day_chunks.filter(day_order__gte=day_order)
+        moved_ids = list(moved.values_list('pk', flat=True))
+        moved.update(day_order=F('day_order') + 1)
+        Change.record(getattr(user, 'pk', user), chunk=moved_ids)
+        return day_order, len(moved_ids)
 
-        return [new_chunk] + relevant_chunks
+    @staticmethod
+    def following_day_order(day_order: int) -> int:
+        """
+        Get the day order of a chunk appended after the chunk with
+        day_order. A gap of DAY_ORDER_SPACING is left, so moving chunks
+        between appended chunks does not touch any other chunk, unless
+        the day order would exceed MAX_DAY_ORDER.
+        """
+        if day_order + TaskChunk.DAY_ORDER_SPACING <= TaskChunk.MAX_DAY_ORDER:
+            return day_order + TaskChunk.DAY_ORDER_SPACING
+        return day_order + 1
 
     @staticmethod
     def get_next_day_order(user, day):
         """Get the next day order for a specific day."""
-        return (TaskChunk.objects.filter(
-            task__user=user,
-            day=day).aggregate(Max('day_order'))['day_order__max'] or 0) + 1
+        return TaskChunk.get_next_day_orders(user, (day,))[day]
+
+    @staticmethod
+    def get_next_day_orders(user, days: Iterable[date]) -> Dict[date, int]:
+        """
+        Get the next day order for several days using a single query.
+        """
+        days = set(days)
+        if not days:
+            return {}
+
+        max_day_orders = DayLoad.objects.filter(
+            user=user,
+            day__in=days,
+        ).values_list('day', 'max_day_order')
+        day_orders = {
+            day: TaskChunk.following_day_order(0)
+            for day in days
+        }
+        for day, max_day_order in max_day_orders:
+            day_orders[day] = TaskChunk.following_day_order(max_day_order)
+        return day_orders
+
+    @staticmethod
+    def get_scheduled_durations(user, days: Iterable[date]) -> Dict[date, Decimal]:
+        """
+        Get the scheduled duration of several days using a single query.
+        Days without any chunks are omitted.
+        """
+        return dict(DayLoad.objects.filter(
+            user=user,
+            day__in=set(days),
+        ).values_list('day', 'scheduled_duration'))
 
     @staticmethod
     def missed_chunks(user: get_user_model()) -> QuerySet:
         """Get all unfinished task chunks scheduled for a past day."""
         return TaskChunk.objects.filter(
-            task__user=user,
+            user=user,
             day__lt=date.today(),
             finished=False
         ).order_by('day').select_related('task')
 
     @staticmethod
-    def next_day_with_capacity(user: get_user_model(), min_remaining_capacity: Decimal,
-                               max_days: int = 60) -> Union[date, None]:
+    def next_day_with_capacity(user: get_user_model(),
+                               min_remaining_capacity: Decimal) -> Union[date, None]:
         """
         Get the next day on which user has at least min_capacity of
         unscheduled duration left.
+
+        Only the days that have too little capacity left are read from the
+        day loads. The days in between are checked against the weekday and
+        weekend capacities of the user, so the search is not limited to a
+        window and its cost depends on the number of booked days only.
         """
         if min_remaining_capacity > user.workhours_weekday and min_remaining_capacity > user.workhours_weekend:
             # can not fit into a single day
             return None
 
-        today = date.today()
-        max_date = today + timedelta(days=max_days)
+        scanned_days = 0
+
+        def next_day_of_capacity(day: date) -> date:
+            nonlocal scanned_days
+            # terminates within a week as either weekdays or weekends fit
+            while user.capacity_of_day(day) < min_remaining_capacity:
+                scanned_days += 1
+                day += timedelta(days=1)
+            scanned_days += 1
+            return day
+
+        # the week_day lookup uses 1 for sundays and 7 for saturdays
+        weekend = Q(day__week_day__in=(1, 7))
+        booked_weekend = weekend & Q(
+            scheduled_duration__gt=user.workhours_weekend - min_remaining_capacity)
+        booked_weekday = ~weekend & Q(
+            scheduled_duration__gt=user.workhours_weekday - min_remaining_capacity)
+        booked_days = DayLoad.objects.filter(
+            booked_weekend | booked_weekday,
+            user=user,
+            day__gte=date.today(),
+        ).order_by('day').values_list('day', flat=True)
+
+        day = next_day_of_capacity(date.today())
+        for booked_day in booked_days.iterator():
+            if booked_day > day:
+                break
+            if booked_day == day:
+                day = next_day_of_capacity(day + timedelta(days=1))
+        metrics.capacity_days_scanned.observe(scanned_days)
+        return day
 
-        # aggregate scheduled duration for the next days
-        days = TaskChunk.objects.filter(
-            task__user=user,
-            day__gte=today,
-            day__lt=max_date,
-        ).values('day').annotate(
-            scheduled_duration=Sum('duration'))
-        days = {
-            row['day']: row['scheduled_duration']
-            for row in days
-        }
 
-        # search for the earliest day with enough remaining capacity
-        day = today
-        while day < max_date:
-            total_capacity = user.capacity_of_day(day)
-            scheduled_duration = days.get(day, 0)
-            remaining_capacity = total_capacity - scheduled_duration
+class DayLoad(models.Model):
+    """
+    The aggregated chunks of a single day of a user.
+    Day loads are kept up to date by all writes to task chunks, which
+    allows to determine capacities and day orders without aggregating
+    the chunks themselves.
+    """
+    class Meta:
+        unique_together = (
+            'user',
+            'day',
+        )
 
-            if remaining_capacity >= min_remaining_capacity:
-                return day
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+        related_name='day_loads')
+    day = models.DateField()
+
+    scheduled_duration = models.DecimalField(
+        max_digits=6, decimal_places=2, default=0)
+    finished_duration = models.DecimalField(
+        max_digits=6, decimal_places=2, default=0)
+    chunk_count = models.IntegerField(default=0)
+    max_day_order = models.SmallIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return '{}: {}'.format(self.user, self.day)
 
-            day += timedelta(days=1)
+    @property
+    def capacity(self) -> Decimal:
+        return self.user.capacity_of_day(self.day)
 
-        return None
+    @staticmethod
+    @transaction.atomic(savepoint=False)
+    def refresh(user_id: int, days: Iterable[Optional[date]]):
+        """
+        Recompute the loads of several days of a user from their chunks.
+        """
+        days = {day for day in days if day}
+        if not days:
+            return
+
+        # concurrent writes of chunks of the same days would otherwise
+        # aggregate without each other's chunks, or collide when
+        # inserting the loads. The aggregate runs after the lock is
+        # acquired, so it includes the chunks of the preceding writes.
+        get_user_model().lock(user_id)
+
+        loads = TaskChunk.objects.filter(
+            user_id=user_id,
+            day__in=days,
+        ).values('day').annotate(
+            scheduled_duration=Sum('duration'),
+            finished_duration=Coalesce(
+                Sum('duration', filter=Q(finished=True)),
+                0),
+            chunk_count=Count('pk'),
+            max_day_order=Max('day_order'))
+
+        DayLoad.objects.filter(user_id=user_id, day__in=days).delete()
+        DayLoad.objects.bulk_create(
+            DayLoad(user_id=user_id, **load)
+            for load in loads)
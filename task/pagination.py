@@ -0,0 +1,131 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from collections import OrderedDict
+from typing import Any, List, Optional
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import F, Q, QuerySet
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    A pagination which continues after the last object of the previous
+    page, using the values of the ordering fields of that object as
+    cursor. Unlike offset pagination, the pages stay stable when
+    objects are inserted or deleted in the meantime and later pages are
+    not slower to get than the first one.
+
+    The pagination is only used if a page_size or cursor is provided.
+    The ordering fields need to identify every object uniquely.
+    """
+    ordering = ('id',)
+    # ordering fields for which null values precede all other values
+    nulls_first = ()
+
+    default_page_size = 100
+    max_page_size = 1000
+
+    def paginate_queryset(self, queryset: QuerySet, request, view=None) -> Optional[List]:
+        if 'page_size' not in request.query_params and 'cursor' not in request.query_params:
+            return None
+
+        class ParameterSerializer(serializers.Serializer):
+            page_size = serializers.IntegerField(
+                default=self.default_page_size, min_value=1, max_value=self.max_page_size)
+            cursor = serializers.CharField(required=False)
+        params = ParameterSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+
+        queryset = queryset.order_by(*(
+            F(field).asc(nulls_first=True) if field in self.nulls_first else field
+            for field in self.ordering
+        ))
+        cursor = params.validated_data.get('cursor')
+        if cursor:
+            queryset = queryset.filter(self._following(
+                self._decode_cursor(queryset, cursor)))
+
+        page_size = params.validated_data['page_size']
+        page = list(queryset[:page_size + 1])
+
+        self.request = request
+        self.next_cursor = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            self.next_cursor = self._encode_cursor(page[-1])
+        return page
+
+    def get_paginated_response(self, data) -> Response:
+        return Response(OrderedDict((
+            ('next', self.get_next_link()),
+            ('results', data),
+        )))
+
+    def get_next_link(self) -> Optional[str]:
+        if not self.next_cursor:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(), 'cursor', self.next_cursor)
+
+    def _following(self, values: List[Any]) -> Q:
+        """
+        Get the condition for objects following the object with the
+        provided values of the ordering fields.
+        """
+        condition = Q()
+        for index in reversed(range(len(self.ordering))):
+            field = self.ordering[index]
+            value = values[index]
+
+            if value is None:
+                # null values precede all other values
+                greater = Q(**{field + '__isnull': False})
+                equal = Q(**{field + '__isnull': True})
+            else:
+                greater = Q(**{field + '__gt': value})
+                equal = Q(**{field: value})
+
+            if index == len(self.ordering) - 1:
+                condition = greater
+            else:
+                condition = greater | (equal & condition)
+        return condition
+
+    def _encode_cursor(self, instance) -> str:
+        values = [
+            getattr(instance, field)
+            for field in self.ordering
+        ]
+        return urlsafe_b64encode(
+            json.dumps(values, default=str).encode()).decode()
+
+    def _decode_cursor(self, queryset: QuerySet, cursor: str) -> List[Any]:
+        try:
+            values = json.loads(urlsafe_b64decode(cursor.encode()).decode())
+            if not isinstance(values, list) or len(values) != len(self.ordering) or \
+                    any(isinstance(value, (list, dict)) for value in values):
+                raise ValueError
+            return [
+                None if value is None else
+                queryset.model._meta.get_field(field).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except (BinasciiError, DjangoValidationError, TypeError, UnicodeDecodeError, ValueError):
+            raise ValidationError({
+                'cursor': 'invalid cursor'
+            })
+
+
+class TaskPagination(KeysetPagination):
+    ordering = ('start', 'name', 'id')
+    nulls_first = ('start',)
+
+
+class TaskChunkPagination(KeysetPagination):
+    ordering = ('day', 'day_order', 'id')
@@ -0,0 +1,189 @@
+"""
+Planning of chunks for the unscheduled duration of tasks.
+"""
+import heapq
+from array import array
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Tuple
+
+
+from base.models import Change
+from .models import DayLoad, Task, TaskChunk
+
+# the number of days planned ahead by plan_by_deadline
+DEFAULT_HORIZON = 365
+
+
+def chunk_durations(user, duration: Decimal) -> List[Decimal]:
+    """
+    Split a duration into the durations of chunks based on the
+    scheduling defaults of the user.
+
+    Durations up to default_schedule_full_duration_max are scheduled
+    as a single chunk, larger ones in chunks of default_schedule_duration.
+    No chunk exceeds the capacity of a single day.
+    """
+    max_duration = max(user.workhours_weekday, user.workhours_weekend)
+    if duration <= 0 or max_duration <= 0:
+        return []
+
+    chunk_duration = user.default_schedule_duration
+    if chunk_duration <= 0:
+        chunk_duration = duration
+    chunk_duration = min(chunk_duration, max_duration)
+    full_duration_max = min(user.default_schedule_full_duration_max, max_duration)
+
+    durations = []
+    while duration > full_duration_max and duration > chunk_duration:
+        durations.append(chunk_duration)
+        duration -= chunk_duration
+    durations.append(duration)
+    return durations
+
+
+def plan_greedily(user, tasks: Iterable[Task]) -> List[TaskChunk]:
+    """
+    Plan chunks for the unscheduled duration of tasks, filling the
+    free capacity of the upcoming days.
+
+    The tasks are planned by descending priority, then by deadline and
+    start. Each chunk is placed on the first day (not before the start
+    of its task) with enough capacity left.
+    The returned chunks are not saved yet.
+    """
+    today = date.today()
+    tasks = sorted(tasks, key=lambda task: (
+        -task.priority,
+        task.deadline or date.max,
+        task.start or date.min,
+        task.pk))
+
+    scheduled_durations, day_orders = _load_days(user, today)
+
+    chunks = []
+    for task in tasks:
+        day = today
+        if task.start and task.start > day:
+            day = task.start
+
+        for duration in chunk_durations(user, task.unscheduled_duration):
+            while user.capacity_of_day(day) - scheduled_durations.get(day, 0) < duration:
+                day += timedelta(days=1)
+
+            scheduled_durations[day] = scheduled_durations.get(day, 0) + duration
+            day_orders[day] = TaskChunk.following_day_order(day_orders.get(day, 0))
+            chunks.append(TaskChunk(
+                task=task,
+                day=day,
+                day_order=day_orders[day],
+                duration=duration))
+
+    return chunks
+
+
+def plan_by_deadline(
+        user, tasks: Iterable[Task],
+        horizon: int = DEFAULT_HORIZON) -> Tuple[List[TaskChunk], List[Task]]:
+    """
+    Plan chunks for the unscheduled duration of tasks by their earliest
+    deadline, which minimises the delay of the latest task.
+
+    The days of the horizon are filled one after another, always with
+    the released (i.e. started) task with the earliest deadline. Tasks
+    without a deadline follow by descending priority. A task gets at
+    most a single chunk per day.
+
+    Returns the unsaved chunks and the tasks which miss their deadline
+    or cannot be planned completely within the horizon.
+    """
+    today = date.today()
+    scheduled_durations, day_orders = _load_days(user, today)
+
+    # free capacity of the days of the horizon in hundredths of an hour
+    days = [today + timedelta(days=offset) for offset in range(horizon)]
+    free = array('l', (
+        max(0, _hundredths(user.capacity_of_day(day) - scheduled_durations.get(day, 0)))
+        for day in days))
+
+    remaining = {}  # type: Dict[int, int]
+    releases = []  # type: List[Tuple[int, int, Task]]
+    for task in tasks:
+        duration = _hundredths(task.unscheduled_duration)
+        if duration <= 0:
+            continue
+        remaining[task.pk] = duration
+        release = 0
+        if task.start and task.start > today:
+            release = (task.start - today).days
+        releases.append((release, task.pk, task))
+    releases.sort(key=lambda release: release[:2])
+
+    chunks = []
+    late_tasks = []
+    pending = []  # type: List[Tuple[date, int, int, Task]]
+    next_release = 0
+    offset = 0
+    while offset < horizon and (pending or next_release < len(releases)):
+        if not pending:
+            # skip the days without any released task
+            offset = max(offset, releases[next_release][0])
+            if offset >= horizon:
+                break
+        while next_release < len(releases) and releases[next_release][0] <= offset:
+            task = releases[next_release][2]
+            heapq.heappush(pending, (
+                task.deadline or date.max, -task.priority, task.pk, task))
+            next_release += 1
+
+        day = days[offset]
+        while free[offset] > 0 and pending:
+            deadline, _, pk, task = pending[0]
+            duration = min(free[offset], remaining[pk])
+            free[offset] -= duration
+            remaining[pk] -= duration
+            day_orders[day] = TaskChunk.following_day_order(day_orders.get(day, 0))
+            chunks.append(TaskChunk(
+                task=task,
+                day=day,
+                day_order=day_orders[day],
+                duration=Decimal(duration) / 100))
+            if remaining[pk] == 0:
+                heapq.heappop(pending)
+                if deadline < day:
+                    late_tasks.append(task)
+        offset += 1
+
+    late_tasks.extend(task for _, _, _, task in pending)
+    late_tasks.extend(task for _, _, task in releases[next_release:])
+    return chunks, late_tasks
+
+
+@Change.collect()
+def save_plan(user, chunks: List[TaskChunk]):
+    """
+    Create the planned chunks.
+    """
+    TaskChunk.objects.bulk_create(chunks)
+    DayLoad.refresh(user.pk, {chunk.day for chunk in chunks})
+    Change.record(
+        user.pk,
+        chunk=[chunk.pk for chunk in chunks],
+        task={chunk.task_id for chunk in chunks})
+
+
+def _hundredths(duration: Decimal) -> int:
+    return int(duration * 100)
+
+
+def _load_days(user, today: date) -> Tuple[Dict[date, Decimal], Dict[date, int]]:
+    """
+    Get the scheduled duration and the maximum day order of all days
+    of the user from today on.
+    """
+    scheduled_durations = {}  # type: Dict[date, Decimal]
+    day_orders = {}  # type: Dict[date, int]
+    for load in DayLoad.objects.filter(user=user, day__gte=today):
+        scheduled_durations[load.day] = load.scheduled_duration
+        day_orders[load.day] = load.max_day_order
+    return scheduled_durations, day_orders
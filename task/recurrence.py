@@ -0,0 +1,199 @@
+"""
+Date arithmetic for the rules of task chunk series.
+
+Every occurrence of a rule is computed in closed form from its index,
+so generating a sequence of occurrences or skipping to the occurrences
+within a range of days never requires to iterate day by day.
+"""
+import calendar
+from datetime import date, timedelta
+from itertools import count
+from typing import Iterator, Optional
+
+
+def days_in_month(year: int, month: int) -> int:
+    return calendar.monthrange(year, month)[1]
+
+
+def month_index(day: date) -> int:
+    """
+    Get the number of months since the beginning of year 0.
+    """
+    return day.year * 12 + day.month - 1
+
+
+def month_day(index: int, day: int) -> date:
+    """
+    Get the date of a day of the month with the provided month index,
+    using the last day of the month if it is out of range.
+    """
+    year, month = divmod(index, 12)
+    month += 1
+    return date(year, month, min(day, days_in_month(year, month)))
+
+
+def add_months(day: date, months: int) -> date:
+    """
+    Add months to a date without changing the day.
+    If the target month has fewer days than the initial day, the last
+    day of the target month is used.
+    """
+    return month_day(month_index(day) + months, day.day)
+
+
+def advance_to_weekday(day: date, weekday: int) -> date:
+    """
+    Advance a date object until it reaches weekday, leaving it
+    untouched if it is already the right weekday.
+    """
+    return day + timedelta(days=(weekday - day.weekday()) % 7)
+
+
+def replace_day(day: date, replace: int) -> date:
+    """
+    Replace the day of the date, using the last day
+    of the month if it is out of range.
+    """
+    return month_day(month_index(day), replace)
+
+
+def nth_weekday(index: int, weekday: int, nth: int) -> date:
+    """
+    Get the nth weekday of the month with the provided month index.
+    If the month has fewer than n instances of that weekday, the last
+    of that month is used.
+    """
+    first = advance_to_weekday(month_day(index, 1), weekday)
+    remaining_weeks = (days_in_month(first.year, first.month) - first.day) // 7
+    return first + timedelta(days=7 * min(nth - 1, remaining_weeks))
+
+
+class Recurrence:
+    """
+    The rule of a task chunk series.
+
+    Occurrences are identified by their index, counting from the first
+    occurrence following the last scheduled day (or, if there is none,
+    from the start of the series).
+    """
+
+    def __init__(
+            self, rule: str, start: date, end: Optional[date] = None,
+            interval_days: Optional[int] = None,
+            monthly_day: Optional[int] = None,
+            monthly_months: Optional[int] = None,
+            monthlyweekday_weekday: Optional[int] = None,
+            monthlyweekday_nth: Optional[int] = None):
+        self.rule = rule
+        self.start = start
+        self.end = end
+        self.interval_days = interval_days
+        self.monthly_day = monthly_day
+        self.monthly_months = monthly_months
+        self.monthlyweekday_weekday = monthlyweekday_weekday
+        self.monthlyweekday_nth = monthlyweekday_nth
+
+        if rule == 'interval':
+            assert self.interval_days
+        elif rule == 'monthly':
+            assert self.monthly_day
+            assert self.monthly_months
+        elif rule == 'monthlyweekday':
+            assert self.monthly_months
+            assert self.monthlyweekday_weekday is not None
+            assert self.monthlyweekday_nth
+        else:
+            assert False, 'invalid rule %s' % rule
+
+    @classmethod
+    def from_series(cls, series) -> 'Recurrence':
+        """
+        Get the recurrence of a task chunk series, which does not need
+        to be saved.
+        """
+        return cls(
+            rule=series.rule,
+            start=series.start,
+            end=series.end,
+            interval_days=series.interval_days,
+            monthly_day=series.monthly_day,
+            monthly_months=series.monthly_months,
+            monthlyweekday_weekday=series.monthlyweekday_weekday,
+            monthlyweekday_nth=series.monthlyweekday_nth)
+
+    def first_after(self, last: Optional[date] = None) -> Optional[date]:
+        """
+        Find the date on which the next occurrence should be scheduled
+        when the last was scheduled on the provided date.
+
+        If no further occurrence is to be scheduled, None is returned.
+        """
+        return next(self.occurrences(last), None)
+
+    def occurrences(self, last: Optional[date] = None) -> Iterator[date]:
+        """
+        Lazily generate all occurrences following the last one.
+        The sequence is infinite if the series has no end.
+        """
+        return self.between(None, None, last)
+
+    def between(
+            self, min_day: Optional[date], max_day: Optional[date],
+            last: Optional[date] = None) -> Iterator[date]:
+        """
+        Lazily generate the occurrences following the last one that are
+        on or after min_day and on or before max_day.
+        """
+        if last and last < self.start:
+            # if the start date is modified after chunks are scheduled
+            # already, prevent from scheduling any more chunks before the
+            # start date
+            last = None
+
+        if self.rule == 'interval':
+            base = self.start
+            if last:
+                base = last + timedelta(days=self.interval_days)
+
+            def occurrence(index: int) -> date:
+                return base + timedelta(days=index * self.interval_days)
+
+            first_index = 0
+            if min_day and min_day > base:
+                # round up to the first occurrence on or after min_day
+                first_index = -((base - min_day).days // self.interval_days)
+        else:
+            if self.rule == 'monthly':
+                def day_of_month(index: int) -> date:
+                    return month_day(index, self.monthly_day)
+            else:
+                def day_of_month(index: int) -> date:
+                    return nth_weekday(
+                        index, self.monthlyweekday_weekday, self.monthlyweekday_nth)
+
+            if last:
+                base = month_index(last) + self.monthly_months
+            else:
+                # the first occurrence is in the month after the start if
+                # the day of the rule (the first of the month for weekday
+                # rules) is before the start
+                base = month_index(self.start)
+                rule_day = self.monthly_day if self.rule == 'monthly' else 1
+                if month_day(base, rule_day) < self.start:
+                    base += 1
+
+            def occurrence(index: int) -> date:
+                return day_of_month(base + index * self.monthly_months)
+
+            first_index = 0
+            if min_day:
+                # round up to the first month on or after the month of min_day
+                first_index = max(0, -((base - month_index(min_day)) // self.monthly_months))
+                if occurrence(first_index) < min_day:
+                    first_index += 1
+
+        for index in count(first_index):
+            day = occurrence(index)
+            if (self.end and day > self.end) or (max_day and day > max_day):
+                return
+            yield day
@@ -4,12 +4,14 @@ from decimal import Decimal
 from typing import DefaultDict, List
 
 from django.core.exceptions import ObjectDoesNotExist
-from django.db import transaction
 from django.db.models import F
 from rest_framework import serializers
 from rest_framework.exceptions import ErrorDetail, ValidationError
 
-from .models import Task, TaskChunk, TaskChunkSeries
+from base.models import Change
+from label.serializers import LabelSerializer
+from . import metrics
+from .models import DayLoad, Task, TaskChunk, TaskChunkSeries
 
 
 class TaskLabelsField(serializers.PrimaryKeyRelatedField):
@@ -77,10 +79,17 @@ class TaskSerializer(serializers.ModelSerializer):
 
         return validated_data
 
+    # the labels are set after saving the task, which must not commit
+    # the revision of the change before
+    @Change.collect()
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
         return super().create(validated_data)
 
+    @Change.collect()
+    def update(self, instance, validated_data):
+        return super().update(instance, validated_data)
+
 
 class DayOrScheduleField(serializers.DateField):
     """
@@ -110,7 +119,7 @@ class DayOrScheduleField(serializers.DateField):
             day = task.get_day_for_scheduling(
                 data, duration)
             if day is None:
-                raise ValidationError('no free capacity found in the near future')
+                raise ValidationError('the duration does not fit into the capacity of a single day')
             return day
 
         return super().to_internal_value(data)
@@ -152,7 +161,7 @@ class TaskChunkSerializer(serializers.ModelSerializer):
     task_id = TaskIdRelatedField(write_only=True)
 
     def create(self, validated_data):
-        with transaction.atomic():
+        with Change.collect():
             if 'duration' in validated_data:
                 task = Task.objects.get(pk=validated_data['task_id'])
                 duration_delta = validated_data['duration'] - task.unscheduled_duration
@@ -162,7 +171,7 @@ class TaskChunkSerializer(serializers.ModelSerializer):
 
             return super().create(validated_data)
 
-    @transaction.atomic
+    @Change.collect()
     def update(self, instance, validated_data):
         if 'duration' in validated_data:
             duration_delta = validated_data['duration'] - instance.duration
@@ -178,14 +187,11 @@ class TaskChunkSerializer(serializers.ModelSerializer):
             if not day:
                 day = instance.day
 
-            day_chunks = TaskChunk.objects.filter(
-                task__user=self.context['request'].user,
-                day=day)
-            if day_chunks.filter(day_order=day_order).exists():
-                # existing day order was provided, move all other chunks down
-                day_chunks.filter(
-                    day_order__gte=day_order
-                ).update(day_order=F('day_order') + 1)
+            # if an existing day order was provided, place the chunk before
+            # the chunk that has it
+            day_order, moved = TaskChunk.insert_day_order(
+                self.context['request'].user, day, day_order)
+            metrics.update_shifted_chunks.observe(moved)
 
         if new_day and new_day != instance.day and not day_order:
             # moved to another day without specifying new order, determine it
@@ -194,8 +200,7 @@ class TaskChunkSerializer(serializers.ModelSerializer):
         if day_order:
             validated_data['day_order'] = day_order
 
-        if hasattr(instance.task, '_prefetched_objects_cache'):
-            del instance.task._prefetched_objects_cache
+        instance.task.clear_durations()
 
         return super().update(instance, validated_data)
 
@@ -295,12 +300,16 @@ class TaskChunkSeriesSerializer(serializers.ModelSerializer):
 
         return data
 
-    @transaction.atomic
+    @Change.collect()
     def update(self, instance, validated_data):
         if validated_data['duration'] != instance.duration:
             # duration changed, update chunks duration
-            updated = instance.chunks.filter(duration=instance.duration).update(
+            chunks = instance.chunks.filter(duration=instance.duration)
+            chunk_days = list(chunks.values_list('pk', 'day'))
+            updated = chunks.update(
                 duration=validated_data['duration'])
+            DayLoad.refresh(instance.task.user_id, {day for _, day in chunk_days})
+            Change.record(instance.task.user_id, chunk=[pk for pk, _ in chunk_days])
             additional_duration = updated * (validated_data['duration'] - instance.duration)
             instance.task.duration = F('duration') + additional_duration
             instance.task.save(update_fields=('duration',))
@@ -339,3 +348,148 @@ class TaskChunkSeriesSerializer(serializers.ModelSerializer):
             raise ValidationError('monthly day must be the same as the day of the start date')
 
         return monthly_day
+
+
+class TaskChunkCompactSerializer(serializers.ModelSerializer):
+    """
+    A read-only representation of task chunks which references the
+    task by its id only.
+    """
+    class Meta:
+        model = TaskChunk
+        fields = (
+            'id',
+            'task_id',
+            'series',
+            'day',
+            'day_order',
+            'duration',
+            'finished',
+            'notes',
+        )
+        read_only_fields = fields
+    task_id = serializers.IntegerField(read_only=True)
+    series = serializers.PrimaryKeyRelatedField(read_only=True)
+
+
+class LabelImportSerializer(LabelSerializer):
+    """
+    Validate imported labels. Labels with the title of an existing
+    label are merged into it by the import.
+    """
+
+    def validate_title(self, value: str) -> str:
+        return value
+
+
+class TaskImportSerializer(TaskSerializer):
+    """
+    Validate imported tasks, which reference their labels by the ids of
+    the import.
+    """
+    labels = serializers.ListField(
+        required=False, child=serializers.IntegerField())
+
+
+class TaskChunkSeriesImportSerializer(TaskChunkSeriesSerializer):
+    """
+    Validate imported series, which reference their task by the id of
+    the import and may have started in the past.
+    """
+    task_id = serializers.IntegerField()
+
+    def validate_start(self, value: date) -> date:
+        return value
+
+
+class TaskChunkImportSerializer(serializers.ModelSerializer):
+    """
+    Validate imported task chunks, which reference their task and
+    series by the ids of the import.
+    """
+    class Meta:
+        model = TaskChunk
+        fields = (
+            'task_id',
+            'series',
+            'day',
+            'day_order',
+            'duration',
+            'finished',
+            'notes',
+        )
+    task_id = serializers.IntegerField()
+    series = serializers.IntegerField(required=False, allow_null=True)
+    day_order = serializers.IntegerField(required=False)
+
+
+class TaskChunkOperationSerializer(serializers.Serializer):
+    """
+    A single operation on a task chunk within a batch.
+    """
+    OPERATIONS = (
+        'create',
+        'update',
+        'finish',
+        'move',
+        'delete',
+    )
+
+    op = serializers.ChoiceField(choices=OPERATIONS)
+    id = serializers.IntegerField(required=False)
+    task_id = serializers.IntegerField(required=False)
+    day = serializers.DateField(required=False)
+    day_order = serializers.IntegerField(
+        required=False, min_value=1, max_value=TaskChunk.MAX_DAY_ORDER)
+    duration = serializers.DecimalField(
+        required=False, max_digits=4, decimal_places=2, min_value=Decimal('0.01'))
+    finished = serializers.BooleanField(required=False)
+    notes = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+    postpone = serializers.BooleanField(default=True)
+
+    def validate(self, data):
+        validated_data = super().validate(data)
+
+        if validated_data['op'] == 'create':
+            required = ('task_id', 'day', 'duration')
+        elif validated_data['op'] == 'move':
+            required = ('id', 'day')
+        else:
+            required = ('id',)
+
+        errors = {
+            field: ErrorDetail('This field is required.', code='required')
+            for field in required
+            if field not in validated_data
+        }
+        if errors:
+            raise ValidationError(errors)
+
+        return validated_data
+
+
+class TaskChunkSeriesPreviewSerializer(serializers.Serializer):
+    """
+    A chunk that would be scheduled for a series, together with the
+    projected load of its day.
+    """
+    day = serializers.DateField()
+    duration = serializers.DecimalField(max_digits=4, decimal_places=2)
+    scheduled_duration = serializers.DecimalField(
+        max_digits=5, decimal_places=2,
+        help_text='The duration already scheduled for the day')
+    capacity = serializers.DecimalField(max_digits=4, decimal_places=2)
+
+
+class DayLoadSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DayLoad
+        fields = (
+            'day',
+            'scheduled_duration',
+            'finished_duration',
+            'chunk_count',
+            'capacity',
+        )
+    capacity = serializers.DecimalField(
+        max_digits=4, decimal_places=2, read_only=True)
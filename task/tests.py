@@ -1,21 +1,32 @@
+import json
+import os
+import threading
+from base64 import urlsafe_b64encode
 from datetime import date, timedelta
 from decimal import Decimal
 from io import StringIO
+from tempfile import mkdtemp
+from typing import List
 from urllib.parse import urlencode
 
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ObjectDoesNotExist
-from django.core.management import call_command
-from django.db.models import Q
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
 from django.http import HttpRequest
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
 from freezegun import freeze_time
 from rest_framework import status
 from rest_framework.request import Request
 
+from base import metrics as base_metrics
 from base.tests import AuthenticatedApiTest
 from label.models import Label
-from .models import Task, TaskChunk, TaskChunkSeries
+from . import cache, planning, recurrence, transfer
+from .models import DayLoad, Task, TaskChunk, TaskChunkSeries
 from .serializers import TaskChunkSeriesSerializer
 
 
@@ -93,6 +104,258 @@ class ManagementTest(TestCase):
 
         self.assertIn('scheduled 37 chunks for 3 series', out.getvalue())
 
+    @freeze_time('2010-05-03')
+    def test_schedule_task_chunk_series_batches(self):
+        task1 = Task.objects.create(
+            user=self.user1,
+            name='Testtask',
+            duration=Decimal(2))
+        series1 = TaskChunkSeries.objects.create(
+            task=task1,
+            start=date(2010, 5, 3),
+            duration=Decimal('0.5'),
+            rule='interval',
+            interval_days=182)  # 3 chunks will be scheduled within the next year
+
+        task2 = Task.objects.create(
+            user=self.user2,
+            name='Testtask 2',
+            duration=Decimal(4))
+        series2 = TaskChunkSeries.objects.create(
+            task=task2,
+            start=date(2011, 4, 3),
+            duration=Decimal('2.5'),
+            rule='interval',
+            interval_days=25)  # 2 chunks will be scheduled within the next year
+
+        out = StringIO()
+        call_command('scheduletaskchunkseries', batch_size=1, verbosity=2, stdout=out)
+
+        self.assertEqual(
+            TaskChunk.objects.filter(series=series1).count(),
+            3)
+        self.assertEqual(
+            TaskChunk.objects.filter(series=series2).count(),
+            2)
+
+        self.assertIn('batch 1: scheduled 3 chunks for 1 series', out.getvalue())
+        self.assertIn('batch 2: scheduled 2 chunks for 1 series', out.getvalue())
+        self.assertIn('scheduled 5 chunks for 2 series', out.getvalue())
+
+    def test_schedule_task_chunk_series_invalid_arguments(self):
+        for arguments, message in (
+                (('--batch-size', '0'), '--batch-size must be at least 1'),
+                (('--batch-size', '-1'), '--batch-size must be at least 1'),
+                (('--workers', '0'), '--workers must be at least 1'),
+                (('--workers', '-2'), '--workers must be at least 1')):
+            with self.subTest(arguments=arguments):
+                with self.assertRaisesMessage(CommandError, message):
+                    call_command('scheduletaskchunkseries', *arguments, stdout=StringIO())
+
+    @freeze_time('2010-05-03')
+    def test_schedule_task_chunk_series_failing_batch(self):
+        """
+        Test that a failing batch is reported without stopping the
+        other batches.
+        """
+        task1 = Task.objects.create(
+            user=self.user1,
+            name='Testtask',
+            duration=Decimal(2))
+        # the interval is missing
+        TaskChunkSeries.objects.create(
+            task=task1,
+            start=date(2010, 5, 3),
+            rule='interval')
+
+        task2 = Task.objects.create(
+            user=self.user2,
+            name='Testtask 2',
+            duration=Decimal(4))
+        series2 = TaskChunkSeries.objects.create(
+            task=task2,
+            start=date(2011, 4, 3),
+            duration=Decimal('2.5'),
+            rule='interval',
+            interval_days=25)
+
+        out = StringIO()
+        err = StringIO()
+        with self.assertRaisesMessage(CommandError, '1 of 2 batches failed'):
+            call_command('scheduletaskchunkseries', batch_size=1, stdout=out, stderr=err)
+
+        self.assertIn('batch 1: failed after scheduling 0 chunks for 0 series', err.getvalue())
+        self.assertIn('scheduled 2 chunks for 1 series', out.getvalue())
+        self.assertEqual(
+            TaskChunk.objects.filter(series=series2).count(),
+            2)
+
+    def test_schedule_task_chunk_series_only_due(self):
+        """
+        Test that series are only processed when their next occurrence
+        is within the scheduling horizon.
+        """
+        task1 = Task.objects.create(
+            user=self.user1,
+            name='Testtask',
+            duration=Decimal(2))
+        series1 = TaskChunkSeries.objects.create(
+            task=task1,
+            start=date(2010, 5, 3),
+            duration=Decimal('0.5'),
+            rule='interval',
+            interval_days=182)
+
+        with freeze_time('2010-05-03'):
+            out = StringIO()
+            call_command('scheduletaskchunkseries', stdout=out)
+            self.assertIn('scheduled 3 chunks for 1 series', out.getvalue())
+
+            series1.refresh_from_db()
+            self.assertEqual(
+                series1.next_due_day,
+                date(2011, 10, 31))
+
+            out = StringIO()
+            call_command('scheduletaskchunkseries', stdout=out)
+            self.assertIn('scheduled 0 chunks for 0 series', out.getvalue())
+
+        with freeze_time('2010-10-31'):
+            out = StringIO()
+            call_command('scheduletaskchunkseries', stdout=out)
+            self.assertIn('scheduled 1 chunks for 1 series', out.getvalue())
+
+        self.assertEqual(
+            TaskChunk.objects.filter(series=series1).count(),
+            4)
+
+    @freeze_time('2010-05-03')
+    def test_spread_day_orders(self):
+        task1 = Task.objects.create(
+            user=self.user1,
+            name='Testtask',
+            duration=Decimal(10))
+        task2 = Task.objects.create(
+            user=self.user2,
+            name='Testtask 2',
+            duration=Decimal(10))
+        past_chunk = TaskChunk.objects.create(
+            task=task1,
+            day=date(2010, 5, 2),
+            day_order=1)
+        chunks = [
+            TaskChunk.objects.create(
+                task=task1,
+                day=date(2010, 5, 3),
+                day_order=day_order)
+            for day_order in (1, 2, 5)
+        ]
+        other_chunk = TaskChunk.objects.create(
+            task=task2,
+            day=date(2010, 5, 3),
+            day_order=1)
+
+        out = StringIO()
+        call_command('spreaddayorders', stdout=out)
+        self.assertIn('spread the day orders of 4 chunks on 2 days', out.getvalue())
+
+        for chunk in chunks + [other_chunk, past_chunk]:
+            chunk.refresh_from_db()
+        self.assertListEqual(
+            [chunk.day_order for chunk in chunks],
+            [64, 128, 192])
+        self.assertEqual(
+            other_chunk.day_order,
+            64)
+        self.assertEqual(
+            past_chunk.day_order,
+            1)
+
+        out = StringIO()
+        call_command('spreaddayorders', stdout=out)
+        self.assertIn('spread the day orders of 0 chunks on 0 days', out.getvalue())
+
+    @freeze_time('2001-02-05')
+    def test_plan_tasks(self):
+        task = Task.objects.create(
+            user=self.user1,
+            name='Testtask',
+            deadline=date(2001, 2, 5),
+            duration=Decimal(12))
+
+        out = StringIO()
+        call_command('plantasks', 'johndoe', stdout=out)
+        self.assertIn('late: Testtask', out.getvalue())
+        self.assertIn('planned 2 chunks with 1 late tasks', out.getvalue())
+        self.assertFalse(task.chunks.exists())
+
+        out = StringIO()
+        call_command('plantasks', 'johndoe', '--commit', stdout=out)
+        self.assertIn('created 2 chunks with 1 late tasks', out.getvalue())
+        self.assertListEqual(
+            [
+                (chunk.day, chunk.duration)
+                for chunk in task.chunks.order_by('day')
+            ],
+            [
+                (date(2001, 2, 5), Decimal(10)),
+                (date(2001, 2, 6), Decimal(2)),
+            ])
+
+    def test_import_schedule(self):
+        path = os.path.join(mkdtemp(), 'schedule.ndjson')
+        with open(path, 'w') as file:
+            file.write(
+                '{"type": "task", "data": {"id": 1, "name": "Testtask", "duration": "2"}}\n'
+                '{"type": "chunk", "data": {"task_id": 1, "day": "2010-05-03", "duration": "1"}}\n')
+
+        out = StringIO()
+        call_command('importschedule', 'foobar', path, stdout=out)
+        self.assertIn('imported 0 labels, 1 tasks, 0 series and 1 chunks', out.getvalue())
+        self.assertEqual(
+            self.user2.tasks.get().chunks.count(),
+            1)
+
+
+class ManagementConcurrencyTest(TransactionTestCase):
+    @skipUnlessDBFeature('test_db_allows_multiple_connections')
+    @freeze_time('2010-05-03')
+    def test_schedule_task_chunk_series_workers(self):
+        """
+        Test that concurrent workers schedule every series exactly once.
+        """
+        series_ids = []
+        for user_number in range(6):
+            user = get_user_model().objects.create(
+                username='user{}'.format(user_number))
+            task = Task.objects.create(
+                user=user,
+                name='Testtask',
+                duration=Decimal(2))
+            for interval_days in (91, 182):
+                series_ids.append(TaskChunkSeries.objects.create(
+                    task=task,
+                    start=date(2010, 5, 3),
+                    duration=Decimal('0.5'),
+                    rule='interval',
+                    interval_days=interval_days).pk)
+
+        out = StringIO()
+        call_command('scheduletaskchunkseries', workers=3, batch_size=2, verbosity=2, stdout=out)
+
+        self.assertIn('scheduled 48 chunks for 12 series', out.getvalue())
+        self.assertDictEqual(
+            dict(TaskChunk.objects.values('series').annotate(count=Count('pk')).values_list(
+                'series', 'count')),
+            {
+                series_id: 5 if number % 2 == 0 else 3
+                for number, series_id in enumerate(series_ids)
+            })
+
+        out = StringIO()
+        call_command('scheduletaskchunkseries', workers=3, batch_size=2, stdout=out)
+        self.assertIn('scheduled 0 chunks for 0 series', out.getvalue())
+
 
 class TaskViewSetTest(AuthenticatedApiTest):
     def test_create_task(self):
@@ -749,6 +1012,170 @@ class TaskViewSetTest(AuthenticatedApiTest):
                 '0 Testtask',
             ])
 
+    def test_list_tasks_etag(self):
+        Task.objects.create(
+            user=self.user,
+            name='Testtask',
+            duration=Decimal(2))
+
+        resp = self.client.get('/task/task/')
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_200_OK)
+        etag = resp['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get('/task/task/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(
+            resp['ETag'],
+            etag)
+        # only the authentication accesses the database
+        self.assertFalse(any(
+            'task_task' in query['sql']
+            for query in queries))
+
+        resp = self.client.get('/task/task/?incomplete', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_200_OK)
+
+        for url, data in (
+                ('/task/task/', {'name': 'Other Testtask', 'duration': 1}),
+                ('/label/label/', {'title': 'Label', 'color': 'ff0000'})):
+            resp = self.client.post(url, data)
+            self.assertEqual(
+                resp.status_code,
+                status.HTTP_201_CREATED)
+
+            resp = self.client.get('/task/task/', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(
+                resp.status_code,
+                status.HTTP_200_OK)
+            self.assertNotEqual(
+                resp['ETag'],
+                etag)
+            etag = resp['ETag']
+
+    def test_list_tasks_cached(self):
+        task = Task.objects.create(
+            user=self.user,
+            name='Testtask',
+            duration=Decimal(2))
+        chunk = TaskChunk.objects.create(
+            task=task,
+            day=date(2010, 2, 24),
+            day_order=1,
+            duration=Decimal(2))
+
+        stats = cache.cache_stats()
+        resp = self.client.get('/task/task/')
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_200_OK)
+
+        with CaptureQueriesContext(connection) as queries:
+            cached_resp = self.client.get('/task/task/')
+        self.assertEqual(
+            cached_resp.data,
+            resp.data)
+        # only the authentication accesses the database
+        self.assertFalse(any(
+            'task_task' in query['sql']
+            for query in queries))
+        self.assertEqual(
+            cache.cache_stats(),
+            {
+                'hits': stats['hits'] + 1,
+                'misses': stats['misses'] + 1,
+            })
+        self.assertIn(
+            'todoscheduler_task_cache_hits_total {}'.format(stats['hits'] + 1),
+            base_metrics.exposition().splitlines())
+
+        # writes of chunks invalidate the cached tasks
+        chunk.split(Decimal(1))
+        resp = self.client.get('/task/task/{}/'.format(task.pk))
+        self.assertEqual(
+            resp.data['scheduled_duration'],
+            '2.00')
+        chunk.finished = True
+        chunk.save()
+        resp = self.client.get('/task/task/{}/'.format(task.pk))
+        self.assertEqual(
+            resp.data['finished_duration'],
+            '1.00')
+        chunk.delete()
+        resp = self.client.get('/task/task/')
+        self.assertEqual(
+            [(task['scheduled_duration'], task['finished_duration']) for task in resp.data],
+            [('1.00', '0.00')])
+
+        # other users do not get the cached tasks
+        other_user = get_user_model().objects.create(
+            username='foobar')
+        self.client.force_authenticate(other_user)
+        resp = self.client.get('/task/task/')
+        self.assertEqual(
+            resp.data,
+            [])
+
+    def test_list_tasks_paginated(self):
+        for name, start in (
+                ('A Testtask', None),
+                ('B Testtask', None),
+                ('B Testtask', None),
+                ('0 Testtask', date(2001, 2, 10)),
+                ('1 Testtask', date(2001, 2, 9)),
+                ('2 Testtask', date(2001, 2, 9))):
+            Task.objects.create(
+                user=self.user,
+                name=name,
+                duration=Decimal(2),
+                start=start)
+
+        resp = self.client.get('/task/task/')
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_200_OK)
+        expected_ids = [item['id'] for item in resp.data]
+
+        ids = []
+        url = '/task/task/?page_size=2'
+        while url:
+            resp = self.client.get(url)
+            self.assertEqual(
+                resp.status_code,
+                status.HTTP_200_OK)
+            self.assertLessEqual(
+                len(resp.data['results']),
+                2)
+            ids.extend(item['id'] for item in resp.data['results'])
+            url = resp.data['next']
+        self.assertListEqual(
+            ids,
+            expected_ids)
+
+    def test_list_tasks_paginated_invalid(self):
+        resp = self.client.get('/task/task/?page_size=100000')
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_400_BAD_REQUEST)
+        self.assertSetEqual(
+            set(resp.data),
+            {'page_size'})
+
+        for cursor in ('invalid', urlsafe_b64encode(b'[[1], "a", 1]').decode()):
+            resp = self.client.get('/task/task/', {'cursor': cursor})
+            self.assertEqual(
+                resp.status_code,
+                status.HTTP_400_BAD_REQUEST)
+            self.assertSetEqual(
+                set(resp.data),
+                {'cursor'})
+
     def test_list_incomplete_tasks(self):
         """
         Test the filtering for incomplete tasks.
@@ -827,55 +1254,184 @@ class TaskViewSetTest(AuthenticatedApiTest):
             resp.data[0]['name'],
             'own task')
 
-    def test_merge_task(self):
+    @freeze_time('2001-02-05')
+    def test_plan(self):
+        scheduled_task = Task.objects.create(
+            user=self.user,
+            name='Scheduled Testtask',
+            duration=Decimal(9))
+        TaskChunk.objects.create(
+            task=scheduled_task,
+            day=date(2001, 2, 5),
+            day_order=1,
+            duration=Decimal(9))
         task1 = Task.objects.create(
             user=self.user,
             name='Testtask',
-            duration=Decimal(3))
+            duration=Decimal(2))
         task2 = Task.objects.create(
             user=self.user,
-            name='To be merged Testtask',
-            duration=Decimal(2))
-
-        TaskChunk.objects.create(
-            task=task1,
-            duration=Decimal(1),
-            day=date(2010, 12, 24)),
-        TaskChunk.objects.create(
-            task=task1,
-            duration=Decimal('0.5'),
-            day=date(2010, 12, 24)),
-        TaskChunk.objects.create(
-            task=task1,
-            duration=Decimal('0.5'),
-            day=date(2010, 12, 24)),
-
-        TaskChunk.objects.create(
-            task=task2,
-            duration=Decimal('1.5'),
-            day=date(2010, 12, 24)),
-        TaskChunk.objects.create(
-            task=task2,
-            duration=Decimal('0.5'),
-            day=date(2010, 12, 24)),
+            name='Important Testtask',
+            priority=8,
+            start=date(2001, 2, 6),
+            duration=Decimal(5))
 
-        resp = self.client.post('/task/task/{}/merge/{}/'.format(task1.pk, task2.pk))
+        resp = self.client.post('/task/task/plan/', format='json')
         self.assertEqual(
             resp.status_code,
-            status.HTTP_200_OK)
+            status.HTTP_201_CREATED)
         self.assertEqual(
-            len(resp.data),
-            5)
+            [
+                (chunk['task']['id'], chunk['day'], chunk['day_order'], chunk['duration'])
+                for chunk in resp.data
+            ],
+            [
+                (task2.pk, '2001-02-06', 64, '1.00'),
+                (task2.pk, '2001-02-06', 128, '1.00'),
+                (task2.pk, '2001-02-06', 192, '3.00'),
+                (task1.pk, '2001-02-06', 256, '2.00'),
+            ])
         for chunk in resp.data:
             self.assertEqual(
-                chunk['task']['id'],
-                task1.pk)
+                Decimal(chunk['task']['scheduled_duration']),
+                Decimal(chunk['task']['duration']))
 
-    def test_merge_foreign_task(self):
+        self.assertEqual(
+            TaskChunk.objects.filter(task=scheduled_task).count(),
+            1)
+        self.assertEqual(
+            DayLoad.objects.get(user=self.user, day=date(2001, 2, 6)).scheduled_duration,
+            Decimal(7))
+
+    @freeze_time('2001-02-05')
+    def test_plan_by_deadline(self):
         task1 = Task.objects.create(
             user=self.user,
             name='Testtask',
-            duration=Decimal(3))
+            priority=8,
+            duration=Decimal(2))
+        task2 = Task.objects.create(
+            user=self.user,
+            name='Urgent Testtask',
+            deadline=date(2001, 2, 5),
+            duration=Decimal(9))
+
+        resp = self.client.post('/task/task/plan/', {
+            'strategy': 'deadline',
+        }, format='json')
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_201_CREATED)
+        self.assertEqual(
+            [
+                (chunk['task']['id'], chunk['day'], chunk['duration'])
+                for chunk in resp.data
+            ],
+            [
+                (task2.pk, '2001-02-05', '9.00'),
+                (task1.pk, '2001-02-05', '1.00'),
+                (task1.pk, '2001-02-06', '1.00'),
+            ])
+
+    @freeze_time('2001-02-05')
+    def test_plan_selected_tasks(self):
+        task1 = Task.objects.create(
+            user=self.user,
+            name='Testtask',
+            duration=Decimal(2))
+        task2 = Task.objects.create(
+            user=self.user,
+            name='Other Testtask',
+            duration=Decimal(2))
+        foreign_task = Task.objects.create(
+            user=get_user_model().objects.create(username='foreign'),
+            name='Foreign Testtask',
+            duration=Decimal(2))
+
+        resp = self.client.post('/task/task/plan/', {
+            'task_ids': [task1.pk, foreign_task.pk],
+        }, format='json')
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_201_CREATED)
+        self.assertEqual(
+            len(resp.data),
+            1)
+        self.assertEqual(
+            resp.data[0]['task']['id'],
+            task1.pk)
+        self.assertFalse(task2.chunks.exists())
+        self.assertFalse(foreign_task.chunks.exists())
+
+    @freeze_time('2001-02-05')
+    def test_plan_query_count(self):
+        def plan_query_count(task_count: int) -> int:
+            TaskChunk.objects.all().delete()
+            for i in range(task_count):
+                Task.objects.create(
+                    user=self.user,
+                    name='Testtask {}'.format(i),
+                    duration=Decimal(5))
+            with CaptureQueriesContext(connection) as queries:
+                resp = self.client.post('/task/task/plan/', format='json')
+            self.assertEqual(
+                resp.status_code,
+                status.HTTP_201_CREATED)
+            return len(queries)
+
+        self.assertEqual(
+            plan_query_count(1),
+            plan_query_count(10))
+
+    def test_merge_task(self):
+        task1 = Task.objects.create(
+            user=self.user,
+            name='Testtask',
+            duration=Decimal(3))
+        task2 = Task.objects.create(
+            user=self.user,
+            name='To be merged Testtask',
+            duration=Decimal(2))
+
+        TaskChunk.objects.create(
+            task=task1,
+            duration=Decimal(1),
+            day=date(2010, 12, 24)),
+        TaskChunk.objects.create(
+            task=task1,
+            duration=Decimal('0.5'),
+            day=date(2010, 12, 24)),
+        TaskChunk.objects.create(
+            task=task1,
+            duration=Decimal('0.5'),
+            day=date(2010, 12, 24)),
+
+        TaskChunk.objects.create(
+            task=task2,
+            duration=Decimal('1.5'),
+            day=date(2010, 12, 24)),
+        TaskChunk.objects.create(
+            task=task2,
+            duration=Decimal('0.5'),
+            day=date(2010, 12, 24)),
+
+        resp = self.client.post('/task/task/{}/merge/{}/'.format(task1.pk, task2.pk))
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_200_OK)
+        self.assertEqual(
+            len(resp.data),
+            5)
+        for chunk in resp.data:
+            self.assertEqual(
+                chunk['task']['id'],
+                task1.pk)
+
+    def test_merge_foreign_task(self):
+        task1 = Task.objects.create(
+            user=self.user,
+            name='Testtask',
+            duration=Decimal(3))
         task2 = Task.objects.create(
             user=get_user_model().objects.create(username='foreign'),
             name='Foreign Testtask',
@@ -921,6 +1477,210 @@ class TaskChunkViewSetTest(AuthenticatedApiTest):
             name='Testtask',
             duration=Decimal(2))
 
+    def test_batch(self):
+        self.task.duration = Decimal(5)
+        self.task.save()
+        chunk1 = TaskChunk.objects.create(
+            task=self.task,
+            day=self.day,
+            day_order=1,
+            duration=Decimal(1))
+        chunk2 = TaskChunk.objects.create(
+            task=self.task,
+            day=self.day,
+            day_order=2,
+            duration=Decimal(1))
+        chunk3 = TaskChunk.objects.create(
+            task=self.task,
+            day=self.day2,
+            day_order=1,
+            duration=Decimal(1))
+        chunk4 = TaskChunk.objects.create(
+            task=self.task,
+            day=self.day2,
+            day_order=2,
+            duration=Decimal('0.5'))
+
+        resp = self.client.post('/task/chunk/batch/', {
+            'operations': [
+                {'op': 'finish', 'id': chunk1.pk},
+                {'op': 'move', 'id': chunk2.pk, 'day': '2001-02-04', 'day_order': 1},
+                {'op': 'create', 'task_id': self.task.pk, 'day': '2001-02-03', 'duration': 3},
+                {'op': 'update', 'id': chunk3.pk, 'duration': 2, 'notes': 'foo'},
+                {'op': 'delete', 'id': chunk4.pk, 'postpone': False},
+            ],
+        })
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_200_OK)
+        self.assertListEqual(
+            resp.data['deleted'],
+            [chunk4.pk])
+        self.assertEqual(
+            len(resp.data['chunks']),
+            4)
+        for chunk in resp.data['chunks']:
+            self.assertEqual(
+                chunk['task']['duration'],
+                '7.00')
+            self.assertEqual(
+                chunk['task']['scheduled_duration'],
+                '7.00')
+
+        self.task.refresh_from_db()
+        self.assertEqual(
+            self.task.duration,
+            Decimal(7))
+        self.assertListEqual(
+            [
+                (chunk.day, chunk.day_order, chunk.duration, chunk.finished, chunk.notes)
+                for chunk in self.task.chunks.order_by('day', 'day_order')
+            ],
+            [
+                (self.day, 64, Decimal(1), True, None),
+                (self.day, 128, Decimal(3), False, None),
+                (self.day2, 64, Decimal(1), False, None),
+                (self.day2, 128, Decimal(2), False, 'foo'),
+            ])
+        self.assertEqual(
+            DayLoad.objects.get(user=self.user, day=self.day2).scheduled_duration,
+            Decimal(3))
+        self.assertEqual(
+            DayLoad.objects.get(user=self.user, day=self.day).chunk_count,
+            2)
+
+    def test_batch_renumbered(self):
+        """
+        Test that chunks which are renumbered to place a chunk between
+        them are part of the response and of the changes.
+        """
+        chunks = [
+            TaskChunk.objects.create(
+                task=self.task,
+                day=self.day,
+                day_order=day_order,
+                duration=Decimal(1))
+            for day_order in (1, 2, 3)
+        ]
+        self.user.refresh_from_db()
+        revision = self.user.revision
+
+        resp = self.client.post('/task/chunk/batch/', {
+            'operations': [
+                {'op': 'create', 'task_id': self.task.pk, 'day': '2001-02-03', 'day_order': 2, 'duration': 1},
+            ],
+        })
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_200_OK)
+        new_chunk_id = (
+            set(self.task.chunks.values_list('pk', flat=True)) - {chunk.pk for chunk in chunks}).pop()
+        self.assertListEqual(
+            [(chunk['id'], chunk['day_order']) for chunk in resp.data['chunks']],
+            [(new_chunk_id, 128), (chunks[0].pk, 64), (chunks[1].pk, 192), (chunks[2].pk, 256)])
+
+        resp = self.client.get('/task/changes/', {'since': revision})
+        self.assertSetEqual(
+            {chunk['id'] for chunk in resp.data['chunk']},
+            {new_chunk_id} | {chunk.pk for chunk in chunks})
+
+    def test_batch_delete_task(self):
+        chunk = TaskChunk.objects.create(
+            task=self.task,
+            day=self.day,
+            duration=Decimal(2))
+
+        resp = self.client.post('/task/chunk/batch/', {
+            'operations': [
+                {'op': 'delete', 'id': chunk.pk, 'postpone': False},
+            ],
+        })
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_200_OK)
+        self.assertListEqual(
+            resp.data['deleted'],
+            [chunk.pk])
+        self.assertFalse(Task.objects.filter(pk=self.task.pk).exists())
+
+    def test_batch_invalid(self):
+        chunk = TaskChunk.objects.create(
+            task=self.task,
+            day=self.day,
+            duration=Decimal(2))
+        foreign_chunk = TaskChunk.objects.create(
+            task=Task.objects.create(
+                user=get_user_model().objects.create(username='foobar'),
+                name='Foreign Testtask'),
+            day=self.day,
+            duration=Decimal(1))
+
+        resp = self.client.post('/task/chunk/batch/', {
+            'operations': [
+                {'op': 'finish', 'id': chunk.pk},
+                {'op': 'delete', 'id': foreign_chunk.pk},
+            ],
+        })
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_400_BAD_REQUEST)
+        self.assertSetEqual(
+            set(resp.data['operations']),
+            {1})
+        chunk.refresh_from_db()
+        self.assertFalse(chunk.finished)
+        self.assertTrue(TaskChunk.objects.filter(pk=foreign_chunk.pk).exists())
+
+        resp = self.client.post('/task/chunk/batch/', {
+            'operations': [
+                {'op': 'move', 'id': chunk.pk},
+                {'op': 'create', 'day': '2001-02-03'},
+            ],
+        })
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_400_BAD_REQUEST)
+        self.assertSetEqual(
+            set(resp.data['operations'][0]),
+            {'day'})
+        self.assertSetEqual(
+            set(resp.data['operations'][1]),
+            {'task_id', 'duration'})
+
+    def test_batch_query_count(self):
+        def batch_query_count(operation_count: int) -> int:
+            chunks = [
+                TaskChunk.objects.create(
+                    task=self.task,
+                    day=self.day,
+                    duration=Decimal(1))
+                for _ in range(operation_count)
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                resp = self.client.post('/task/chunk/batch/', {
+                    'operations': [
+                        {'op': 'move', 'id': chunk.pk, 'day': '2001-02-04', 'day_order': 1}
+                        for chunk in chunks
+                    ] + [
+                        {'op': 'finish', 'id': chunk.pk}
+                        for chunk in chunks
+                    ],
+                })
+            self.assertEqual(
+                resp.status_code,
+                status.HTTP_200_OK)
+            return len(queries)
+
+        # the existing chunk of the day needs to be renumbered
+        TaskChunk.objects.create(
+            task=self.task,
+            day=self.day2,
+            day_order=5,
+            duration=Decimal(1))
+        self.assertEqual(
+            batch_query_count(1),
+            batch_query_count(10))
+
     def test_split_task_chunk(self):
         """Test splitting a task chunk."""
         chunk = TaskChunk.objects.create(
@@ -965,7 +1725,7 @@ class TaskChunkViewSetTest(AuthenticatedApiTest):
             Decimal(2))
         self.assertEqual(
             new_chunk.day_order,
-            2)
+            65)
 
     def test_split_task_chunk_custom_duration(self):
         """Test splitting a task chunk."""
@@ -1001,7 +1761,7 @@ class TaskChunkViewSetTest(AuthenticatedApiTest):
             Decimal('0.7'))
         self.assertEqual(
             new_chunk.day_order,
-            2)
+            65)
 
     def test_split_task_chunk_invalid(self):
         """Test splitting a task chunk."""
@@ -1314,6 +2074,95 @@ class TaskChunkViewSetTest(AuthenticatedApiTest):
             task_chunk2.day_order,
             3)
 
+    def test_move_task_chunk_into_gap(self):
+        """
+        Test that moving a task chunk before another one uses the gap
+        between day orders without touching other chunks.
+        """
+        task_chunk1 = TaskChunk.objects.create(
+            task=self.task,
+            day=self.day,
+            duration=Decimal(1),
+            day_order=64
+        )
+        task_chunk2 = TaskChunk.objects.create(
+            task=self.task,
+            day=self.day,
+            duration=Decimal(1),
+            day_order=128
+        )
+        task_chunk3 = TaskChunk.objects.create(
+            task=self.task,
+            day=self.day,
+            duration=Decimal(1),
+            day_order=192
+        )
+
+        resp = self.client.patch('/task/chunk/{}/'.format(task_chunk3.pk), {
+            'day_order': 128,
+        })
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_200_OK)
+        self.assertEqual(
+            resp.data['day_order'],
+            96)
+        task_chunk1.refresh_from_db()
+        task_chunk2.refresh_from_db()
+        task_chunk3.refresh_from_db()
+        self.assertListEqual(
+            [task_chunk1.day_order, task_chunk3.day_order, task_chunk2.day_order],
+            [64, 96, 128])
+
+        resp = self.client.patch('/task/chunk/{}/'.format(task_chunk2.pk), {
+            'day_order': 64,
+        })
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_200_OK)
+        task_chunk1.refresh_from_db()
+        task_chunk2.refresh_from_db()
+        task_chunk3.refresh_from_db()
+        self.assertListEqual(
+            [task_chunk2.day_order, task_chunk1.day_order, task_chunk3.day_order],
+            [32, 64, 96])
+
+    def test_move_created_task_chunk(self):
+        """
+        Test that moving a task chunk between two newly created ones
+        only updates the moved chunk.
+        """
+        chunk_ids = []
+        for _ in range(3):
+            resp = self.client.post('/task/chunk/', {
+                'task_id': self.task.pk,
+                'day': self.day,
+                'duration': '1',
+            })
+            self.assertEqual(
+                resp.status_code,
+                status.HTTP_201_CREATED)
+            chunk_ids.append(resp.data['id'])
+        day_orders = dict(TaskChunk.objects.values_list('pk', 'day_order'))
+
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.patch('/task/chunk/{}/'.format(chunk_ids[2]), {
+                'day_order': day_orders[chunk_ids[1]],
+            })
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_200_OK)
+        self.assertEqual(
+            [
+                query['sql'].split(' WHERE ')[1]
+                for query in queries
+                if query['sql'].startswith('UPDATE "task_taskchunk"')
+            ],
+            ['"task_taskchunk"."id" = {}'.format(chunk_ids[2])])
+        self.assertListEqual(
+            list(TaskChunk.objects.order_by('day_order').values_list('pk', flat=True)),
+            [chunk_ids[0], chunk_ids[2], chunk_ids[1]])
+
     def test_task_chunk_change_day(self):
         """
         Test moving a chunk to another day without specifying a day order.
@@ -1362,7 +2211,7 @@ class TaskChunkViewSetTest(AuthenticatedApiTest):
             self.day)
         self.assertEqual(
             task_chunk5.day_order,
-            5)
+            68)
 
         task_chunk1.refresh_from_db()
         self.assertEqual(
@@ -1440,7 +2289,7 @@ class TaskChunkViewSetTest(AuthenticatedApiTest):
         task_chunk1.refresh_from_db()
         self.assertEqual(
             task_chunk1.day_order,
-            1)
+            64)
         self.assertEqual(
             task_chunk1.day,
             date(2001, 2, 1))
@@ -1766,7 +2615,12 @@ class TaskChunkViewSetTest(AuthenticatedApiTest):
 
     @freeze_time('2001-02-03')
     def test_schedule_next_free_capacity_unavailable(self):
-        """Test scheduling for the next free capacity."""
+        """
+        Test scheduling for the next free capacity when the next 100
+        days are fully booked, which used to be rejected. The search is
+        no longer limited, so the chunk is scheduled on the first day
+        with enough capacity after them.
+        """
         task2 = Task.objects.create(
             user=self.user,
             name='Other Testtask',
@@ -1788,10 +2642,10 @@ class TaskChunkViewSetTest(AuthenticatedApiTest):
         })
         self.assertEqual(
             resp.status_code,
-            status.HTTP_400_BAD_REQUEST)
-        self.assertSetEqual(
-            set(resp.data),
-            {'day'})
+            status.HTTP_201_CREATED)
+        self.assertEqual(
+            resp.data['day'],
+            '2001-05-14')  # 100 days later
 
     @freeze_time('2001-02-03')
     def test_schedule_next_free_capacity_too_long(self):
@@ -1879,12 +2733,246 @@ class TaskChunkViewSetTest(AuthenticatedApiTest):
             set(resp.data),
             {'day', 'duration'})
 
-    def test_task_chunk_nonstrict_date_filter(self):
-        """
-        Test that unfinished chunks from days prior to min_date are
-        included without strict date filtering.
-        """
-        TaskChunk.objects.create(
+    def test_list_etag(self):
+        chunk = TaskChunk.objects.create(
+            task=self.task,
+            duration=1,
+            day=date(2018, 1, 15))
+
+        resp = self.client.get('/task/chunk/?min_date=2018-01-15')
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_200_OK)
+        etag = resp['ETag']
+
+        resp = self.client.get('/task/chunk/?min_date=2018-01-15', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_304_NOT_MODIFIED)
+
+        resp = self.client.patch('/task/chunk/{}/'.format(chunk.pk), {
+            'finished': True,
+        })
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_200_OK)
+        resp = self.client.get('/task/chunk/?min_date=2018-01-15', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_200_OK)
+        etag = resp['ETag']
+
+        resp = self.client.post('/task/chunk/batch/', {
+            'operations': [
+                {'op': 'move', 'id': chunk.pk, 'day': '2018-01-16'},
+            ],
+        })
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_200_OK)
+        resp = self.client.get('/task/chunk/?min_date=2018-01-15', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_200_OK)
+
+    def test_list_paginated(self):
+        chunks = [
+            TaskChunk.objects.create(
+                task=self.task,
+                duration=1,
+                day=day,
+                day_order=day_order)
+            for day, day_order in (
+                (date(2018, 1, 16), 2),
+                (date(2018, 1, 15), 5),
+                (date(2018, 1, 16), 1),
+                (date(2018, 1, 16), 1),
+                (date(2018, 1, 14), 1),
+            )
+        ]
+        TaskChunk.objects.create(
+            task=self.task,
+            duration=1,
+            day=date(2018, 1, 12),
+            finished=True)
+
+        resp = self.client.get('/task/chunk/?' + urlencode({
+            'min_date': '2018-01-13',
+            'page_size': 3,
+        }))
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_200_OK)
+        self.assertListEqual(
+            [chunk['id'] for chunk in resp.data['results']],
+            [chunks[4].pk, chunks[1].pk, chunks[2].pk])
+
+        resp = self.client.get(resp.data['next'])
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_200_OK)
+        self.assertListEqual(
+            [chunk['id'] for chunk in resp.data['results']],
+            [chunks[3].pk, chunks[0].pk])
+        self.assertIsNone(resp.data['next'])
+
+        resp = self.client.get('/task/chunk/?' + urlencode({
+            'min_date': '2018-01-13',
+            'page_size': 3,
+            'compact': True,
+        }))
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_200_OK)
+        self.assertListEqual(
+            [chunk['id'] for chunk in resp.data['results']['chunks']],
+            [chunks[4].pk, chunks[1].pk, chunks[2].pk])
+        self.assertSetEqual(
+            set(resp.data['results']['tasks']),
+            {self.task.pk})
+        self.assertIsNotNone(resp.data['next'])
+
+    def test_list_compact(self):
+        other_task = Task.objects.create(
+            user=self.user,
+            name='Other Testtask',
+            duration=Decimal(5))
+        TaskChunk.objects.create(
+            task=self.task,
+            duration=2,
+            day=date(2018, 1, 15),
+            finished=True)
+        TaskChunk.objects.create(
+            task=self.task,
+            duration=1,
+            day=date(2018, 1, 16))
+        TaskChunk.objects.create(
+            task=other_task,
+            duration=3,
+            day=date(2018, 1, 16))
+        TaskChunk.objects.create(
+            task=other_task,
+            duration=2,
+            day=date(2018, 1, 2),
+            finished=True)
+
+        resp = self.client.get('/task/chunk/?' + urlencode({
+            'compact': True,
+            'min_date': '2018-01-15',
+        }))
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_200_OK)
+        self.assertSetEqual(
+            set(resp.data),
+            {'chunks', 'tasks'})
+        self.assertEqual(
+            len(resp.data['chunks']),
+            3)
+        self.assertNotIn('task', resp.data['chunks'][0])
+        self.assertSetEqual(
+            {chunk['task_id'] for chunk in resp.data['chunks']},
+            {self.task.pk, other_task.pk})
+        self.assertSetEqual(
+            set(resp.data['tasks']),
+            {self.task.pk, other_task.pk})
+        self.assertEqual(
+            resp.data['tasks'][self.task.pk]['scheduled_duration'],
+            '3.00')
+        self.assertEqual(
+            resp.data['tasks'][self.task.pk]['finished_duration'],
+            '2.00')
+        self.assertEqual(
+            resp.data['tasks'][other_task.pk]['scheduled_duration'],
+            '5.00')
+        self.assertEqual(
+            resp.data['tasks'][other_task.pk]['finished_duration'],
+            '2.00')
+
+    def test_list_compact_query_count(self):
+        def list_query_count() -> int:
+            with CaptureQueriesContext(connection) as queries:
+                resp = self.client.get('/task/chunk/?compact')
+            self.assertEqual(
+                resp.status_code,
+                status.HTTP_200_OK)
+            return len(queries)
+
+        TaskChunk.objects.create(
+            task=self.task,
+            duration=1,
+            day=date(2018, 1, 15))
+        query_count = list_query_count()
+
+        for i in range(10):
+            task = Task.objects.create(
+                user=self.user,
+                name='Testtask {}'.format(i),
+                duration=Decimal(2))
+            TaskChunk.objects.create(
+                task=task,
+                duration=1,
+                day=date(2018, 1, 15))
+            TaskChunk.objects.create(
+                task=task,
+                duration=1,
+                day=date(2018, 1, 16))
+        self.assertEqual(
+            list_query_count(),
+            query_count)
+
+    def test_list_task_durations(self):
+        """
+        Test that the durations of the tasks include the chunks of
+        other days.
+        """
+        def list_query_count() -> int:
+            with CaptureQueriesContext(connection) as queries:
+                resp = self.client.get('/task/chunk/?' + urlencode({
+                    'min_date': '2018-01-15',
+                    'strict_date': True,
+                }))
+            self.assertEqual(
+                resp.status_code,
+                status.HTTP_200_OK)
+            self.assertEqual(
+                len(resp.data),
+                1)
+            self.assertEqual(
+                Decimal(resp.data[0]['task']['scheduled_duration']),
+                self.task.chunks.aggregate(Sum('duration'))['duration__sum'])
+            self.assertEqual(
+                Decimal(resp.data[0]['task']['finished_duration']),
+                self.task.chunks.filter(finished=True).aggregate(Sum('duration'))['duration__sum'])
+            return len(queries)
+
+        TaskChunk.objects.create(
+            task=self.task,
+            duration=1,
+            day=date(2018, 1, 15))
+        TaskChunk.objects.create(
+            task=self.task,
+            duration=1,
+            day=date(2017, 12, 1),
+            finished=True)
+        query_count = list_query_count()
+
+        for i in range(10):
+            TaskChunk.objects.create(
+                task=self.task,
+                duration=Decimal('0.5'),
+                day=date(2017, 12, 2) + timedelta(days=i),
+                finished=True)
+        self.assertEqual(
+            list_query_count(),
+            query_count)
+
+    def test_task_chunk_nonstrict_date_filter(self):
+        """
+        Test that unfinished chunks from days prior to min_date are
+        included without strict date filtering.
+        """
+        TaskChunk.objects.create(
             task=self.task,
             duration=4,
             day=date(2018, 1, 15))
@@ -2718,75 +3806,75 @@ class TaskChunkSeriesTest(TestCase):
 
     def test_add_months(self):
         self.assertEqual(
-            TaskChunkSeries._add_months(
+            recurrence.add_months(
                 date(2010, 7, 15),
                 3),
             date(2010, 10, 15))
 
         self.assertEqual(
-            TaskChunkSeries._add_months(
+            recurrence.add_months(
                 date(2010, 7, 15),
                 12),
             date(2011, 7, 15))
 
         self.assertEqual(
-            TaskChunkSeries._add_months(
+            recurrence.add_months(
                 date(2010, 7, 15),
                 17),
             date(2011, 12, 15))
 
         self.assertEqual(
-            TaskChunkSeries._add_months(
+            recurrence.add_months(
                 date(2010, 1, 31),
                 1),
             date(2010, 2, 28))
 
         self.assertEqual(
-            TaskChunkSeries._add_months(
+            recurrence.add_months(
                 date(2012, 1, 31),
                 1),
             date(2012, 2, 29))
 
     def test_advance_to_weekday(self):
         self.assertEqual(
-            TaskChunkSeries._advance_to_weekday(
+            recurrence.advance_to_weekday(
                 date(2010, 7, 5),
                 3),
             date(2010, 7, 8))
 
         self.assertEqual(
-            TaskChunkSeries._advance_to_weekday(
+            recurrence.advance_to_weekday(
                 date(2010, 7, 8),
                 3),
             date(2010, 7, 8))
 
         self.assertEqual(
-            TaskChunkSeries._advance_to_weekday(
+            recurrence.advance_to_weekday(
                 date(2010, 7, 9),
                 3),
             date(2010, 7, 15))
 
     def test_replace_day(self):
         self.assertEqual(
-            TaskChunkSeries._replace_day(
+            recurrence.replace_day(
                 date(2010, 7, 15),
                 3),
             date(2010, 7, 3))
 
         self.assertEqual(
-            TaskChunkSeries._replace_day(
+            recurrence.replace_day(
                 date(2012, 2, 15),
                 31),
             date(2012, 2, 29))
 
         self.assertEqual(
-            TaskChunkSeries._replace_day(
+            recurrence.replace_day(
                 date(2012, 2, 15),
                 30),
             date(2012, 2, 29))
 
         self.assertEqual(
-            TaskChunkSeries._replace_day(
+            recurrence.replace_day(
                 date(2011, 2, 15),
                 30),
             date(2011, 2, 28))
@@ -3264,6 +4352,153 @@ class TaskChunkSeriesTest(TestCase):
             self.task.duration,
             initial_task_duration + series.duration * 50)
 
+    def test_schedule_day_orders(self):
+        """
+        Test that scheduled chunks are appended to the chunks that
+        already exist on their days.
+        """
+        TaskChunk.objects.create(
+            task=self.task,
+            day=date(2010, 3, 6),
+            day_order=1)
+        TaskChunk.objects.create(
+            task=self.task,
+            day=date(2010, 3, 6),
+            day_order=3)
+        TaskChunk.objects.create(
+            task=self.task,
+            day=date(2010, 3, 16),
+            day_order=7)
+
+        series = TaskChunkSeries.objects.create(
+            task=self.task,
+            start=date(2010, 2, 24),
+            rule='interval',
+            interval_days=10)
+        with freeze_time('2010-02-24'):
+            scheduled = series.schedule(max_count=4)
+
+        self.assertListEqual(
+            [(chunk.day, chunk.day_order) for chunk in scheduled],
+            [
+                (date(2010, 2, 24), 64),
+                (date(2010, 3, 6), 67),
+                (date(2010, 3, 16), 71),
+                (date(2010, 3, 26), 64),
+            ])
+
+    def test_schedule_query_count(self):
+        """
+        Test that the number of queries to schedule a series does not
+        depend on the number of scheduled chunks.
+        """
+        query_counts = []
+        for max_count in (2, 20):
+            series = TaskChunkSeries.objects.create(
+                task=self.task,
+                start=date(2010, 2, 24),
+                rule='interval',
+                interval_days=1)
+            with freeze_time('2010-02-24'), CaptureQueriesContext(connection) as queries:
+                scheduled = series.schedule(max_count=max_count)
+            self.assertEqual(
+                len(scheduled),
+                max_count)
+            query_counts.append(len(queries))
+
+        self.assertEqual(
+            query_counts[0],
+            query_counts[1])
+
+
+class RecurrenceTest(TestCase):
+    def test_between_interval(self):
+        rule = recurrence.Recurrence(
+            'interval',
+            start=date(2010, 2, 24),
+            interval_days=10)
+        self.assertListEqual(
+            list(rule.between(date(2010, 3, 10), date(2010, 4, 10))),
+            [
+                date(2010, 3, 16),
+                date(2010, 3, 26),
+                date(2010, 4, 5),
+            ])
+        self.assertListEqual(
+            list(rule.between(date(2010, 3, 16), date(2010, 3, 16))),
+            [
+                date(2010, 3, 16),
+            ])
+
+    def test_between_monthly_last(self):
+        rule = recurrence.Recurrence(
+            'monthly',
+            start=date(2010, 1, 31),
+            monthly_day=31,
+            monthly_months=1)
+        self.assertListEqual(
+            list(rule.between(date(2010, 2, 15), date(2010, 5, 31))),
+            [
+                date(2010, 2, 28),
+                date(2010, 3, 31),
+                date(2010, 4, 30),
+                date(2010, 5, 31),
+            ])
+
+    def test_between_monthlyweekday_monday(self):
+        rule = recurrence.Recurrence(
+            'monthlyweekday',
+            start=date(2010, 2, 1),
+            monthly_months=2,
+            monthlyweekday_weekday=0,
+            monthlyweekday_nth=5)
+        self.assertListEqual(
+            list(rule.between(date(2010, 3, 1), date(2010, 8, 31))),
+            [
+                date(2010, 4, 26),
+                date(2010, 6, 28),
+                date(2010, 8, 30),
+            ])
+
+    def test_between_matches_occurrences(self):
+        """
+        Test that skipping to a range of days yields the same
+        occurrences as generating all of them.
+        """
+        rules = (
+            recurrence.Recurrence(
+                'interval',
+                start=date(2010, 2, 24),
+                end=date(2013, 2, 24),
+                interval_days=9),
+            recurrence.Recurrence(
+                'monthly',
+                start=date(2010, 2, 28),
+                end=date(2013, 2, 24),
+                monthly_day=30,
+                monthly_months=5),
+            recurrence.Recurrence(
+                'monthlyweekday',
+                start=date(2010, 2, 12),
+                end=date(2013, 2, 24),
+                monthly_months=3,
+                monthlyweekday_weekday=6,
+                monthlyweekday_nth=2),
+        )
+        for rule in rules:
+            occurrences = list(rule.occurrences(date(2010, 3, 14)))
+            for min_day, max_day in (
+                    (date(2010, 1, 1), date(2010, 6, 1)),
+                    (date(2010, 7, 1), date(2011, 9, 3)),
+                    (date(2011, 2, 28), date(2014, 1, 1))):
+                self.assertListEqual(
+                    list(rule.between(min_day, max_day, date(2010, 3, 14))),
+                    [
+                        day
+                        for day in occurrences
+                        if min_day <= day <= max_day
+                    ])
+
 
 class TaskChunkSeriesSerializerTest(TestCase):
     def setUp(self):
@@ -3752,6 +4987,30 @@ class TaskChunkSeriesViewSetTest(AuthenticatedApiTest):
             self.assertIsNotNone(scheduled['id'])
             self.assertIsInstance(scheduled['id'], int)
 
+    @freeze_time('2010-05-03')
+    def test_create_query_count(self):
+        def create_query_count(chunk_count: int) -> int:
+            with CaptureQueriesContext(connection) as queries:
+                resp = self.client.post('/task/chunk/series/', {
+                    'task_id': self.task.pk,
+                    'duration': '1',
+                    'start': '2010-05-23',
+                    'end': str(date(2010, 5, 22) + timedelta(days=chunk_count)),
+                    'rule': 'interval',
+                    'interval_days': 1,
+                })
+            self.assertEqual(
+                resp.status_code,
+                status.HTTP_201_CREATED)
+            self.assertEqual(
+                len(resp.data['scheduled']),
+                chunk_count)
+            return len(queries)
+
+        self.assertEqual(
+            create_query_count(2),
+            create_query_count(20))
+
     @freeze_time('2010-05-03')
     def test_create(self):
         """
@@ -3815,6 +5074,70 @@ class TaskChunkSeriesViewSetTest(AuthenticatedApiTest):
             TaskChunk.objects.count(),
             32)
 
+    @freeze_time('2010-05-03')
+    def test_preview(self):
+        """
+        Test previewing a series, making sure that nothing is saved.
+        """
+        TaskChunk.objects.create(
+            task=self.task,
+            day=date(2010, 5, 24),
+            duration=Decimal(3))
+
+        resp = self.client.post('/task/chunk/series/preview/', {
+            'task_id': self.task.pk,
+            'duration': '2',
+            'start': '2010-05-23',
+            'end': '2010-05-25',
+            'rule': 'interval',
+            'interval_days': 1,
+        })
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_200_OK)
+        self.assertTrue(
+            resp.data['completely_scheduled'])
+        self.assertListEqual(
+            [
+                (
+                    row['day'],
+                    Decimal(row['duration']),
+                    Decimal(row['scheduled_duration']),
+                    Decimal(row['capacity']),
+                )
+                for row in resp.data['scheduled']
+            ],
+            [
+                ('2010-05-23', Decimal(2), Decimal(0), Decimal(5)),  # Sunday
+                ('2010-05-24', Decimal(2), Decimal(3), Decimal(10)),
+                ('2010-05-25', Decimal(2), Decimal(0), Decimal(10)),
+            ])
+
+        self.assertEqual(
+            TaskChunkSeries.objects.count(),
+            0)
+        self.assertEqual(
+            TaskChunk.objects.count(),
+            1)
+        self.task.refresh_from_db()
+        self.assertEqual(
+            self.task.duration,
+            Decimal(2))
+
+    @freeze_time('2010-05-03')
+    def test_preview_invalid(self):
+        resp = self.client.post('/task/chunk/series/preview/', {
+            'task_id': self.task.pk,
+            'start': '2010-05-23',
+            'rule': 'interval',
+        })
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_400_BAD_REQUEST)
+        self.assertSetEqual(
+            set(resp.data),
+            {'interval_days'})
+
     @freeze_time('2010-05-03')
     def test_create_scheduled_task_duration(self):
         """
@@ -4146,23 +5469,137 @@ class TaskChunkTest(TestCase):
             str(chunk),
             'johndoe: Testtask: 2018-12-24')
 
-    def test_split_chunk(self):
+    def test_user(self):
         """
-        Test splitting a task chunk.
+        Test that chunks get the user of their task, which is kept on
+        merges of their tasks.
         """
-        task = Task.objects.create(
+        task1 = Task.objects.create(
             name='Testtask',
             user=self.user1,
-            duration=5)
+            duration=Decimal(2))
+        task2 = Task.objects.create(
+            name='Other Testtask',
+            user=self.user1,
+            duration=Decimal(2))
 
         chunk = TaskChunk.objects.create(
-            task=task,
-            day=date(2018, 12, 24),
-            duration=3,
+            task_id=task1.pk,
+            day=self.weekdaydate1,
             day_order=1)
-
-        self.assertEqual(
-            TaskChunk.objects.count(),
+        series = TaskChunkSeries.objects.create(
+            task=task2,
+            start=date.today(),
+            rule='interval',
+            interval_days=1)
+        series.schedule(max_count=2)
+        self.assertEqual(
+            set(TaskChunk.objects.values_list('user_id', flat=True)),
+            {self.user1.pk})
+
+        task1.merge(task2)
+        chunk.refresh_from_db()
+        self.assertEqual(
+            chunk.user,
+            self.user1)
+        self.assertEqual(
+            list(self.user1.chunks.values_list('task_id', flat=True)),
+            [task1.pk, task1.pk, task1.pk])
+        self.assertFalse(
+            self.user2.chunks.exists())
+
+    def test_changes(self):
+        """
+        Test that splitting and deleting a chunk record their changes
+        with a single revision each.
+        """
+        task = Task.objects.create(
+            name='Testtask',
+            user=self.user1,
+            duration=Decimal(4))
+        chunk1 = TaskChunk.objects.create(
+            task=task,
+            day=self.weekdaydate1,
+            day_order=1,
+            duration=Decimal(2))
+        chunk2 = TaskChunk.objects.create(
+            task=task,
+            day=self.weekdaydate1,
+            day_order=2,
+            duration=Decimal(1))
+        self.user1.refresh_from_db()
+        revision = self.user1.revision
+
+        new_chunk = chunk1.split(Decimal(1))[0]
+        self.user1.refresh_from_db()
+        self.assertEqual(
+            self.user1.revision,
+            revision + 1)
+        self.assertSetEqual(
+            set(self.user1.changes.filter(revision=revision + 1).values_list('kind', 'object_id')),
+            # the following chunk is moved down as there is no gap
+            {('chunk', chunk1.pk), ('chunk', new_chunk.pk), ('chunk', chunk2.pk), ('task', task.pk)})
+
+        chunk2_id = chunk2.pk
+        chunk2.delete(postpone=False)
+        self.user1.refresh_from_db()
+        self.assertEqual(
+            self.user1.revision,
+            revision + 2)
+        self.assertSetEqual(
+            set(self.user1.changes.filter(revision=revision + 2).values_list('kind', 'object_id', 'deleted')),
+            {('chunk', chunk2_id, True), ('task', task.pk, False)})
+
+    def test_metrics(self):
+        """
+        Test that scheduling series and splitting chunks are measured.
+        """
+        task = Task.objects.create(
+            name='Testtask',
+            user=self.user1,
+            duration=Decimal(2))
+        series = TaskChunkSeries.objects.create(
+            task=task,
+            start=date.today(),
+            rule='interval',
+            interval_days=1)
+
+        scheduled_chunks = base_metrics._metrics['todoscheduler_series_scheduled_chunks']
+        split_shifted_chunks = base_metrics._metrics['todoscheduler_split_shifted_chunks']
+        base_metrics.reset()
+        series.schedule(max_count=3)
+        chunk = series.chunks.order_by('day').first()
+        TaskChunk.objects.filter(pk=chunk.pk).update(duration=Decimal(2), day_order=1)
+        TaskChunk.objects.create(
+            task=task,
+            day=chunk.day,
+            day_order=2)
+        TaskChunk.objects.get(pk=chunk.pk).split()
+
+        self.assertEqual(
+            (sum(scheduled_chunks.counts), scheduled_chunks.sum),
+            (1, 3))
+        self.assertEqual(
+            (sum(split_shifted_chunks.counts), split_shifted_chunks.sum),
+            (1, 1))
+
+    def test_split_chunk(self):
+        """
+        Test splitting a task chunk.
+        """
+        task = Task.objects.create(
+            name='Testtask',
+            user=self.user1,
+            duration=5)
+
+        chunk = TaskChunk.objects.create(
+            task=task,
+            day=date(2018, 12, 24),
+            duration=3,
+            day_order=1)
+
+        self.assertEqual(
+            TaskChunk.objects.count(),
             1)
 
         affected_chunks = chunk.split()
@@ -4185,7 +5622,7 @@ class TaskChunkTest(TestCase):
             Decimal(1))
         self.assertEqual(
             split_chunk.day_order,
-            2)
+            65)
         self.assertEqual(
             split_chunk.duration,
             Decimal(2))
@@ -4276,6 +5713,82 @@ class TaskChunkTest(TestCase):
             split_chunk.duration,
             Decimal(2))
 
+    def test_split_chunk_into_gap(self):
+        """
+        Test that splitting a task chunk uses the gap to the following
+        chunk without touching it.
+        """
+        task = Task.objects.create(
+            name='Testtask',
+            user=self.user1,
+            duration=5)
+        chunk = TaskChunk.objects.create(
+            task=task,
+            day=date(2018, 12, 24),
+            duration=3,
+            day_order=64)
+        chunk2 = TaskChunk.objects.create(
+            task=task,
+            day=date(2018, 12, 24),
+            duration=2,
+            day_order=128)
+
+        affected_chunks = chunk.split()
+        self.assertEqual(
+            len(affected_chunks),
+            2)
+        self.assertEqual(
+            affected_chunks[0].day_order,
+            96)
+
+        chunk2.refresh_from_db()
+        self.assertEqual(
+            chunk2.day_order,
+            128)
+
+    def test_split_chunk_query_count(self):
+        """
+        Test that the number of queries to split a chunk does not depend
+        on the number of later chunks on the same day.
+        """
+        task = Task.objects.create(
+            name='Testtask',
+            user=self.user1,
+            duration=100)
+
+        query_counts = []
+        for day, later_count in ((date(2018, 12, 24), 2), (date(2018, 12, 25), 20)):
+            chunk = TaskChunk.objects.create(
+                task=task,
+                day=day,
+                duration=3,
+                day_order=1)
+            for day_order in range(2, later_count + 2):
+                TaskChunk.objects.create(
+                    task=task,
+                    day=day,
+                    duration=1,
+                    day_order=day_order)
+
+            with CaptureQueriesContext(connection) as queries:
+                affected_chunks = chunk.split()
+            query_counts.append(len(queries))
+
+            self.assertEqual(
+                len(affected_chunks),
+                later_count + 2)
+            self.assertListEqual(
+                [chunk.day_order for chunk in affected_chunks],
+                [2, 1] + list(range(3, later_count + 3)))
+            self.assertListEqual(
+                list(TaskChunk.objects.filter(day=day).order_by(
+                    'day_order').values_list('day_order', flat=True)),
+                list(range(1, later_count + 3)))
+
+        self.assertEqual(
+            query_counts[0],
+            query_counts[1])
+
     @freeze_time('2017-11-16')
     def test_missed_task_chunks(self):
         self.assertListEqual(
@@ -4353,3 +5866,874 @@ class TaskChunkTest(TestCase):
         self.assertListEqual(
             list(TaskChunk.missed_chunks(self.user2)),
             [])
+
+
+class PlanningTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create(
+            username='johndoe',
+            workhours_weekday=Decimal(10),
+            workhours_weekend=Decimal(5),
+            default_schedule_duration=Decimal(1),
+            default_schedule_full_duration_max=Decimal(3),
+        )
+
+    @freeze_time('2001-02-05')
+    def test_plan_by_deadline(self):
+        task1 = Task.objects.create(
+            user=self.user,
+            name='Important Testtask',
+            priority=9,
+            duration=Decimal(15))
+        task2 = Task.objects.create(
+            user=self.user,
+            name='Testtask',
+            deadline=date(2001, 2, 6),
+            duration=Decimal(8))
+        task3 = Task.objects.create(
+            user=self.user,
+            name='Later Testtask',
+            start=date(2001, 2, 6),
+            deadline=date(2001, 2, 6),
+            duration=Decimal(4))
+
+        chunks, late_tasks = planning.plan_by_deadline(
+            self.user, Task.objects.all())
+        self.assertListEqual(
+            [
+                (chunk.task, chunk.day, chunk.day_order, chunk.duration)
+                for chunk in chunks
+            ],
+            [
+                (task2, date(2001, 2, 5), 64, Decimal(8)),
+                (task1, date(2001, 2, 5), 128, Decimal(2)),
+                (task3, date(2001, 2, 6), 64, Decimal(4)),
+                (task1, date(2001, 2, 6), 128, Decimal(6)),
+                (task1, date(2001, 2, 7), 64, Decimal(7)),
+            ])
+        self.assertListEqual(
+            late_tasks,
+            [])
+
+    @freeze_time('2001-02-05')
+    def test_plan_by_deadline_scheduled_days(self):
+        other_task = Task.objects.create(
+            user=self.user,
+            name='Scheduled Testtask',
+            duration=Decimal('9.5'))
+        TaskChunk.objects.create(
+            task=other_task,
+            day=date(2001, 2, 5),
+            day_order=3,
+            duration=Decimal('9.5'))
+        task = Task.objects.create(
+            user=self.user,
+            name='Testtask',
+            start=date(2001, 2, 3),
+            duration=Decimal(1))
+
+        chunks, late_tasks = planning.plan_by_deadline(
+            self.user, Task.objects.incompletely_scheduled())
+        self.assertListEqual(
+            [
+                (chunk.task, chunk.day, chunk.day_order, chunk.duration)
+                for chunk in chunks
+            ],
+            [
+                (task, date(2001, 2, 5), 67, Decimal('0.5')),
+                (task, date(2001, 2, 6), 64, Decimal('0.5')),
+            ])
+        self.assertListEqual(
+            late_tasks,
+            [])
+
+    @freeze_time('2001-02-05')
+    def test_plan_by_deadline_late(self):
+        task1 = Task.objects.create(
+            user=self.user,
+            name='Testtask',
+            deadline=date(2001, 2, 5),
+            duration=Decimal(12))
+        task2 = Task.objects.create(
+            user=self.user,
+            name='Long Testtask',
+            duration=Decimal(30))
+        task3 = Task.objects.create(
+            user=self.user,
+            name='Unreleased Testtask',
+            start=date(2001, 2, 10),
+            duration=Decimal(1))
+
+        chunks, late_tasks = planning.plan_by_deadline(
+            self.user, Task.objects.all(), horizon=3)
+        self.assertEqual(
+            sum(chunk.duration for chunk in chunks),
+            Decimal(30))
+        self.assertListEqual(
+            late_tasks,
+            [task1, task2, task3])
+
+    def test_chunk_durations(self):
+        self.assertListEqual(
+            planning.chunk_durations(self.user, Decimal(3)),
+            [Decimal(3)])
+        self.assertListEqual(
+            planning.chunk_durations(self.user, Decimal('4.5')),
+            [Decimal(1), Decimal(1), Decimal('2.5')])
+        self.assertListEqual(
+            planning.chunk_durations(self.user, Decimal(0)),
+            [])
+
+
+class DayLoadTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create(
+            username='johndoe',
+            workhours_weekday=Decimal(10),
+            workhours_weekend=Decimal(5),
+        )
+        self.task = Task.objects.create(
+            user=self.user,
+            name='Testtask',
+            duration=Decimal(20))
+
+    def assertLoads(self, expected):
+        self.assertSetEqual(
+            set(DayLoad.objects.filter(user=self.user).values_list(
+                'day', 'scheduled_duration', 'finished_duration', 'chunk_count',
+                'max_day_order')),
+            set(expected))
+
+    def test_chunk_changes(self):
+        """
+        Test that creating, updating, moving and deleting chunks keeps
+        the loads of their days up to date.
+        """
+        chunk1 = TaskChunk.objects.create(
+            task=self.task,
+            day=date(2010, 2, 24),
+            duration=Decimal(2))
+        chunk2 = TaskChunk.objects.create(
+            task=self.task,
+            day=date(2010, 2, 24),
+            duration=Decimal(3))
+        self.assertLoads({
+            (date(2010, 2, 24), Decimal(5), Decimal(0), 2, 128),
+        })
+
+        chunk1.finished = True
+        chunk1.save(update_fields=('finished',))
+        self.assertLoads({
+            (date(2010, 2, 24), Decimal(5), Decimal(2), 2, 128),
+        })
+
+        chunk2.day = date(2010, 2, 25)
+        chunk2.save()
+        self.assertLoads({
+            (date(2010, 2, 24), Decimal(2), Decimal(2), 1, 64),
+            (date(2010, 2, 25), Decimal(3), Decimal(0), 1, 128),
+        })
+
+        chunk2.split(Decimal(1))
+        self.assertLoads({
+            (date(2010, 2, 24), Decimal(2), Decimal(2), 1, 64),
+            (date(2010, 2, 25), Decimal(3), Decimal(0), 2, 192),
+        })
+
+        chunk1.delete()
+        self.assertLoads({
+            (date(2010, 2, 25), Decimal(3), Decimal(0), 2, 192),
+        })
+
+        self.task.delete()
+        self.assertLoads(set())
+
+    def test_series_changes(self):
+        """
+        Test that scheduling and cleaning series keeps the loads of
+        their days up to date.
+        """
+        series = TaskChunkSeries.objects.create(
+            task=self.task,
+            start=date(2010, 2, 24),
+            duration=Decimal(2),
+            rule='interval',
+            interval_days=1)
+        with freeze_time('2010-02-24'):
+            series.schedule(max_count=3)
+        self.assertLoads({
+            (date(2010, 2, 24), Decimal(2), Decimal(0), 1, 64),
+            (date(2010, 2, 25), Decimal(2), Decimal(0), 1, 64),
+            (date(2010, 2, 26), Decimal(2), Decimal(0), 1, 64),
+        })
+
+        series.end = date(2010, 2, 25)
+        series.save()
+        series.clean_scheduled()
+        self.assertLoads({
+            (date(2010, 2, 24), Decimal(2), Decimal(0), 1, 64),
+            (date(2010, 2, 25), Decimal(2), Decimal(0), 1, 64),
+        })
+
+    @freeze_time('2010-02-26')
+    def test_next_day_with_capacity(self):
+        """
+        Test that the next day with capacity skips booked days and
+        days whose capacity is too low.
+        """
+        TaskChunk.objects.create(
+            task=self.task,
+            day=date(2010, 2, 26),  # Friday
+            duration=Decimal(5))
+        TaskChunk.objects.create(
+            task=self.task,
+            day=date(2010, 3, 1),  # Monday
+            duration=Decimal(4))
+        TaskChunk.objects.create(
+            task=self.task,
+            day=date(2010, 3, 2),
+            duration=Decimal(5))
+
+        self.assertEqual(
+            TaskChunk.next_day_with_capacity(self.user, Decimal(5)),
+            date(2010, 2, 26))
+        self.assertEqual(
+            TaskChunk.next_day_with_capacity(self.user, Decimal(6)),
+            date(2010, 3, 1))
+        self.assertEqual(
+            TaskChunk.next_day_with_capacity(self.user, Decimal(7)),
+            date(2010, 3, 3))
+        self.assertIsNone(
+            TaskChunk.next_day_with_capacity(self.user, Decimal(11)))
+
+
+class DayLoadConcurrencyTest(TransactionTestCase):
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_concurrent_chunks(self):
+        """
+        Test that the load of a day includes the chunks of a concurrent
+        transaction which writes chunks of the same day.
+        """
+        user = get_user_model().objects.create(
+            username='johndoe')
+        task = Task.objects.create(
+            user=user,
+            name='Testtask',
+            duration=Decimal(20))
+        first_saved = threading.Event()
+        commit_first = threading.Event()
+        errors = []
+
+        def create_chunk(day_order: int, saved: threading.Event = None, commit: threading.Event = None):
+            try:
+                with transaction.atomic():
+                    TaskChunk.objects.create(
+                        task=task,
+                        day=date(2010, 2, 24),
+                        day_order=day_order,
+                        duration=Decimal(1))
+                    if saved:
+                        saved.set()
+                        commit.wait(5)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        first = threading.Thread(target=create_chunk, args=(1, first_saved, commit_first))
+        first.start()
+        first_saved.wait(5)
+        second = threading.Thread(target=create_chunk, args=(2,))
+        second.start()
+        # the second transaction waits for the first one
+        second.join(0.5)
+        commit_first.set()
+        first.join()
+        second.join()
+
+        self.assertListEqual(
+            errors,
+            [])
+        self.assertListEqual(
+            list(DayLoad.objects.filter(user=user).values_list(
+                'day', 'scheduled_duration', 'chunk_count', 'max_day_order')),
+            [
+                (date(2010, 2, 24), Decimal(2), 2, 2),
+            ])
+
+
+class DayLoadViewSetTest(AuthenticatedApiTest):
+    def test_list_day_loads(self):
+        task = Task.objects.create(
+            user=self.user,
+            name='Testtask',
+            duration=Decimal(20))
+        TaskChunk.objects.create(
+            task=task,
+            day=date(2010, 2, 26),
+            duration=Decimal(2),
+            finished=True)
+        TaskChunk.objects.create(
+            task=task,
+            day=date(2010, 2, 26),
+            duration=Decimal(3))
+        TaskChunk.objects.create(
+            task=task,
+            day=date(2010, 2, 27),
+            duration=Decimal(1))
+        TaskChunk.objects.create(
+            task=task,
+            day=date(2010, 2, 28),
+            duration=Decimal(1))
+
+        resp = self.client.get('/task/day/?{}'.format(urlencode({
+            'min_date': '2010-02-26',
+            'max_date': '2010-02-27',
+        })))
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_200_OK)
+        self.assertListEqual(
+            [
+                (
+                    row['day'],
+                    Decimal(row['scheduled_duration']),
+                    Decimal(row['finished_duration']),
+                    row['chunk_count'],
+                    Decimal(row['capacity']),
+                )
+                for row in resp.data
+            ],
+            [
+                ('2010-02-26', Decimal(5), Decimal(2), 2, Decimal(10)),  # Friday
+                ('2010-02-27', Decimal(1), Decimal(0), 1, Decimal(5)),
+            ])
+
+    def test_no_listing_of_foreign_day_loads(self):
+        other_user = get_user_model().objects.create(
+            username='foobar')
+        task = Task.objects.create(
+            user=other_user,
+            name='Testtask',
+            duration=Decimal(20))
+        TaskChunk.objects.create(
+            task=task,
+            day=date(2010, 2, 26))
+
+        resp = self.client.get('/task/day/')
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_200_OK)
+        self.assertListEqual(
+            resp.data,
+            [])
+
+
+class ExportViewTest(AuthenticatedApiTest):
+    def get_records(self) -> List[dict]:
+        resp = self.client.get('/task/export/')
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_200_OK)
+        self.assertEqual(
+            resp['Content-Type'],
+            'application/x-ndjson')
+        return [
+            json.loads(line)
+            for line in b''.join(resp.streaming_content).decode().splitlines()
+        ]
+
+    def test_export(self):
+        label = Label.objects.create(
+            user=self.user,
+            title='Label',
+            color='ff0000')
+        task = Task.objects.create(
+            user=self.user,
+            name='Testtask',
+            duration=Decimal(5))
+        task.labels.add(label)
+        series = TaskChunkSeries.objects.create(
+            task=task,
+            start=date(2010, 2, 24),
+            duration=Decimal(1),
+            rule='interval',
+            interval_days=7)
+        chunk1 = TaskChunk.objects.create(
+            task=task,
+            series=series,
+            day=date(2010, 2, 24),
+            duration=Decimal(1),
+            finished=True)
+        chunk2 = TaskChunk.objects.create(
+            task=task,
+            day=date(2010, 2, 26),
+            duration=Decimal(2))
+
+        foreign_task = Task.objects.create(
+            user=get_user_model().objects.create(username='foobar'),
+            name='Foreign Testtask',
+            duration=Decimal(5))
+        TaskChunk.objects.create(
+            task=foreign_task,
+            day=date(2010, 2, 26),
+            duration=Decimal(2))
+
+        records = self.get_records()
+        self.assertListEqual(
+            [(record['type'], record['data']['id']) for record in records],
+            [
+                ('label', label.pk),
+                ('task', task.pk),
+                ('series', series.pk),
+                ('chunk', chunk1.pk),
+                ('chunk', chunk2.pk),
+            ])
+        self.assertEqual(
+            records[1]['data']['labels'],
+            [label.pk])
+        self.assertEqual(
+            records[1]['data']['scheduled_duration'],
+            '3.00')
+        self.assertEqual(
+            records[1]['data']['finished_duration'],
+            '1.00')
+        self.assertEqual(
+            records[2]['data']['task_id'],
+            task.pk)
+        self.assertEqual(
+            records[3]['data']['series'],
+            series.pk)
+        self.assertEqual(
+            records[3]['data']['task_id'],
+            task.pk)
+
+    def test_export_query_count(self):
+        def export_query_count() -> int:
+            with CaptureQueriesContext(connection) as queries:
+                self.get_records()
+            return len(queries)
+
+        label = Label.objects.create(
+            user=self.user,
+            title='Label',
+            color='ff0000')
+        query_count = None
+        for i in range(5):
+            task = Task.objects.create(
+                user=self.user,
+                name='Testtask {}'.format(i),
+                duration=Decimal(5))
+            task.labels.add(label)
+            TaskChunk.objects.create(
+                task=task,
+                day=date(2010, 2, 24),
+                duration=Decimal(1))
+
+            if query_count is None:
+                query_count = export_query_count()
+        self.assertEqual(
+            export_query_count(),
+            query_count)
+
+    def test_export_batches(self):
+        tasks = [
+            Task.objects.create(
+                user=self.user,
+                name='Testtask {}'.format(i),
+                duration=Decimal(5))
+            for i in range(5)
+        ]
+
+        records = list(transfer.export_records(self.user, chunk_size=2))
+        self.assertListEqual(
+            [record['data']['id'] for record in records],
+            [task.pk for task in tasks])
+
+
+class ImportViewTest(AuthenticatedApiTest):
+    def setUp(self):
+        super().setUp()
+
+        self.other_user = get_user_model().objects.create(
+            username='foobar')
+        self.label = Label.objects.create(
+            user=self.other_user,
+            title='Label',
+            color='ff0000')
+        self.task = Task.objects.create(
+            user=self.other_user,
+            name='Testtask',
+            duration=Decimal(5),
+            start=date(2010, 2, 20))
+        self.task.labels.add(self.label)
+        self.series = TaskChunkSeries.objects.create(
+            task=self.task,
+            start=date(2010, 2, 24),
+            duration=Decimal(1),
+            rule='interval',
+            interval_days=7)
+        TaskChunk.objects.create(
+            task=self.task,
+            series=self.series,
+            day=date(2010, 2, 24),
+            day_order=5,
+            duration=Decimal(1),
+            finished=True)
+        TaskChunk.objects.create(
+            task=self.task,
+            day=date(2010, 2, 24),
+            day_order=2,
+            duration=Decimal(2))
+
+    def post_import(self, content: str, name: str = 'schedule.ndjson'):
+        return self.client.post('/task/import/', {
+            'file': SimpleUploadedFile(name, content.encode()),
+        }, format='multipart')
+
+    @freeze_time('2010-02-25')
+    def test_import_export(self):
+        existing_label = Label.objects.create(
+            user=self.user,
+            title='Label',
+            color='00ff00')
+        existing_task = Task.objects.create(
+            user=self.user,
+            name='Existing Testtask',
+            duration=Decimal(1))
+        TaskChunk.objects.create(
+            task=existing_task,
+            day=date(2010, 2, 24),
+            day_order=1,
+            duration=Decimal(1))
+
+        resp = self.post_import(''.join(transfer.export_lines(self.other_user)))
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_201_CREATED)
+        self.assertDictEqual(
+            resp.data,
+            {
+                'label': 1,
+                'task': 1,
+                'series': 1,
+                'chunk': 2,
+            })
+
+        self.assertEqual(
+            self.user.labels.count(),
+            1)
+        task = self.user.tasks.get(name='Testtask')
+        self.assertNotEqual(
+            task.pk,
+            self.task.pk)
+        self.assertEqual(
+            task.start,
+            date(2010, 2, 20))
+        self.assertListEqual(
+            list(task.labels.all()),
+            [existing_label])
+        series = TaskChunkSeries.objects.get(task=task)
+        self.assertEqual(
+            series.last_scheduled_day,
+            date(2010, 2, 24))
+        self.assertListEqual(
+            [
+                (chunk.task_id, chunk.series_id, chunk.day_order, chunk.duration)
+                for chunk in TaskChunk.objects.filter(
+                    task__user=self.user).order_by('day_order')
+            ],
+            [
+                (existing_task.pk, None, 1, Decimal(1)),
+                (task.pk, None, 65, Decimal(2)),
+                (task.pk, series.pk, 129, Decimal(1)),
+            ])
+        self.assertEqual(
+            DayLoad.objects.get(user=self.user, day=date(2010, 2, 24)).scheduled_duration,
+            Decimal(4))
+
+    def test_import_csv(self):
+        resp = self.post_import(
+            'type,id,title,color,name,duration,labels,task_id,day\n'
+            'label,1,First,ff0000,,,,,\n'
+            'label,2,Second,00ff00,,,,,\n'
+            'task,1,,,Testtask,2,1 2,,\n'
+            'chunk,,,,,3,,1,2010-02-24\n',
+            name='schedule.csv')
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_201_CREATED)
+
+        task = self.user.tasks.get()
+        self.assertSetEqual(
+            {label.title for label in task.labels.all()},
+            {'First', 'Second'})
+        # the duration of the task is increased to the duration of its chunks
+        self.assertEqual(
+            task.duration,
+            Decimal(3))
+        self.assertEqual(
+            task.chunks.get().day,
+            date(2010, 2, 24))
+
+    @freeze_time('2010-03-01')
+    def test_import_past_series(self):
+        """
+        Test that series which started in the past are only scheduled
+        from today on if no chunks are imported for them.
+        """
+        resp = self.post_import(
+            'type,id,name,duration,task_id,start,rule,interval_days\n'
+            'task,1,Testtask,2,,,,\n'
+            'series,,,1,1,2010-02-01,interval,7\n',
+            name='schedule.csv')
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_201_CREATED)
+
+        series = TaskChunkSeries.objects.get(task__user=self.user)
+        self.assertEqual(
+            series.last_scheduled_day,
+            date(2010, 2, 22))
+        self.assertListEqual(
+            [chunk.day for chunk in series.schedule(max_count=2)],
+            [date(2010, 3, 1), date(2010, 3, 8)])
+
+    def test_import_invalid(self):
+        resp = self.post_import(
+            '{"type": "task", "data": {"id": 1, "name": "Testtask", "duration": "2"}}\n'
+            '{"type": "chunk", "data": {"task_id": 2, "day": "2010-02-24", "duration": "1"}}\n')
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_400_BAD_REQUEST)
+        self.assertSetEqual(
+            set(resp.data),
+            {'line 2'})
+        self.assertFalse(self.user.tasks.exists())
+
+        resp = self.post_import(
+            '{"type": "task", "data": {"id": 1, "duration": "2"}}\n')
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_400_BAD_REQUEST)
+        self.assertSetEqual(
+            set(resp.data['line 1']),
+            {'name'})
+
+        resp = self.post_import('{"type": "unknown", "data": {}}\n')
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_400_BAD_REQUEST)
+
+        resp = self.post_import('not json\n')
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_400_BAD_REQUEST)
+
+
+class ChangesViewTest(AuthenticatedApiTest):
+    def setUp(self):
+        super().setUp()
+
+        self.label = Label.objects.create(
+            user=self.user,
+            title='Label',
+            color='ff0000')
+        self.task = Task.objects.create(
+            user=self.user,
+            name='Testtask',
+            duration=Decimal(5))
+        self.task.labels.add(self.label)
+        self.chunk1 = TaskChunk.objects.create(
+            task=self.task,
+            day=date(2010, 2, 24),
+            day_order=1,
+            duration=Decimal(1))
+        self.chunk2 = TaskChunk.objects.create(
+            task=self.task,
+            day=date(2010, 2, 24),
+            day_order=2,
+            duration=Decimal(2))
+
+        other_user = get_user_model().objects.create(
+            username='foobar')
+        Task.objects.create(
+            user=other_user,
+            name='Other task',
+            duration=Decimal(1))
+
+    def get_changes(self, since: int):
+        resp = self.client.get('/task/changes/?since={}'.format(since))
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_200_OK)
+        return resp.data
+
+    def test_changes(self):
+        data = self.get_changes(0)
+        self.user.refresh_from_db()
+        self.assertEqual(
+            data['revision'],
+            self.user.revision)
+        self.assertEqual(
+            [label['id'] for label in data['label']],
+            [self.label.pk])
+        self.assertEqual(
+            [task['id'] for task in data['task']],
+            [self.task.pk])
+        self.assertEqual(
+            data['task'][0]['scheduled_duration'],
+            '3.00')
+        self.assertEqual(
+            data['task'][0]['labels'],
+            [self.label.pk])
+        self.assertEqual(
+            [chunk['id'] for chunk in data['chunk']],
+            [self.chunk1.pk, self.chunk2.pk])
+        self.assertEqual(
+            data['deleted'],
+            {
+                'label': [],
+                'task': [],
+                'series': [],
+                'chunk': [],
+            })
+
+        # nothing changed since the current revision
+        data = self.get_changes(self.user.revision)
+        self.assertEqual(
+            [data['label'], data['task'], data['series'], data['chunk']],
+            [[], [], [], []])
+
+    def test_changed_labels(self):
+        """
+        Test that the labels of a task are written with the revision of
+        its change.
+        """
+        since = self.get_changes(0)['revision']
+
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.post('/task/task/', {
+                'name': 'Labeled task',
+                'duration': '1',
+                'labels': [self.label.pk],
+            })
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_201_CREATED)
+        sqls = [query['sql'] for query in queries]
+        label_insert = next(
+            index for index, sql in enumerate(sqls) if sql.startswith('INSERT INTO "task_task_labels"'))
+        revision_update = next(
+            index for index, sql in enumerate(sqls) if sql.startswith('UPDATE "base_user"'))
+        self.assertLess(
+            label_insert,
+            revision_update)
+        data = self.get_changes(since)
+        self.assertEqual(
+            [(task['id'], task['labels']) for task in data['task']],
+            [(resp.data['id'], [self.label.pk])])
+
+        since = data['revision']
+        resp = self.client.patch('/task/task/{}/'.format(self.task.pk), {
+            'labels': [],
+        })
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_200_OK)
+        data = self.get_changes(since)
+        self.assertEqual(
+            [(task['id'], task['labels']) for task in data['task']],
+            [(self.task.pk, [])])
+        self.assertEqual(
+            data['revision'],
+            since + 1)
+
+    def test_changes_since(self):
+        since = self.get_changes(0)['revision']
+
+        self.chunk2.duration = Decimal(3)
+        self.chunk2.save()
+        data = self.get_changes(since)
+        self.assertEqual(
+            [chunk['id'] for chunk in data['chunk']],
+            [self.chunk2.pk])
+        self.assertEqual(
+            data['chunk'][0]['duration'],
+            '3.00')
+        self.assertEqual(
+            [task['id'] for task in data['task']],
+            [self.task.pk])
+        self.assertEqual(
+            data['label'],
+            [])
+
+    def test_deleted_chunk(self):
+        since = self.get_changes(0)['revision']
+
+        chunk_id = self.chunk1.pk
+        self.chunk1.delete()
+        data = self.get_changes(since)
+        self.assertEqual(
+            data['chunk'],
+            [])
+        self.assertEqual(
+            data['deleted']['chunk'],
+            [chunk_id])
+        self.assertEqual(
+            [task['id'] for task in data['task']],
+            [self.task.pk])
+
+        # a tombstone replaces the previous change
+        self.assertFalse(
+            self.user.changes.filter(
+                kind='chunk', object_id=chunk_id, deleted=False).exists())
+
+    def test_deleted_task(self):
+        since = self.get_changes(0)['revision']
+
+        task_id = self.task.pk
+        self.task.delete()
+        data = self.get_changes(since)
+        self.assertEqual(
+            [data['task'], data['chunk']],
+            [[], []])
+        self.assertEqual(
+            data['deleted']['task'],
+            [task_id])
+        self.assertEqual(
+            data['deleted']['chunk'],
+            [self.chunk1.pk, self.chunk2.pk])
+
+    def test_merged_task(self):
+        other_task = Task.objects.create(
+            user=self.user,
+            name='Other task',
+            duration=Decimal(2))
+        since = self.get_changes(0)['revision']
+
+        task_id = self.task.pk
+        other_task.merge(self.task)
+        data = self.get_changes(since)
+        self.assertEqual(
+            [chunk['task_id'] for chunk in data['chunk']],
+            [other_task.pk, other_task.pk])
+        self.assertEqual(
+            [task['id'] for task in data['task']],
+            [other_task.pk])
+        self.assertEqual(
+            data['deleted']['task'],
+            [task_id])
+
+    def test_invalid_since(self):
+        resp = self.client.get('/task/changes/?since=-1')
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_400_BAD_REQUEST)
+
+    def test_unauthenticated(self):
+        self.client.credentials()
+        resp = self.client.get('/task/changes/?since=0')
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_401_UNAUTHORIZED)
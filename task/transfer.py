@@ -0,0 +1,360 @@
+"""
+Export and import of the complete schedule of a user as
+newline-delimited JSON.
+
+Every line is a record of the form {"type": ..., "data": ...}, where
+data uses the representation of the serializer of that type. Labels
+precede tasks, which precede series and chunks, so that every record
+only references records of previous lines.
+"""
+import csv
+import json
+from collections import deque
+from datetime import date, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from django.db import connection
+from django.db.models import Case, DateField, F, Max, QuerySet, Value, When
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import Serializer
+from rest_framework.utils.encoders import JSONEncoder
+
+from base.models import Change
+from label.models import Label
+from label.serializers import LabelSerializer
+from .models import DayLoad, Task, TaskChunk, TaskChunkSeries
+from .serializers import LabelImportSerializer, TaskChunkCompactSerializer, TaskChunkImportSerializer, \
+    TaskChunkSeriesImportSerializer, TaskChunkSeriesSerializer, TaskImportSerializer, TaskSerializer
+
+EXPORT_CHUNK_SIZE = 1000
+IMPORT_BATCH_SIZE = 1000
+
+IMPORT_SERIALIZERS = {
+    'label': LabelImportSerializer,
+    'task': TaskImportSerializer,
+    'series': TaskChunkSeriesImportSerializer,
+    'chunk': TaskChunkImportSerializer,
+}
+
+
+def export_records(user, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[dict]:
+    """
+    Lazily generate the records of all objects of the user.
+
+    The objects are fetched in portions of chunk_size, so the memory
+    usage does not depend on the number of objects.
+    """
+    yield from _records(
+        'label', LabelSerializer(),
+        Label.objects.filter(user=user).order_by('pk'), chunk_size)
+    yield from _task_records(user, chunk_size)
+    yield from _records(
+        'series', TaskChunkSeriesSerializer(),
+        TaskChunkSeries.objects.filter(task__user=user).order_by('pk'), chunk_size)
+    yield from _records(
+        'chunk', TaskChunkCompactSerializer(),
+        TaskChunk.objects.filter(user=user).order_by('pk'), chunk_size)
+
+
+def export_lines(user, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Lazily generate the lines of the export of all objects of the user.
+    """
+    encoder = JSONEncoder()
+    for record in export_records(user, chunk_size):
+        yield encoder.encode(record) + '\n'
+
+
+def _records(
+        record_type: str, serializer: Serializer, queryset: QuerySet,
+        chunk_size: int) -> Iterator[dict]:
+    for instance in queryset.iterator(chunk_size=chunk_size):
+        yield {
+            'type': record_type,
+            'data': serializer.to_representation(instance),
+        }
+
+
+def _task_records(user, chunk_size: int) -> Iterator[dict]:
+    """
+    Generate the records of the tasks in batches ordered by their keys,
+    as iterator() does not prefetch the labels.
+    """
+    serializer = TaskSerializer()
+    tasks = Task.objects.filter(user=user).order_by('pk') \
+        .prefetch_related('labels') \
+        .annotate_scheduled_duration() \
+        .annotate_finished_duration()
+
+    last_pk = None
+    while True:
+        batch = tasks
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        batch = list(batch[:chunk_size])
+        if not batch:
+            return
+
+        for task in batch:
+            yield {
+                'type': 'task',
+                'data': serializer.to_representation(task),
+            }
+        last_pk = batch[-1].pk
+
+
+def read_ndjson(lines: Iterable[str]) -> Iterator[dict]:
+    """
+    Parse the records of newline-delimited JSON.
+    """
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            raise ValidationError({
+                'line {}'.format(number): 'invalid JSON'
+            })
+
+
+def read_csv(lines: Iterable[str]) -> Iterator[dict]:
+    """
+    Parse the records of CSV with a header. The type column contains
+    the type of the record, all other non-empty columns its data.
+    Multiple labels of a task are separated by spaces.
+    """
+    for row in csv.DictReader(lines):
+        data = {
+            field: value
+            for field, value in row.items()
+            if field != 'type' and value not in ('', None)
+        }
+        if 'labels' in data:
+            data['labels'] = data['labels'].split()
+        yield {
+            'type': row.get('type'),
+            'data': data,
+        }
+
+
+@Change.collect()
+def import_records(
+        user, records: Iterable[dict],
+        batch_size: int = IMPORT_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Import the records into the schedule of the user.
+
+    The records are validated and inserted in batches of consecutive
+    records of the same type. The ids of the records are only used to
+    resolve the references between them, all objects get new ids.
+    The chunks are placed after the existing chunks of their days.
+
+    Returns the number of imported objects of each type.
+    """
+    schedule_import = _ScheduleImport(user)
+    batch = []  # type: List[Tuple[int, dict]]
+    batch_type = None
+    for line, record in enumerate(records, start=1):
+        if not isinstance(record, dict) or record.get('type') not in IMPORT_SERIALIZERS or \
+                not isinstance(record.get('data'), dict):
+            raise ValidationError({
+                'line {}'.format(line): 'invalid record'
+            })
+
+        if batch and (record['type'] != batch_type or len(batch) >= batch_size):
+            schedule_import.import_batch(batch_type, batch)
+            batch = []
+        batch_type = record['type']
+        batch.append((line, record['data']))
+    if batch:
+        schedule_import.import_batch(batch_type, batch)
+
+    schedule_import.finish()
+    return schedule_import.counts
+
+
+class _ScheduleImport:
+    def __init__(self, user):
+        self.user = user
+        self.counts = {
+            record_type: 0
+            for record_type in IMPORT_SERIALIZERS
+        }
+        # the new ids of the imported objects by their ids in the import
+        self.ids = {
+            record_type: {}
+            for record_type in ('label', 'task', 'series')
+        }  # type: Dict[str, Dict[int, int]]
+        self.day_orders = {}  # type: Dict[date, int]
+        self.days = set()  # type: Set[date]
+        self.task_ids = set()  # type: Set[int]
+        self.series_ids = []  # type: List[int]
+        self.chunk_ids = []  # type: List[int]
+
+    def import_batch(self, record_type: str, batch: List[Tuple[int, dict]]):
+        serializer = IMPORT_SERIALIZERS[record_type](
+            data=[data for _, data in batch], many=True)
+        if not serializer.is_valid():
+            for (line, _), errors in zip(batch, serializer.errors):
+                if errors:
+                    raise ValidationError({
+                        'line {}'.format(line): errors
+                    })
+
+        rows = [
+            (line, self._import_id(line, data), validated_data)
+            for (line, data), validated_data in zip(batch, serializer.validated_data)
+        ]
+        getattr(self, '_import_' + record_type)(rows)
+        self.counts[record_type] += len(rows)
+
+    def finish(self):
+        series_ids = self.series_ids
+        last_scheduled_days = dict(TaskChunk.objects.filter(
+            series_id__in=series_ids
+        ).order_by().values('series').annotate(
+            last_day=Max('day')
+        ).values_list('series', 'last_day'))
+        # the occurrences of series which started in the past are
+        # considered scheduled until today, so scheduling does not create
+        # chunks on past days
+        yesterday = date.today() - timedelta(days=1)
+        for series in TaskChunkSeries.objects.filter(pk__in=series_ids, start__lte=yesterday):
+            past_occurrences = deque(series.recurrence.between(
+                None, yesterday, last_scheduled_days.get(series.pk)), maxlen=1)
+            if past_occurrences:
+                last_scheduled_days[series.pk] = past_occurrences[0]
+        TaskChunkSeries.objects.filter(pk__in=series_ids).update(last_scheduled_day=Case(
+            *(When(pk=pk, then=Value(day)) for pk, day in last_scheduled_days.items()),
+            default=None, output_field=DateField()))
+
+        # the imported chunks of a task may exceed its duration
+        for task in Task.objects.filter(pk__in=self.task_ids) \
+                .annotate_scheduled_duration() \
+                .filter(scheduled_duration_agg__gt=F('duration')):
+            Task.objects.filter(pk=task.pk).update(duration=task.scheduled_duration)
+
+        DayLoad.refresh(self.user.pk, self.days)
+        Change.record(
+            self.user.pk,
+            label=self.ids['label'].values(),
+            task=self.ids['task'].values(),
+            series=series_ids,
+            chunk=self.chunk_ids)
+
+    def _import_label(self, rows: List[Tuple[int, Optional[int], dict]]):
+        titles = self._existing_labels(row[2]['title'] for row in rows)
+        new_labels = {}  # type: Dict[str, Label]
+        for _, _, validated_data in rows:
+            title = validated_data['title']
+            if title not in titles and title not in new_labels:
+                new_labels[title] = Label(user=self.user, **validated_data)
+        self._create(Label, list(new_labels.values()))
+        for title, label in new_labels.items():
+            titles[title] = label.pk
+
+        for _, import_id, validated_data in rows:
+            if import_id is not None:
+                self.ids['label'][import_id] = titles[validated_data['title']]
+
+    def _import_task(self, rows: List[Tuple[int, Optional[int], dict]]):
+        tasks = []
+        task_labels = []
+        for line, _, validated_data in rows:
+            task_labels.append([
+                self._resolve('label', label_id, line, 'labels')
+                for label_id in validated_data.pop('labels', [])
+            ])
+            tasks.append(Task(user=self.user, **validated_data))
+        self._create(Task, tasks)
+
+        Task.labels.through.objects.bulk_create([
+            Task.labels.through(task_id=task.pk, label_id=label_id)
+            for task, label_ids in zip(tasks, task_labels)
+            for label_id in set(label_ids)
+        ])
+        for (_, import_id, _), task in zip(rows, tasks):
+            if import_id is not None:
+                self.ids['task'][import_id] = task.pk
+
+    def _import_series(self, rows: List[Tuple[int, Optional[int], dict]]):
+        series = []
+        for line, _, validated_data in rows:
+            validated_data['task_id'] = self._resolve(
+                'task', validated_data['task_id'], line, 'task_id')
+            series.append(TaskChunkSeries(**validated_data))
+        self._create(TaskChunkSeries, series)
+        self.series_ids.extend(instance.pk for instance in series)
+
+        for (_, import_id, _), instance in zip(rows, series):
+            if import_id is not None:
+                self.ids['series'][import_id] = instance.pk
+
+    def _import_chunk(self, rows: List[Tuple[int, Optional[int], dict]]):
+        days = {row[2]['day'] for row in rows}
+        self.day_orders.update(TaskChunk.get_next_day_orders(
+            self.user, days - set(self.day_orders)))
+
+        chunks = []
+        # keep the order of the imported chunks within their days
+        for line, _, validated_data in sorted(rows, key=lambda row: (
+                row[2]['day'], row[2].get('day_order', 0), row[0])):
+            validated_data['task_id'] = self._resolve(
+                'task', validated_data['task_id'], line, 'task_id')
+            if validated_data.get('series') is not None:
+                validated_data['series_id'] = self._resolve(
+                    'series', validated_data['series'], line, 'series')
+            validated_data.pop('series', None)
+
+            day = validated_data['day']
+            validated_data['day_order'] = self.day_orders[day]
+            self.day_orders[day] = TaskChunk.following_day_order(self.day_orders[day])
+            chunks.append(TaskChunk(user=self.user, **validated_data))
+            self.task_ids.add(validated_data['task_id'])
+        TaskChunk.objects.bulk_create(chunks)
+        self.chunk_ids.extend(chunk.pk for chunk in chunks)
+        self.days.update(days)
+
+    def _existing_labels(self, titles: Iterable[str]) -> Dict[str, int]:
+        return dict(self.user.labels.filter(
+            title__in=set(titles)).values_list('title', 'pk'))
+
+    @staticmethod
+    def _import_id(line: int, data: dict) -> Optional[int]:
+        import_id = data.get('id')
+        if import_id is None:
+            return None
+        try:
+            return int(import_id)
+        except (TypeError, ValueError):
+            raise ValidationError({
+                'line {}'.format(line): {
+                    'id': 'A valid integer is required.'
+                }
+            })
+
+    def _resolve(self, record_type: str, import_id: int, line: int, field: str) -> int:
+        """
+        Get the new id of an object referenced by its id in the import.
+        """
+        try:
+            return self.ids[record_type][import_id]
+        except KeyError:
+            raise ValidationError({
+                'line {}'.format(line): {
+                    field: '{} {} is not imported before'.format(record_type, import_id)
+                }
+            })
+
+    @staticmethod
+    def _create(model, objects: List):
+        """
+        Insert the objects and set their ids, which requires single
+        inserts if the database cannot return the ids of bulk inserts.
+        """
+        if connection.features.can_return_ids_from_bulk_insert:
+            model.objects.bulk_create(objects)
+        else:
+            for instance in objects:
+                instance.save()
@@ -1,3 +1,4 @@
+from django.urls import path
 from rest_framework.routers import SimpleRouter
 
 from . import views
@@ -15,4 +16,12 @@ router.register(
     'chunk',
     views.TaskChunkViewSet,
     base_name='taskchunk')
-urlpatterns = router.urls
+router.register(
+    'day',
+    views.DayLoadViewSet,
+    base_name='dayload')
+urlpatterns = router.urls + [
+    path('export/', views.ExportView.as_view()),
+    path('import/', views.ImportView.as_view()),
+    path('changes/', views.ChangesView.as_view()),
+]
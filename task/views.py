@@ -1,19 +1,34 @@
-from django.db import transaction
-from django.db.models import F
+import codecs
+from typing import List
+
+from django.db.models import F, Prefetch
+from django.http import StreamingHttpResponse
 from rest_framework import mixins, serializers, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.exceptions import ParseError, ValidationError
 from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from .filters import TaskChunkFilterBackend, TaskFilterBackend
-from .models import TaskChunk, TaskChunkSeries
-from .serializers import TaskSerializer, TaskChunkSerializer, TaskChunkSeriesSerializer
+from base.etag import revision_etag
+from base.models import Change
+from base.views import SerializationTimingMixin
+from label.serializers import LabelSerializer
+from .batch import apply_chunk_operations
+from .cache import revision_cached
+from .filters import DayLoadFilterBackend, TaskChunkFilterBackend, TaskFilterBackend
+from .models import DayLoad, Task, TaskChunk, TaskChunkSeries
+from .pagination import TaskChunkPagination, TaskPagination
+from .planning import plan_by_deadline, plan_greedily, save_plan
+from .serializers import DayLoadSerializer, TaskSerializer, TaskChunkCompactSerializer, \
+    TaskChunkOperationSerializer, TaskChunkSerializer, TaskChunkSeriesPreviewSerializer, TaskChunkSeriesSerializer
+from .transfer import export_lines, import_records, read_csv, read_ndjson
 
 
-class TaskViewSet(viewsets.ModelViewSet):
+class TaskViewSet(SerializationTimingMixin, viewsets.ModelViewSet):
     filter_backends = TaskFilterBackend,
+    pagination_class = TaskPagination
     permission_classes = (IsAuthenticated,)
     serializer_class = TaskSerializer
 
@@ -22,7 +37,53 @@ class TaskViewSet(viewsets.ModelViewSet):
             .prefetch_related('labels') \
             .annotate_scheduled_duration() \
             .annotate_finished_duration()
-        return queryset.order_by(F('start').asc(nulls_first=True), 'name')
+        return queryset.order_by(F('start').asc(nulls_first=True), 'name', 'id')
+
+    @revision_etag
+    @revision_cached
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @revision_cached
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @action(['POST'], detail=False)
+    @Change.collect()
+    def plan(self, request):
+        """
+        Schedule the unscheduled duration of several tasks (all
+        incompletely scheduled tasks by default) at once.
+
+        The greedy strategy plans the tasks by priority, the deadline
+        strategy by their deadlines.
+        """
+        class ParameterSerializer(serializers.Serializer):
+            task_ids = serializers.ListField(
+                required=False, child=serializers.IntegerField())
+            strategy = serializers.ChoiceField(
+                choices=('greedy', 'deadline'), default='greedy')
+        params = ParameterSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+
+        tasks = request.user.tasks.incompletely_scheduled()
+        task_ids = params.validated_data.get('task_ids')
+        if task_ids:
+            tasks = tasks.filter(pk__in=task_ids)
+
+        if params.validated_data['strategy'] == 'deadline':
+            chunks, _ = plan_by_deadline(request.user, tasks)
+        else:
+            chunks = plan_greedily(request.user, tasks)
+        save_plan(request.user, chunks)
+
+        # serialize the chunks with the updated durations of their tasks
+        tasks = self.get_queryset().in_bulk({chunk.task_id for chunk in chunks})
+        for chunk in chunks:
+            chunk.task = tasks[chunk.task_id]
+
+        serializer = self.timed(TaskChunkSerializer(chunks, many=True))
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @action(['POST'], detail=True, url_path=r'merge/(?P<other_pk>\d+)')
     def merge(self, request, pk: int, other_pk: int):
@@ -32,13 +93,13 @@ class TaskViewSet(viewsets.ModelViewSet):
         instance = self.get_object()
         other_instance = get_object_or_404(self.get_queryset(), pk=other_pk)
 
-        serializer = TaskChunkSerializer(
-            instance.merge(other_instance), many=True)
+        serializer = self.timed(TaskChunkSerializer(
+            instance.merge(other_instance), many=True))
         return Response(serializer.data)
 
 
-class TaskChunkSeriesViewSet(viewsets.GenericViewSet, mixins.ListModelMixin,
-                             mixins.RetrieveModelMixin):
+class TaskChunkSeriesViewSet(SerializationTimingMixin, viewsets.GenericViewSet,
+                             mixins.ListModelMixin, mixins.RetrieveModelMixin):
     permission_classes = IsAuthenticated,
     serializer_class = TaskChunkSeriesSerializer
 
@@ -46,16 +107,17 @@ class TaskChunkSeriesViewSet(viewsets.GenericViewSet, mixins.ListModelMixin,
         return TaskChunkSeries.objects.filter(task__user=self.request.user) \
             .select_related('task')
 
-    @transaction.atomic
+    @Change.collect()
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         instance = serializer.save()
 
         scheduled = instance.schedule()
-        scheduled_serializer = TaskChunkSerializer(scheduled, many=True)
+        task = self._annotated_task(instance, scheduled)
+        scheduled_serializer = self.timed(TaskChunkSerializer(scheduled, many=True))
 
-        task_serializer = TaskSerializer(instance.task)
+        task_serializer = self.timed(TaskSerializer(task))
 
         return Response({
             'series': serializer.data,
@@ -63,7 +125,36 @@ class TaskChunkSeriesViewSet(viewsets.GenericViewSet, mixins.ListModelMixin,
             'task': task_serializer.data,
         }, status=status.HTTP_201_CREATED)
 
-    @transaction.atomic
+    @action(['POST'], detail=False)
+    def preview(self, request):
+        """
+        Preview the chunks a new series would schedule, without
+        saving anything.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        series = TaskChunkSeries(**serializer.validated_data)
+
+        days, next_due_day = series.upcoming_days(
+            TaskChunkSeries.DEFAULT_MAX_COUNT, TaskChunkSeries.DEFAULT_MAX_ADVANCE)
+        scheduled_durations = TaskChunk.get_scheduled_durations(request.user, days)
+
+        preview_serializer = self.timed(TaskChunkSeriesPreviewSerializer([
+            {
+                'day': day,
+                'duration': series.duration,
+                'scheduled_duration': scheduled_durations.get(day, 0),
+                'capacity': request.user.capacity_of_day(day),
+            }
+            for day in days
+        ], many=True))
+
+        return Response({
+            'scheduled': preview_serializer.data,
+            'completely_scheduled': next_due_day is None,
+        })
+
+    @Change.collect()
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
         serializer = self.get_serializer(instance, data=request.data)
@@ -73,9 +164,10 @@ class TaskChunkSeriesViewSet(viewsets.GenericViewSet, mixins.ListModelMixin,
         cleaned = instance.clean_scheduled()
 
         scheduled = instance.schedule()
-        scheduled_serializer = TaskChunkSerializer(scheduled, many=True)
+        task = self._annotated_task(instance, scheduled)
+        scheduled_serializer = self.timed(TaskChunkSerializer(scheduled, many=True))
 
-        task_serializer = TaskSerializer(instance.task)
+        task_serializer = self.timed(TaskSerializer(task))
 
         return Response({
             'series': serializer.data,
@@ -84,25 +176,77 @@ class TaskChunkSeriesViewSet(viewsets.GenericViewSet, mixins.ListModelMixin,
             'task': task_serializer.data,
         })
 
+    @staticmethod
+    def _annotated_task(instance: TaskChunkSeries, chunks: List[TaskChunk]) -> Task:
+        """
+        Get the task of a series with its durations and labels, and
+        attach it to the chunks of the series, so they are serialized
+        without any queries per chunk.
+        """
+        task = Task.objects.filter(pk=instance.task_id) \
+            .prefetch_related('labels') \
+            .annotate_scheduled_duration() \
+            .annotate_finished_duration() \
+            .get()
+        for chunk in chunks:
+            chunk.task = task
+        return task
+
 
-class TaskChunkViewSet(viewsets.GenericViewSet, mixins.CreateModelMixin,
-                       mixins.ListModelMixin, mixins.RetrieveModelMixin,
-                       mixins.UpdateModelMixin):
+class TaskChunkViewSet(SerializationTimingMixin, viewsets.GenericViewSet,
+                       mixins.CreateModelMixin, mixins.ListModelMixin,
+                       mixins.RetrieveModelMixin, mixins.UpdateModelMixin):
     filter_backends = TaskChunkFilterBackend,
+    pagination_class = TaskChunkPagination
     permission_classes = (IsAuthenticated,)
     serializer_class = TaskChunkSerializer
 
     def get_queryset(self):
+        tasks = Task.objects.prefetch_related('labels') \
+            .annotate_scheduled_duration() \
+            .annotate_finished_duration()
         return TaskChunk.objects.filter(
-            task__user=self.request.user
+            user=self.request.user
         ).select_related(
-            'task',
             'series',
             'series__task'
         ).prefetch_related(
-            'task__chunks', 'task__labels'
+            Prefetch('task', queryset=tasks)
         )
 
+    @revision_etag
+    def list(self, request):
+        """
+        List the task chunks.
+
+        In compact mode, the chunks reference their tasks by id and the
+        tasks are included only once in a separate map.
+        """
+        if 'compact' not in request.query_params:
+            return super().list(request)
+
+        chunks = self.filter_queryset(TaskChunk.objects.filter(
+            user=request.user))
+        page = self.paginate_queryset(chunks)
+        if page is not None:
+            chunks = page
+        tasks = request.user.tasks.filter(
+            pk__in={chunk.task_id for chunk in chunks}
+        ).prefetch_related('labels') \
+            .annotate_scheduled_duration() \
+            .annotate_finished_duration()
+
+        data = {
+            'chunks': self.timed(TaskChunkCompactSerializer(chunks, many=True)).data,
+            'tasks': {
+                task['id']: task
+                for task in self.timed(TaskSerializer(tasks, many=True)).data
+            },
+        }
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
     def destroy(self, request, pk=None):
         class ParameterSerializer(serializers.Serializer):
             postpone = serializers.BooleanField(default=True)
@@ -113,6 +257,34 @@ class TaskChunkViewSet(viewsets.GenericViewSet, mixins.CreateModelMixin,
         instance.delete(postpone=params.validated_data['postpone'])
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(['POST'], detail=False)
+    def batch(self, request):
+        """
+        Apply several operations (create, update, finish, move and
+        delete) on task chunks at once.
+        """
+        class ParameterSerializer(serializers.Serializer):
+            operations = TaskChunkOperationSerializer(many=True)
+        params = ParameterSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+
+        chunks, deleted = apply_chunk_operations(
+            request.user, params.validated_data['operations'])
+
+        # serialize the chunks with the updated durations of their tasks
+        tasks = Task.objects.filter(pk__in={chunk.task_id for chunk in chunks}) \
+            .prefetch_related('labels') \
+            .annotate_scheduled_duration() \
+            .annotate_finished_duration() \
+            .in_bulk()
+        for chunk in chunks:
+            chunk.task = tasks[chunk.task_id]
+
+        return Response({
+            'chunks': self.timed(TaskChunkSerializer(chunks, many=True)).data,
+            'deleted': deleted,
+        })
+
     @action(['POST'], detail=True)
     def split(self, request, pk=None):
         """
@@ -139,3 +311,115 @@ class TaskChunkViewSet(viewsets.GenericViewSet, mixins.CreateModelMixin,
         serializer = self.get_serializer(
             instance.split(duration), many=True)
         return Response(serializer.data)
+
+
+class DayLoadViewSet(SerializationTimingMixin, viewsets.GenericViewSet, mixins.ListModelMixin):
+    filter_backends = DayLoadFilterBackend,
+    permission_classes = (IsAuthenticated,)
+    serializer_class = DayLoadSerializer
+
+    def get_queryset(self):
+        return DayLoad.objects.filter(
+            user=self.request.user
+        ).select_related('user').order_by('day')
+
+
+class ExportView(APIView):
+    """
+    Export all labels, tasks, series and chunks of the user as
+    newline-delimited JSON.
+    """
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request):
+        response = StreamingHttpResponse(
+            export_lines(request.user), content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename="todoscheduler.ndjson"'
+        return response
+
+
+class ImportView(APIView):
+    """
+    Import labels, tasks, series and chunks from an uploaded file in the
+    format of the export, or from a CSV file with a type column.
+    """
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request):
+        class ParameterSerializer(serializers.Serializer):
+            file = serializers.FileField()
+            format = serializers.ChoiceField(
+                choices=('ndjson', 'csv'), required=False)
+        params = ParameterSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+
+        upload = params.validated_data['file']
+        file_format = params.validated_data.get('format')
+        if not file_format:
+            file_format = 'csv' if upload.name.endswith('.csv') else 'ndjson'
+
+        lines = codecs.iterdecode(upload, 'utf-8')
+        if file_format == 'csv':
+            records = read_csv(lines)
+        else:
+            records = read_ndjson(lines)
+        try:
+            counts = import_records(request.user, records)
+        except UnicodeDecodeError:
+            raise ValidationError({
+                'file': 'the file is not UTF-8 encoded'
+            })
+        return Response(counts, status=status.HTTP_201_CREATED)
+
+
+class ChangesView(SerializationTimingMixin, APIView):
+    """
+    List the labels, tasks, series and chunks which changed since a
+    revision of the user, and the ids of those which were deleted.
+    """
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request):
+        class ParameterSerializer(serializers.Serializer):
+            since = serializers.IntegerField(min_value=0)
+        params = ParameterSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+
+        revision = request.user.revision
+        changes = request.user.changes.filter(
+            revision__gt=params.validated_data['since'],
+            revision__lte=revision,
+        ).values_list('kind', 'object_id', 'deleted')
+        changed = {kind: set() for kind in Change.KINDS}
+        deleted = {kind: set() for kind in Change.KINDS}
+        for kind, object_id, is_deleted in changes:
+            (deleted if is_deleted else changed)[kind].add(object_id)
+
+        querysets = {
+            'label': (request.user.labels.all(), LabelSerializer),
+            'task': (
+                request.user.tasks.prefetch_related('labels')
+                .annotate_scheduled_duration()
+                .annotate_finished_duration(),
+                TaskSerializer),
+            'series': (
+                TaskChunkSeries.objects.filter(task__user=request.user),
+                TaskChunkSeriesSerializer),
+            'chunk': (
+                TaskChunk.objects.filter(user=request.user),
+                TaskChunkCompactSerializer),
+        }
+        data = {
+            'revision': revision,
+        }
+        for kind, (queryset, serializer_class) in querysets.items():
+            instances = list(queryset.filter(pk__in=changed[kind]).order_by('pk'))
+            # changed objects which no longer exist were deleted later on
+            deleted[kind] |= changed[kind] - {instance.pk for instance in instances}
+            data[kind] = self.timed(serializer_class(
+                instances, many=True, context={'request': request})).data
+        data['deleted'] = {
+            kind: sorted(ids)
+            for kind, ids in deleted.items()
+        }
+        return Response(data)
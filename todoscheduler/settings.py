@@ -0,0 +1,13 @@
+from .settings_base import *  # NOQA: F401, F403
+
+DEBUG = True
+ALLOWED_HOSTS = []
+SECRET_KEY = 'test'
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': '/tmp/todoscheduler.sqlite3',
+    }
+}
+LANGUAGE_CODE = 'en-us'
+TIME_ZONE = 'Europe/Berlin'
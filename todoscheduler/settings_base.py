@@ -34,6 +34,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'base.middleware.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -44,6 +45,21 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Measure the queries and times of every request, which are added as
+# Server-Timing header and logged to the todoscheduler.timing logger.
+REQUEST_TIMING = False
+
+# The directory in which every process stores its metrics, which is
+# required to expose the metrics of all workers of multi-process servers.
+METRICS_DIR = None
+# The bearer token which allows to get the metrics from /base/metrics/
+# (besides staff users).
+METRICS_TOKEN = None
+# The addresses which may get the metrics without a token. Behind a
+# reverse proxy, every request comes from the address of the proxy, so
+# only use this if the metrics are scraped from the server directly.
+METRICS_ALLOWED_IPS = ()
+
 ROOT_URLCONF = 'todoscheduler.urls'
 
 TEMPLATES = [
@@ -70,6 +86,25 @@ WSGI_APPLICATION = 'todoscheduler.wsgi.application'
 # https://docs.djangoproject.com/en/1.11/ref/settings/#databases
 
 
+# Cache
+# https://docs.djangoproject.com/en/2.1/ref/settings/#caches
+# The serialized tasks are cached in the tasks cache, which can be
+# pointed to a shared backend (e.g. Redis) in the local settings.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'tasks': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tasks',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
 